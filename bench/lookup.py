@@ -0,0 +1,71 @@
+#
+# Copyright (C) 2024-2026 George Zhang
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Symbol lookup benchmark for fexproto.py
+#
+#   python bench/lookup.py [N]
+#
+# Runs a loop made of standard names (eq?, +, car, cons, ...) inside
+# environments nested at increasing depths below the standard environment and
+# reports the time per iteration. With lookup caches the time should stay flat
+# as the depth grows. Caches are invalidated per name, so only defining a new
+# name that a site looks up (in an environment it searched) slows it down.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(sys.path[0])
+import fexproto as fx
+
+LOOP = r'''
+($define! loop ($lambda (n acc)
+    ($if (eq? 0 n)
+        (car acc)
+        (loop (+ n -1) (cons (+ (car acc) (cdr acc)) (cdr acc))))))
+'''
+
+def _parse1(text):
+    return fx.parse(fx.tokenize(text), filename="\x00bench")[0]
+
+def nested_loop(std, depth, n):
+    env = std
+    for _ in range(depth):
+        env = fx.Environment({}, env)
+    fx.f_eval(env, _parse1(LOOP))
+    expr = _parse1("(loop %d (cons 0 1))" % n)
+    fx.f_eval(env, _parse1("(loop 10 (cons 0 1))"))  # warm up
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        value = fx.f_eval(env, expr)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert value == n, value
+    return best
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 5000
+    std = fx._make_standard_environment()
+    print("loop of %d iterations by environment depth:" % n)
+    for depth in (0, 4, 16, 64, 256):
+        elapsed = nested_loop(std, depth, n)
+        print("  depth %3d: %.3fs, %.2f us per iteration" % (depth, elapsed, elapsed / n * 1e6))
+
+if __name__ == "__main__":
+    main(sys.argv)
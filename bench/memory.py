@@ -0,0 +1,157 @@
+#
+# Copyright (C) 2024-2026 George Zhang
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Memory and allocation benchmarks for the core object model of fexproto.py
+#
+#   python bench/memory.py [N]
+#
+# Reports the size of each core object, the interpreter objects allocated by an
+# applicative call, the bytes kept alive per frame of a non-tail recursion, and
+# the step rate of a speed_test.lisp style tail loop. The last two are repeated
+# for each kind of call frame storage (dicts and LocalMap lists).
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(sys.path[0])
+import fexproto as fx
+
+SUMTO = r'''
+($define! sumto ($lambda (n acc)
+    ($if (eq? 0 n)
+        acc
+        (sumto (+ n -1) (+ acc n)))))
+'''
+
+DEEP = r'''
+($define! deep ($lambda (n)
+    ($if (eq? 0 n)
+        0
+        (+ 1 (deep (+ n -1))))))
+'''
+
+def _sizeof(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def _run(env, expr):
+    # Same loop as f_eval but counting steps
+    steps = 0
+    continuation = fx.Continuation(env, fx._step_eval, fx.Continuation.ROOT)
+    value = expr
+    while continuation is not fx.Continuation.ROOT:
+        continuation, value = fx.step_evaluate(continuation, value)
+        steps += 1
+        if continuation is fx.Continuation.ERROR:
+            raise ValueError(value)
+    return value, steps
+
+def _parse1(text):
+    return fx.parse(fx.tokenize(text), filename="\x00bench")[0]
+
+def object_sizes():
+    env = fx.Environment({}, fx.Environment.ROOT)
+    pair_types = [getattr(fx, name) for name in ("MutablePair", "ImmutablePair") if hasattr(fx, name)] or [fx.Pair]
+    sizes = [
+        ("Environment", _sizeof(env)),
+        ("Continuation", _sizeof(fx.Continuation(env, fx._step_eval, fx.Continuation.ROOT))),
+        ("Combiner", _sizeof(fx.Combiner(1, fx._step_eval))),
+        ("Operative", _sizeof(fx.Operative(env, "e", "a", ()))),
+        ("Character", _sizeof(fx.Character(65))),
+    ]
+    for pair_type in pair_types:
+        sizes.append((pair_type.__name__, _sizeof(pair_type((), ()))))
+    # A call frame binding the dynamic environment and the arguments
+    frames = [("frame (dict)", fx.Environment({}, env))]
+    if hasattr(fx, "MapEnvironment"):
+        frames.append(("frame (map)", fx.MapEnvironment(env)))
+    for name, frame in frames:
+        fx._define(frame, "env", env)
+        fx._define(frame, "args", ())
+        storage = frame.bindings if frame.bindings is not None else frame.storage
+        sizes.append((name, _sizeof(frame) + sys.getsizeof(storage)))
+    return sizes
+
+def call_allocations(env, text):
+    # Count interpreter objects created (by their __init__ calls) per class
+    expr = _parse1(text)
+    counts = {}
+    def profile(frame, event, arg):
+        if event == "call" and frame.f_code.co_name == "__init__":
+            name = type(frame.f_locals["self"]).__name__
+            counts[name] = counts.get(name, 0) + 1
+    sys.setprofile(profile)
+    try:
+        _run(env, expr)
+    finally:
+        sys.setprofile(None)
+    return sorted(counts.items())
+
+def deep_recursion(env, n):
+    expr = _parse1("(deep %d)" % n)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    value, steps = _run(env, expr)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert value == n, value
+    return (peak - before) / n, steps
+
+def tail_loop(env, n):
+    expr = _parse1("(sumto %d 0)" % n)
+    _run(env, _parse1("(sumto 10 0)"))  # warm up
+    start = time.perf_counter()
+    value, steps = _run(env, expr)
+    elapsed = time.perf_counter() - start
+    assert value == n * (n + 1) // 2, value
+    return steps, elapsed
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 2000
+    env = fx._make_standard_environment()
+    for text in (SUMTO, DEEP):
+        fx.f_eval(env, _parse1(text))
+
+    print("object sizes (bytes, including instance dict):")
+    for name, size in object_sizes():
+        print("  %-14s %4d" % (name, size))
+
+    for text in ("(list)", "(list 1 2 3 4 5 6 7 8)"):
+        counts = call_allocations(env, text)
+        print("objects allocated by %s: %d" % (text, sum(count for _, count in counts)))
+        for name, count in counts:
+            print("  %-26s %4d" % (name, count))
+
+    storages = ["dict", "map"] if hasattr(fx, "set_environment_storage") else ["dict"]
+    for storage in storages:
+        if len(storages) > 1:
+            fx.set_environment_storage(storage)
+            print("call frames stored in %s:" % storage)
+
+        per_frame, steps = deep_recursion(env, n)
+        print("non-tail recursion (deep %d): %d steps, %.0f bytes peak per level" % (n, steps, per_frame))
+
+        steps, elapsed = tail_loop(env, n * 10)
+        print("tail loop (sumto %d 0): %d steps in %.3fs, %.0f steps/s" % (n * 10, steps, elapsed, steps / elapsed))
+
+if __name__ == "__main__":
+    main(sys.argv)
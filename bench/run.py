@@ -0,0 +1,262 @@
+#
+# Copyright (C) 2024-2026 George Zhang
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Benchmark suite for fexproto.py and (untranslated) rfexproto.py
+#
+#   python bench/run.py [-i fexproto|rfexproto] [-w WORKLOAD] [--reps N]
+#                       [--warmup N] [--scale X] [-o results.json]
+#                       [--baseline baseline.json] [--threshold X]
+#
+# Each workload loads its definitions from bench/workloads/ into a fresh
+# environment, runs its expression --warmup times, then times it --reps times.
+# Evaluation workloads count trampoline steps, and parse and write workloads
+# count characters of written data. Results are printed as a table
+# and optionally saved as JSON. With --baseline, the median time of each
+# workload is compared against an earlier JSON file, and the exit status is 1
+# if any of them got slower by more than --threshold (a fraction).
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+WORKLOADS_DIR = os.path.join(ROOT, "bench", "workloads")
+sys.path.insert(0, ROOT)
+
+# == Workloads
+
+class Workload:
+    def __init__(self, name, kind, setup, expr, n, interpreters=("fexproto", "rfexproto")):
+        self.name = name
+        self.kind = kind  # "eval", "parse", or "write"
+        self.setup = setup  # file in bench/workloads
+        self.expr = expr  # expression template taking n
+        self.n = n
+        self.interpreters = interpreters
+
+WORKLOADS = [
+    Workload("tail-loop", "eval", "tail_loop.lisp", "(sumto {n} 0)", 5000),
+    Workload("fib", "eval", "fib.lisp", "(fib {n})", 15),
+    Workload("append", "eval", "append.lisp", "(append-test {n})", 1000),
+    Workload("deep-eval", "eval", "deep_eval.lisp", "($deep {n})", 300),
+    Workload("call-cc", "eval", "call_cc.lisp", "(escape-loop {n} 20 0)", 200),
+    Workload("guard", "eval", "guard.lisp", "(guard-loop {n} 0)", 200, ("fexproto",)),
+    Workload("guard-deep", "eval", "guard.lisp", "(guard-deep-loop {n} 500 0)", 10, ("fexproto",)),
+    Workload("dynamic", "eval", "dynamic.lisp", "(dynamic-test {n})", 2000, ("fexproto",)),
+    Workload("dynamic-deep", "eval", "dynamic.lisp", "(dynamic-deep {n})", 500, ("fexproto",)),
+    Workload("static", "eval", "static.lisp", "(access-loop {n} 0)", 2000, ("fexproto",)),
+    # Parse workloads parse the written form of the expression's value
+    Workload("parse-large", "parse", "data.lisp", "(tree 8 {n})", 4),
+    Workload("parse-cyclic", "parse", "data.lisp", "(cycles {n} 50)", 40),
+    Workload("write-large", "write", "data.lisp", "(tree 8 {n})", 4),
+    Workload("write-cyclic", "write", "data.lisp", "(cycles {n} 50)", 40),
+    Workload("write-strings", "write", "data.lisp", "(strings {n})", 2000),
+    Workload("equal-long", "eval", "equal.lisp", "(equal-loop {n} long-a long-b)", 10),
+    Workload("equal-wide", "eval", "equal.lisp", "(equal-loop {n} wide-a wide-b)", 10),
+    Workload("equal-shared", "eval", "equal.lisp", "(equal-loop {n} shared-a shared-b)", 10),
+    Workload("equal-cyclic", "eval", "equal.lisp", "(equal-loop {n} ring-a ring-b)", 10),
+]
+
+def _read_workload(name):
+    with open(os.path.join(WORKLOADS_DIR, name), "rb") as file:
+        return file.read()
+
+# == Interpreters
+
+class Fexproto:
+    name = "fexproto"
+    def __init__(self):
+        import fexproto
+        self.fx = fexproto
+    def make_env(self, setup):
+        env = self.fx._make_standard_environment()
+        for expr in self.parse_all(setup):
+            self.fx.f_eval(env, expr)
+        return env
+    def parse_all(self, text):
+        return self.fx.parse(self.fx.tokenize(text.decode("utf-8")), filename="\x00bench")
+    def run(self, env, expr):
+        # Same loop as f_eval but counting steps
+        fx = self.fx
+        steps = 0
+        continuation = fx.Continuation(env, fx._step_eval, fx.Continuation.ROOT)
+        value = expr
+        while continuation is not fx.Continuation.ROOT:
+            continuation, value = fx.step_evaluate(continuation, value)
+            steps += 1
+            if continuation is fx.Continuation.ERROR:
+                raise RuntimeError("workload failed")
+        return value, steps
+    def write(self, value):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.fx._f_write(value)
+        return out.getvalue().encode("utf-8")
+
+class Rfexproto:
+    name = "rfexproto"
+    def __init__(self):
+        import rfexproto
+        self.rf = rfexproto
+    def make_env(self, setup):
+        rf = self.rf
+        env = rf.Environment({}, rf.Environment(rf._DEFAULT_ENV, None))
+        for expr in self.parse_all(setup):
+            self.run(env, expr)
+        return env
+    def parse_all(self, text):
+        # Same as main (offsets are needed to parse dotted pairs)
+        offsets = []
+        tokens = self.rf.tokenize(text, offsets=offsets)
+        tokens.reverse()
+        offsets.reverse()
+        exprs = []
+        while tokens:
+            exprs.append(self.rf.parse(tokens, offsets=offsets, upcons={}))
+        return exprs
+    def run(self, env, expr):
+        # Same loop as fully_evaluate but counting steps
+        rf = self.rf
+        steps = 0
+        state = rf._f_toplevel_eval(env, expr)
+        try:
+            while True:
+                state = rf.step_evaluate(state)
+                steps += 1
+        except rf.EvaluationDone as e:
+            return e.value, steps
+        except rf.EvaluationError:
+            raise RuntimeError("workload failed")
+    def write(self, value):
+        out = io.BytesIO()
+        self.rf._f_write(out, value)
+        return out.getvalue()
+
+INTERPRETERS = {"fexproto": Fexproto, "rfexproto": Rfexproto}
+
+# == Harness
+
+def run_workload(interpreter, workload, reps, warmup, scale):
+    n = max(1, int(workload.n * scale)) if workload.kind == "eval" else workload.n
+    env = interpreter.make_env(_read_workload(workload.setup))
+    [expr] = interpreter.parse_all(workload.expr.format(n=n).encode("utf-8"))
+    if workload.kind == "eval":
+        def once():
+            return interpreter.run(env, expr)[1]
+    else:
+        value, _ = interpreter.run(env, expr)
+        text = interpreter.write(value)
+        if workload.kind == "parse":
+            def once():
+                interpreter.parse_all(text)
+                return len(text)
+        else:
+            def once():
+                return len(interpreter.write(value))
+    for _ in range(warmup):
+        once()
+    times = []
+    for _ in range(reps):
+        start = time.perf_counter()
+        steps = once()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "workload": workload.name,
+        "interpreter": interpreter.name,
+        "kind": workload.kind,
+        "n": n,
+        "steps": steps,
+        "times": times,
+        "best": min(times),
+        "median": median,
+        "steps_per_sec": steps / median if median > 0 else None,
+    }
+
+def compare(results, baseline, threshold):
+    old = {(r["workload"], r["interpreter"]): r for r in baseline["results"]}
+    regressions = []
+    print()
+    print("%-14s %-10s %10s %10s %8s" % ("workload", "interp", "baseline", "current", "change"))
+    for result in results:
+        key = (result["workload"], result["interpreter"])
+        if key not in old:
+            continue
+        if old[key]["n"] != result["n"]:
+            print("%-14s %-10s   (different n, skipped)" % key)
+            continue
+        change = result["median"] / old[key]["median"] - 1
+        mark = ""
+        if change > threshold:
+            mark = "  REGRESSION"
+            regressions.append(key)
+        print("%-14s %-10s %9.4fs %9.4fs %+7.1f%%%s" % (key + (old[key]["median"], result["median"], change * 100, mark)))
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run the fexproto benchmark suite.")
+    parser.add_argument("-i", "--interpreter", action="append", choices=sorted(INTERPRETERS), help="interpreter to run (default: all)")
+    parser.add_argument("-w", "--workload", action="append", choices=[w.name for w in WORKLOADS], help="workload to run (default: all)")
+    parser.add_argument("--reps", type=int, default=5, help="timed repetitions per workload")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed repetitions per workload")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the size of evaluation workloads")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results from this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown fraction counted as a regression")
+    args = parser.parse_args(argv[1:])
+
+    interpreters = [INTERPRETERS[name]() for name in (args.interpreter or sorted(INTERPRETERS))]
+    workloads = [w for w in WORKLOADS if not args.workload or w.name in args.workload]
+
+    results = []
+    print("%-14s %-10s %8s %10s %9s %9s %12s" % ("workload", "interp", "n", "steps", "best", "median", "steps/s"))
+    for workload in workloads:
+        for interpreter in interpreters:
+            if interpreter.name not in workload.interpreters:
+                continue
+            result = run_workload(interpreter, workload, args.reps, args.warmup, args.scale)
+            results.append(result)
+            print("%-14s %-10s %8d %10d %8.4fs %8.4fs %12.0f" % (
+                result["workload"], result["interpreter"], result["n"], result["steps"],
+                result["best"], result["median"], result["steps_per_sec"] or 0,
+            ))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "reps": args.reps,
+                "warmup": args.warmup,
+                "results": results,
+            }, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,95 @@
+#
+# Copyright (C) 2024-2026 George Zhang
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Control form benchmark for fexproto.py
+#
+#   python bench/stdlib.py [N]
+#
+# Runs loops built from $lambda, $sequence, $cond, $and?, $or? and apply with
+# the primitive control forms and with the derivations from std.lisp
+# (--derived-stdlib), and reports steps and time for each.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(sys.path[0])
+import fexproto as fx
+
+DEFINITIONS = r'''
+($define! count-cond ($lambda (n)
+    ($cond
+        ((eq? n 0) 0)
+        (#t (count-cond (+ n -1))))))
+($define! count-body ($lambda (n acc)
+    ($define! next (+ n -1))
+    ($if (eq? n 0)
+        acc
+        (count-body next (+ acc 1)))))
+($define! count-and-or ($lambda (n)
+    ($if ($or? (eq? n 0) ($and? (<=? n 0) #t))
+        0
+        (count-and-or (+ n -1)))))
+($define! count-apply ($lambda (n)
+    ($if (eq? n 0)
+        0
+        (apply count-apply (list (+ n -1))))))
+'''
+
+WORKLOADS = [
+    ("$cond", "(count-cond %d)"),
+    ("$sequence", "(count-body %d 0)"),
+    ("$and?/$or?", "(count-and-or %d)"),
+    ("apply", "(count-apply %d)"),
+]
+
+def _parse(text):
+    return fx.parse(fx.tokenize(text), filename="\x00bench")
+
+def _run(env, expr):
+    # Same loop as f_eval but counting steps
+    steps = 0
+    continuation = fx.Continuation(env, fx._step_eval, fx.Continuation.ROOT)
+    value = expr
+    while continuation is not fx.Continuation.ROOT:
+        continuation, value = fx.step_evaluate(continuation, value)
+        steps += 1
+        if continuation is fx.Continuation.ERROR:
+            raise ValueError(value)
+    return value, steps
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 5000
+    envs = []
+    for name, derived in [("primitive", False), ("derived", True)]:
+        env = fx._make_standard_environment(derived=derived)
+        for expr in _parse(DEFINITIONS):
+            fx.f_eval(env, expr)
+        envs.append((name, env))
+    print("%-12s %-10s %10s %9s" % ("workload", "forms", "steps", "seconds"))
+    for label, template in WORKLOADS:
+        [expr] = _parse(template % n)
+        for name, env in envs:
+            _run(env, _parse(template % 10)[0])  # warm up
+            start = time.perf_counter()
+            _, steps = _run(env, expr)
+            elapsed = time.perf_counter() - start
+            print("%-12s %-10s %10d %9.3f" % (label, name, steps, elapsed))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,11 @@
+; List building and non-tail append
+($define! build ($lambda (n acc)
+	($if (eq? n 0)
+		acc
+		(build (+ n -1) (cons n acc)))))
+($define! append2 ($lambda (a b)
+	($if (eq? a ())
+		b
+		(cons (car a) (append2 (cdr a) b)))))
+($define! append-test ($lambda (n)
+	(car (append2 (build n ()) (build n ())))))
@@ -0,0 +1,11 @@
+; Escaping from a recursion with a first-class continuation (which receives the
+; argument list of its applicative)
+($define! descend ($lambda (depth k)
+	($if (eq? depth 0)
+		((continuation->applicative k) 1)
+		(+ 1 (descend (+ depth -1) k)))))
+($define! escape-loop ($lambda (n depth acc)
+	($if (eq? n 0)
+		acc
+		(escape-loop (+ n -1) depth
+			(+ acc (car (call/cc ($lambda (k) (descend depth k)))))))))
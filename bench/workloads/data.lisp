@@ -0,0 +1,22 @@
+; Large and cyclic data for the parse and write workloads
+($define! build ($lambda (n acc item)
+	($if (eq? n 0)
+		acc
+		(build (+ n -1) (cons (item n) acc) item))))
+($define! tree ($lambda (width depth)
+	($if (eq? depth 0)
+		"leaf"
+		(build width () ($lambda (n)
+			($if (eq? n 1)
+				(+ depth width)
+				(tree width (+ depth -1))))))))
+($define! cycle ($lambda (n)
+	($define! items (build n () ($lambda (n) n)))
+	($define! last ($lambda (p) ($if (eq? (cdr p) ()) p (last (cdr p)))))
+	(set-cdr! (last items) items)
+	items))
+($define! cycles ($lambda (n length)
+	(build n () ($lambda (#ignore) (cycle length)))))
+($define! strings ($lambda (n)
+	(build n () ($lambda (#ignore)
+		"a string of plain text with a \"quote\", a\ttab, and a \\ backslash"))))
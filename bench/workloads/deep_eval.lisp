@@ -0,0 +1,6 @@
+; Nested operative calls that each evaluate their operand with eval
+($define! $deep ($vau (env (n))
+	($define! value (eval env n))
+	($if (eq? value 0)
+		0
+		(+ 1 (eval env (cons $deep (cons (+ value -1) ())))))))
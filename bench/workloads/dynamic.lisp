@@ -0,0 +1,21 @@
+; Keyed dynamic variables accessed below several other bindings
+($define! (bind-a get-a) (make-keyed-dynamic-variable))
+($define! (bind-b get-b) (make-keyed-dynamic-variable))
+($define! access-loop ($lambda (n acc)
+	($if (eq? n 0)
+		acc
+		(access-loop (+ n -1) (+ acc (get-a))))))
+($define! nest ($lambda (depth thunk)
+	($if (eq? depth 0)
+		(thunk)
+		(bind-b depth ($lambda () (nest (+ depth -1) thunk))))))
+($define! dynamic-test ($lambda (n)
+	(bind-a 1 ($lambda ()
+		(nest 16 ($lambda () (access-loop n 0)))))))
+; Non-tail recursion reading a variable bound below all of its frames
+($define! deep-access ($lambda (n)
+	($if (eq? n 0)
+		0
+		(+ (get-a) (deep-access (+ n -1))))))
+($define! dynamic-deep ($lambda (n)
+	(bind-a 1 ($lambda () (deep-access n)))))
@@ -0,0 +1,34 @@
+; Long, wide, shared and cyclic data for the equal? workloads
+($define! build ($lambda (n acc item)
+	($if (eq? n 0)
+		acc
+		(build (+ n -1) (cons (item n) acc) item))))
+($define! tree ($lambda (width depth)
+	($if (eq? depth 0)
+		"leaf"
+		(build width () ($lambda (#ignore) (tree width (+ depth -1)))))))
+; A list of length n where each car is the same pair (so the tree it makes has
+; 2^n paths, but only n distinct pairs)
+($define! shared ($lambda (n acc)
+	($if (eq? n 0)
+		acc
+		(shared (+ n -1) (cons acc acc)))))
+($define! ring ($lambda (n)
+	($define! items (build n () ($lambda (n) n)))
+	($define! last ($lambda (p) ($if (eq? (cdr p) ()) p (last (cdr p)))))
+	(set-cdr! (last items) items)
+	items))
+($define! equal-loop ($lambda (n a b)
+	($if (eq? n 0)
+		(equal? a b)
+		($sequence
+			(equal? a b)
+			(equal-loop (+ n -1) a b)))))
+($define! long-a (build 20000 () ($lambda (n) n)))
+($define! long-b (build 20000 () ($lambda (n) n)))
+($define! wide-a (tree 8 4))
+($define! wide-b (tree 8 4))
+($define! shared-a (shared 24 ()))
+($define! shared-b (shared 24 ()))
+($define! ring-a (ring 1000))
+($define! ring-b (ring 1000))
@@ -0,0 +1,5 @@
+; Non-tail recursion
+($define! fib ($lambda (n)
+	($if (<=? n 1)
+		n
+		(+ (fib (+ n -1)) (fib (+ n -2))))))
@@ -0,0 +1,35 @@
+; Unwinding through guarded continuations on errors (like $binds? in std.lisp)
+($define! guarded-error ($lambda ()
+	(call/cc ($lambda (cc)
+		($define! inner
+			(guard-continuation
+				()
+				cc
+				(list
+					(list
+						error-continuation
+						($lambda (#ignore divert)
+							(apply divert 1))))))
+		((continuation->applicative
+			(extend-continuation inner
+				($lambda ()
+					(error "unwind"))))
+			)))))
+($define! guard-loop ($lambda (n acc)
+	($if (eq? n 0)
+		acc
+		(guard-loop (+ n -1) (+ acc (guarded-error))))))
+; Escaping from the bottom of a recursion where every level is guarded
+($define! nested-guards ($lambda (depth k)
+	($if (eq? depth 0)
+		((continuation->applicative k) 1)
+		(call/cc ($lambda (cc)
+			((continuation->applicative
+				(extend-continuation
+					(guard-continuation () cc (list (list k ($lambda (value #ignore) value))))
+					($lambda () (nested-guards (+ depth -1) k))))))))))
+($define! guard-deep-loop ($lambda (n depth acc)
+	($if (eq? n 0)
+		acc
+		(guard-deep-loop (+ n -1) depth
+			(+ acc (car (call/cc ($lambda (k) (nested-guards depth k)))))))))
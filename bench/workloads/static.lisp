@@ -0,0 +1,13 @@
+; Keyed static variables accessed from deeply nested environments
+($define! (bind-s get-s) (make-keyed-static-variable))
+($define! static-env (bind-s 1 (get-current-environment)))
+; Each level of nesting evaluates the next one in a child of its environment
+($define! nest ($lambda (depth env)
+	($if (eq? depth 0)
+		env
+		(nest (+ depth -1) (eval env (list make-environment env))))))
+($define! deep-env (nest 1000 static-env))
+($define! access-loop ($lambda (n acc)
+	($if (eq? n 0)
+		acc
+		(access-loop (+ n -1) (+ acc (eval deep-env (list get-s)))))))
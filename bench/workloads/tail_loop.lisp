@@ -0,0 +1,5 @@
+; Tail recursive loop (same as speed_test.lisp)
+($define! sumto ($lambda (n acc)
+	($if (eq? n 0)
+		acc
+		(sumto (+ n -1) (+ acc n)))))
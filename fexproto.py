@@ -17,33 +17,150 @@
 
 # wraps a function with zero, one, or more layers of argument evaluation
 class Combiner:
+    __slots__ = ("num_wraps", "func")
     def __init__(self, num_wraps, func):
         assert num_wraps >= 0, f'expected non-negative wrap count, got {num_wraps}'
         self.num_wraps = num_wraps
         assert callable(func), f'combiner function is not callable: {func}'
         self.func = func
 
+# A primitive with a fixed number of arguments. func takes the parent
+# continuation and then the arguments positionally, and returns the next
+# continuation and value like a step function. Argument evaluation calls func
+# directly with the evaluated arguments, and calling the primitive itself
+# (when it is applied to a list, such as through apply or after unwrap)
+# unpacks the list first.
+class Primitive:
+    __slots__ = ("arity", "func")
+    def __init__(self, arity, func):
+        self.arity = arity
+        self.func = func
+    def __call__(self, env, expr, parent):
+        args = []
+        rest = expr
+        while isinstance(rest, Pair) and len(args) <= self.arity:
+            args.append(rest.car)
+            rest = rest.cdr
+        if len(args) != self.arity or rest != ():
+            return _f_arity_error(parent, self.arity, expr)
+        return self.func(parent, *args)
+
+# make an applicative primitive taking arity arguments
+def _primitive(arity, func):
+    return Combiner(1, Primitive(arity, func))
+
 class Environment:
+    # static_variables is inherited from the parent and maps each keyed static
+    # variable bound in this environment or its ancestors to its value (a
+    # static binder makes a new map, and maps are never mutated)
+    # watched is set once a lookup cache depends on this environment not
+    # gaining new bindings (see _compile_lookup)
+    __slots__ = ("bindings", "parent", "static_variables", "watched")
     def __init__(self, bindings, parent):
         assert type(bindings) is dict, f'bindings must be dict, got: {type(bindings)}'
         self.bindings = bindings
-        assert type(parent) is Environment, f'parent must type Environment, got: {type(parent)}'
+        assert type(parent) is Environment or type(parent) is MapEnvironment, f'parent must type Environment, got: {type(parent)}'
         self.parent = parent
+        self.static_variables = parent.static_variables
+        self.watched = False
 Environment.ROOT = object.__new__(Environment)
+Environment.ROOT.static_variables = None
+
+# Environments can also store their bindings in a list whose layout is
+# described by a LocalMap, like the environments in rfexproto.py. Maps are
+# shared between environments that defined the same names in the same order,
+# so every call frame of an operative ends up with the same map, and a frame
+# costs one list instead of a dict. Map environments leave bindings as None.
+# Call frames made by Operative.__call__ use them after
+# set_environment_storage("map"); all other environments keep using dicts.
+class MapEnvironment(Environment):
+    __slots__ = ("localmap", "storage")
+    def __init__(self, parent):
+        self.bindings = None
+        assert type(parent) is Environment or type(parent) is MapEnvironment, f'parent must type Environment, got: {type(parent)}'
+        self.parent = parent
+        self.static_variables = parent.static_variables
+        self.watched = False
+        self.localmap = LocalMap.ROOT
+        self.storage = []
+
+class LocalMap:
+    # Unlike in rfexproto.py, each map keeps a flat dict from every name it
+    # contains to its index, instead of searching through its parent maps
+    __slots__ = ("transitions", "indexes")
+    def __init__(self, indexes):
+        self.transitions = {}  # name -> LocalMap
+        self.indexes = indexes  # name -> index into storage
+    def new_localmap_with(self, name):
+        localmap = self.transitions.get(name)
+        if localmap is None:
+            indexes = dict(self.indexes)
+            indexes[name] = len(indexes)
+            localmap = self.transitions[name] = LocalMap(indexes)
+        return localmap
+LocalMap.ROOT = LocalMap({})
+
+_map_environments = False
+
+# set storage of call frames to "dict" or "map"
+def set_environment_storage(storage):
+    global _map_environments
+    if storage == "dict":
+        _map_environments = False
+    elif storage == "map":
+        _map_environments = True
+    else:
+        raise ValueError(f'unknown environment storage: {storage}')
+
+_UNBOUND = object()
+
+# return the value bound to name in env itself (ignoring parents), or _UNBOUND
+def _lookup_local(env, name):
+    bindings = env.bindings
+    if bindings is None:
+        index = env.localmap.indexes.get(name)
+        return _UNBOUND if index is None else env.storage[index]
+    return bindings.get(name, _UNBOUND)
+
+# return the value bound to name in env or its parents, or _UNBOUND
+def _lookup(env, name):
+    while env is not Environment.ROOT:
+        value = _lookup_local(env, name)
+        if value is not _UNBOUND:
+            return value
+        env = env.parent
+    return _UNBOUND
 
 class Continuation:
+    # Optional fields are part of the fixed layout and default to None, except
+    # dynamic_variables which is inherited from the parent. It maps each keyed
+    # dynamic variable bound at this point to its value and is never mutated,
+    # so it stays correct when the continuation is re-entered. depth counts the
+    # continuations up to the root, and guarded is the nearest of this one and
+    # its ancestors that has entry or exit guards (see _f_abnormal_pass).
+    __slots__ = ("env", "expr", "parent", "_call_info", "entry_guards", "exit_guards", "dynamic_variables", "depth", "guarded")
     def __init__(self, env, expr, parent):
-        assert type(env) is Environment, f'env must be type Environment, got: {type(env)}'
+        assert isinstance(env, Environment), f'env must be type Environment, got: {type(env)}'
         self.env = env
         assert callable(expr), f'expr must be callable, got: {type(expr)}'
         self.expr = expr
         assert type(parent) is Continuation, f'parent must be type Continuation, got: {type(parent)}'
         self.parent = parent
+        self._call_info = None
+        self.entry_guards = None
+        self.exit_guards = None
+        self.dynamic_variables = parent.dynamic_variables
+        self.depth = parent.depth + 1
+        self.guarded = parent.guarded
 Continuation.ROOT = object.__new__(Continuation)
+Continuation.ROOT.dynamic_variables = None
+Continuation.ROOT.depth = 0
+Continuation.ROOT.guarded = None
 
 class Operative:
+    __slots__ = ("env", "envname", "name", "body")
     def __init__(self, env, envname, name, body):
-        assert type(env) is Environment, f'env must be type Environment, got: {type(env)}'
+        assert isinstance(env, Environment), f'env must be type Environment, got: {type(env)}'
         self.env = env  # static environment (at time of declaration)
         assert type(envname) is str or type(envname) is type(...), f'envname must be type str or Ellipsis, got: {type(envname)}'
         self.envname = envname  # name for dynamic environment
@@ -53,27 +170,50 @@ class Operative:
         # dyn is dynamic environment (at time of call)
         # args is call arguments
         # parent is parent continuation
-        call_env = Environment({}, self.env)
+        if _map_environments:
+            call_env = MapEnvironment(self.env)
+        else:
+            call_env = Environment({}, self.env)
         _define(call_env, self.envname, dyn)
         _define(call_env, self.name, args)
-        continuation = Continuation(call_env, _step_eval, parent)
-        return continuation, self.body
+        return _step_eval(call_env, self.body, parent)
 _f_passthrough = Operative(Environment.ROOT, "_", "value", "value")
 Continuation.ERROR = Continuation(Environment.ROOT, _f_passthrough, Continuation.ROOT)
 
+# Pairs are either mutable (from cons and argument lists) or immutable (from the
+# reader and copy-es-immutable). Only immutable pairs carry source locations.
 class Pair:
+    __slots__ = ("car", "cdr")
     def __init__(self, car, cdr):
         self.car = car
         self.cdr = cdr
-        self.immutable = False
     def __eq__(self, other):
         return self is other or (
-            type(other) is Pair
+            isinstance(other, Pair)
             and self.car == other.car
             and self.cdr == other.cdr
         )
 
+class MutablePair(Pair):
+    __slots__ = ()
+
+class ImmutablePair(Pair):
+    # _compiled caches the closure made by _compile when evaluated as code
+    __slots__ = ("_location_info", "_compiled")
+    def __init__(self, car, cdr):
+        self.car = car
+        self.cdr = cdr
+        self._location_info = None
+        self._compiled = None
+    def __getstate__(self):
+        # Compiled closures can't be pickled and are remade when needed
+        return self.car, self.cdr, self._location_info
+    def __setstate__(self, state):
+        self.car, self.cdr, self._location_info = state
+        self._compiled = None
+
 class Character:
+    __slots__ = ("char",)
     def __init__(self, char):
         assert type(char) is int, f'char must be type int, got: {type(char)}'
         assert 0 <= char < 256, f'char must be from 0 to 255, got: {char}'
@@ -83,12 +223,104 @@ class Character:
             type(other) is Character
             and self.char == other.char
         )
+    def __reduce__(self):
+        # Keep characters shared when pickled (as in snapshots)
+        return _get_character, (self.char,)
+
+# There is one shared Character for each byte. The reader and primitives get
+# them from this table instead of making new ones.
+_CHARACTERS = [Character(char) for char in range(256)]
+
+def _get_character(char):
+    return _CHARACTERS[char]
 
 class Encapsulation:
+    __slots__ = ("obj", "arg")
     def __init__(self, obj, arg):
         self.obj = obj
         self.arg = arg
 
+# Specialized environments
+
+# Interpreter-internal continuations carry their state in these fixed records
+# instead of a bindings dict. They are never visible to user code, so their
+# Environment fields (bindings and parent) are left unset.
+
+class StepWrappedEnvironment(Environment):
+    __slots__ = ("env", "args")
+    def __init__(self, env, args):
+        self.env = env
+        self.args = args
+
+# values holds argument expressions until they are replaced by their values. If
+# c is nonzero, the argument list is cyclic and the last c values are the cycle.
+class StepEvCarEnvironment(Environment):
+    __slots__ = ("env", "combiner", "values", "num_wraps", "a", "c", "i", "order")
+    def __init__(self, env, combiner, values, num_wraps, a, c, i, order):
+        self.env = env
+        self.combiner = combiner
+        self.values = values
+        self.num_wraps = num_wraps
+        self.a = a
+        self.c = c
+        self.i = i
+        self.order = order
+
+class FIfEnvironment(Environment):
+    __slots__ = ("env", "on_true", "on_false")
+    def __init__(self, env, on_true, on_false):
+        self.env = env
+        self.on_true = on_true
+        self.on_false = on_false
+
+class FDefineEnvironment(Environment):
+    __slots__ = ("env", "name")
+    def __init__(self, env, name):
+        self.env = env
+        self.name = name
+
+class FBindsEnvironment(Environment):
+    __slots__ = ("name",)
+    def __init__(self, name):
+        self.name = name
+
+class FSequenceEnvironment(Environment):
+    __slots__ = ("env", "exprs")
+    def __init__(self, env, exprs):
+        self.env = env
+        self.exprs = exprs
+
+class FCondEnvironment(Environment):
+    __slots__ = ("env", "body", "clauses")
+    def __init__(self, env, body, clauses):
+        self.env = env
+        self.body = body
+        self.clauses = clauses
+
+class FAndOrEnvironment(Environment):
+    __slots__ = ("env", "exprs", "stop")
+    def __init__(self, env, exprs, stop):
+        self.env = env
+        self.exprs = exprs
+        self.stop = stop
+
+class FRequireEnvironment(Environment):
+    __slots__ = ("env", "path")
+    def __init__(self, env, path):
+        self.env = env
+        self.path = path
+
+class FForceNormalPassEnvironment(Environment):
+    __slots__ = ("continuation",)
+    def __init__(self, continuation):
+        self.continuation = continuation
+
+class FApplyInterceptorEnvironment(Environment):
+    __slots__ = ("interceptor", "outer")
+    def __init__(self, interceptor, outer):
+        self.interceptor = interceptor
+        self.outer = outer
+
 def f_eval(env, expr):
     if type(env) is dict:
         env = Environment(env, Environment.ROOT)
@@ -102,99 +334,134 @@ def f_eval(env, expr):
     return value
 
 def _f_error(parent, *args):
-    error_applicative = Pair(Combiner(1, _operative_continuation_to_applicative), Pair(Continuation.ERROR, ()))
-    error_operative = Pair(Combiner(1, _operative_unwrap), Pair(error_applicative, ()))
+    error_applicative = MutablePair(_primitive(1, _operative_continuation_to_applicative), MutablePair(Continuation.ERROR, ()))
+    error_operative = MutablePair(_primitive(1, _operative_unwrap), MutablePair(error_applicative, ()))
     message_tree = ()
-    for arg in reversed(args): message_tree = Pair(arg, message_tree)
-    message_tree = Pair(parent, message_tree)
-    expr = Pair(error_operative, message_tree)
+    for arg in reversed(args): message_tree = MutablePair(arg, message_tree)
+    message_tree = MutablePair(parent, message_tree)
+    expr = MutablePair(error_operative, message_tree)
     continuation = Continuation(Environment.ROOT, _step_eval, parent)
     return continuation, expr
 
+def _f_arity_error(parent, arity, args):
+    plural = "" if arity == 1 else "s"
+    return _f_error(parent, f'expected {arity} argument{plural}, got: '.encode("utf-8"), args)
+
+# copy the mutable pairs reachable from obj, sharing immutable pairs and
+# keeping shared and cyclic structure (seen maps ids of pairs to their copies)
 def _f_copy_es(obj, *, seen=None, immutable=False):
-    if type(obj) is not Pair:
-        return obj
-    if obj.immutable:
+    if not isinstance(obj, Pair) or type(obj) is ImmutablePair:
         return obj
     if seen is None:
         seen = {}
     if id(obj) in seen:
         return seen[id(obj)]
-    pair = Pair((), ())
-    seen[id(obj)] = pair
-    pair.car = _f_copy_es(obj.car, seen=seen, immutable=immutable)
-    pair.cdr = _f_copy_es(obj.cdr, seen=seen, immutable=immutable)
-    pair.immutable = immutable
-    if immutable and hasattr(obj, "_location_info"):
-        pair._location_info = obj._location_info
-    return pair
-
-def _f_write(obj):
-    seen = {}
-    def _recursive_write(obj, depth):
+    make_pair = ImmutablePair if immutable else MutablePair
+    copy = seen[id(obj)] = make_pair((), ())
+    pending = [(obj, copy)]  # pairs whose copy still needs a car and cdr
+    while pending:
+        obj, pair = pending.pop()
+        car, cdr = obj.car, obj.cdr
+        if isinstance(car, Pair) and type(car) is not ImmutablePair:
+            if id(car) in seen:
+                car = seen[id(car)]
+            else:
+                new_car = seen[id(car)] = make_pair((), ())
+                pending.append((car, new_car))
+                car = new_car
+        if isinstance(cdr, Pair) and type(cdr) is not ImmutablePair:
+            if id(cdr) in seen:
+                cdr = seen[id(cdr)]
+            else:
+                new_cdr = seen[id(cdr)] = make_pair((), ())
+                pending.append((cdr, new_cdr))
+                cdr = new_cdr
+        pair.car, pair.cdr = car, cdr
+    return copy
+
+# How each byte is written inside a string
+_STRING_ESCAPES = {char: repr(bytes([char]))[2:-1] for char in range(256)}
+_STRING_ESCAPES[b'"'[0]] = r'\"'
+
+# write obj to file (sys.stdout by default) in a single call
+def _f_write(obj, file=None):
+    if file is None:
+        import sys
+        file = sys.stdout
+    file.write(_f_write_string(obj))
+
+# return the written form of obj
+def _f_write_string(obj):
+    out = []
+    seen = {}  # id of pair -> depth for pairs in the lists being written
+    lists = []  # [rest of list, depth, ids to remove from seen] per list
+    depth = 0
+    while True:
+        # Write obj, or start writing it if it's a list
         if type(obj) is tuple:
-            print(end="()")
-        elif type(obj) is Pair:
+            out.append("()")
+        elif isinstance(obj, Pair):
             if id(obj) in seen:
-                seen_depth = seen[id(obj)]
-                print(end="#up<"+repr(depth - seen_depth)+">")
+                out.append("#up<"+repr(depth - seen[id(obj)])+">")
             else:
-                start_depth = depth
-                remove = []
                 seen[id(obj)] = depth
-                remove.append(id(obj))
-                print(end="(")
-                _recursive_write(obj.car, depth+1)
+                lists.append([obj.cdr, depth + 1, [id(obj)]])
+                out.append("(")
+                obj = obj.car
                 depth += 1
-                obj = obj.cdr
-                while type(obj) is Pair:
-                    if id(obj) in seen:
-                        break
-                    seen[id(obj)] = depth
-                    remove.append(id(obj))
-                    print(end=" ")
-                    _recursive_write(obj.car, depth+1)
-                    depth += 1
-                    obj = obj.cdr
-                if type(obj) is not tuple:
-                    print(end=" . ")
-                    _recursive_write(obj, depth)
-                print(end=")")
-                for remove_obj in remove:
-                    del seen[remove_obj]
+                continue
         elif type(obj) in (int, float):
-            print(end=repr(obj))
+            out.append(repr(obj))
         elif type(obj) is str:
-            print(end=obj)
+            out.append(obj)
         elif type(obj) is bytes:
-            print(end='"')
-            for char in obj:
-                if char != b'"'[0]:
-                    print(end=repr(bytes([char]))[2:-1])
-                else:
-                    print(end=r'\"')
-            print(end='"')
+            out.append('"' + obj.decode("latin1").translate(_STRING_ESCAPES) + '"')
         elif type(obj) is Character:
             i = b" ()\t\n\r".find(obj.char)
             if i == -1:
-                out = repr(bytes([obj.char]))[2:-1]
-                if out[0] == "\\":
-                    print(end="#"+out)
+                char = repr(bytes([obj.char]))[2:-1]
+                if char[0] == "\\":
+                    out.append("#"+char)
                 else:
-                    print(end="#\\"+out)
+                    out.append("#\\"+char)
             else:
-                print(end=(r"#\x20", r"#\x28", r"#\x29", r"#\x09", r"#\x0a", r"#\x0d")[i])
-        elif type(obj) in (Environment, Continuation, Combiner, Encapsulation):
-            print(end="#"+repr(obj))
+                out.append((r"#\x20", r"#\x28", r"#\x29", r"#\x09", r"#\x0a", r"#\x0d")[i])
+        elif type(obj) in (Environment, MapEnvironment, Continuation, Combiner, Encapsulation):
+            out.append("#"+repr(obj))
         elif type(obj) is type(...):
-            print(end="#ignore")
+            out.append("#ignore")
         elif type(obj) is type(None):
-            print(end="#inert")
+            out.append("#inert")
         elif type(obj) is bool:
-            print(end="#t" if obj else "#f")
+            out.append("#t" if obj else "#f")
+        else:
+            out.append("#unknown"+repr(obj))
+
+        # Move on to the next element of the innermost list, closing lists
+        # that have no elements left
+        while lists:
+            top = lists[-1]
+            rest, depth, remove = top
+            if isinstance(rest, Pair) and id(rest) not in seen:
+                seen[id(rest)] = depth
+                remove.append(id(rest))
+                top[0], top[1] = rest.cdr, depth + 1
+                out.append(" ")
+                obj = rest.car
+                depth += 1
+                break
+            if type(rest) is not tuple:
+                # Write the cdr (or a reference to it) after a dot
+                top[0] = ()
+                out.append(" . ")
+                obj = rest
+                break
+            out.append(")")
+            for remove_id in remove:
+                del seen[remove_id]
+            lists.pop()
         else:
-            print(end="#unknown"+repr(obj))
-    _recursive_write(obj, 0)
+            return "".join(out)
 
 # given a continuation and a value, get the next continuation and value
 def step_evaluate(continuation, value):
@@ -205,34 +472,64 @@ def step_evaluate(continuation, value):
 
 def _step_eval(env, expr, parent):
     if type(expr) is str:
-        while env is not Environment.ROOT:
-            if expr in env.bindings:
-                return parent, env.bindings[expr]
-            env = env.parent
-        return _f_error(parent, b"binding not found: ", expr)
-    elif type(expr) is Pair:
-        name, args = expr.car, expr.cdr
-        if type(name) is Pair and name.car is name:
-            return _f_error(parent, b"infinite recursive evaluation of combiner detected")
-        # evaluate car of call
-        next_env = Environment({"env": env, "args": args}, Environment.ROOT)
-        continuation = Continuation(next_env, _step_call_wrapped, parent)
-        continuation = Continuation(Environment.ROOT, _step_call_combcar, continuation)
-        continuation._call_info = ["eval combiner car", expr.car]  # non-tail call
-        continuation = Continuation(env, _step_eval, continuation)
-        return continuation, name
+        value = _lookup(env, expr)
+        if value is _UNBOUND:
+            return _f_error(parent, b"binding not found: ", expr)
+        return parent, value
+    elif type(expr) is ImmutablePair:
+        compiled = expr._compiled
+        if compiled is None:
+            compiled = expr._compiled = _compile(expr)
+        return compiled(env, None, parent)
+    elif isinstance(expr, Pair):
+        return _step_combination(env, expr, parent)
     else:
         return parent, expr
 
+def _step_combination(env, expr, parent):
+    name, args = expr.car, expr.cdr
+    if isinstance(name, Pair) and name.car is name:
+        return _f_error(parent, b"infinite recursive evaluation of combiner detected")
+    if type(name) is str:
+        # Look up a symbol in place, leaving errors to the usual steps below
+        combiner = _lookup(env, name)
+        if type(combiner) is Combiner:
+            return _step_call_wrapped(StepWrappedEnvironment(env, args), combiner, parent)
+    # evaluate car of call
+    next_env = StepWrappedEnvironment(env, args)
+    continuation = Continuation(next_env, _step_call_wrapped, parent)
+    continuation = Continuation(Environment.ROOT, _step_call_combcar, continuation)
+    continuation._call_info = ["eval combiner car", expr.car]  # non-tail call
+    continuation = Continuation(env, _step_eval, continuation)
+    return continuation, name
+
+# Kernel leaves the order of argument evaluation unspecified. Arguments are
+# evaluated left to right by default, and _argument_order is None in that case.
+# Otherwise it is a function that reorders a list of arguments in place.
+_argument_order = None
+
+# set order of argument evaluation to left-to-right, right-to-left, or shuffle
+def set_evaluation_order(order, seed=None):
+    global _argument_order
+    if order == "left-to-right":
+        _argument_order = None
+    elif order == "right-to-left":
+        _argument_order = list.reverse
+    elif order == "shuffle":
+        import random
+        _argument_order = random.Random(seed).shuffle
+    else:
+        raise ValueError(f'unknown evaluation order: {order}')
+
 # return (number of Pairs, number of Nils, Acyclic prefix length, Cycle length)
 def _get_list_metrics(obj):
-    if type(obj) is not Pair:
+    if not isinstance(obj, Pair):
         return 0, (1 if obj == () else 0), 0, 0
     hare_distance = hare_power = 1
     list_length = 0
     tortoise = obj
     hare = obj.cdr
-    if type(hare) is not Pair:
+    if not isinstance(hare, Pair):
         return list_length + hare_distance, (1 if hare == () else 0), list_length + hare_distance, 0
     # Brent's cycle detection algorithm
     while tortoise is not hare:
@@ -243,7 +540,7 @@ def _get_list_metrics(obj):
             hare_distance = 0
         hare = hare.cdr
         hare_distance += 1
-        if type(hare) is not Pair:
+        if not isinstance(hare, Pair):
             return list_length + hare_distance, (1 if hare == () else 0), list_length + hare_distance, 0
     tortoise = hare = obj
     for _ in range(hare_distance):
@@ -268,6 +565,13 @@ def _encycle(a, c, args):
     args.cdr = head
     return orig
 
+# make a list of mutable pairs from a Python list
+def _f_list(values):
+    args = ()
+    for value in reversed(values):
+        args = MutablePair(value, args)
+    return args
+
 def _step_call_combcar(_env, value, parent):
     if type(value) is not Combiner:
         return _f_error(parent, b"expected combiner as car of combiner call, got: ", value)
@@ -275,107 +579,142 @@ def _step_call_combcar(_env, value, parent):
 
 # evaluate arguments based on num_wraps
 def _step_call_wrapped(static, combiner, parent):
-    env = static.bindings["env"]
-    args = static.bindings["args"]
+    env = static.env
+    args = static.args
     assert type(combiner) is Combiner
     if combiner.num_wraps == 0 or args == ():
         continuation = Continuation(env, combiner.func, parent)
         return continuation, args
-    p, n, a, c = _get_list_metrics(args)
-    if n == c == 0:
+    if not isinstance(args, Pair):
         return _f_error(parent, b"applicative arguments must be proper list, got: ", args)
-    # Create isomorphic list of args
-    copy_args = last_arg = Pair((), ())
-    curr_arg = args
-    for _ in range(p):
-        last_arg.cdr = Pair(curr_arg.car, ())
-        last_arg = last_arg.cdr
-        curr_arg = curr_arg.cdr
-    copy_args = _encycle(a, c, copy_args.cdr)
-    # Create list for order of argument evaluation
-    eval_args = last_arg = Pair((), ())
-    curr_arg = copy_args
-    for _ in range(p):
-        last_arg.cdr = Pair(curr_arg, ())
-        last_arg = last_arg.cdr
-        curr_arg = curr_arg.cdr
-    eval_args = eval_args.cdr
-    # Shuffle args to ensure correctness
-    if p > 1:
-        shuffle_args = []
-        while eval_args != ():
-            shuffle_args.append(eval_args.car)
-            eval_args = eval_args.cdr
-        import random; random.shuffle(shuffle_args)
-        while shuffle_args:
-            eval_args = Pair(shuffle_args.pop(), eval_args)
-    # Setup and run _step_call_evcar on each argument
-    next_env = Environment({
-        "env": env,
-        "combiner": combiner,
-        "args": copy_args,
-        "num_wraps": combiner.num_wraps,
-        "p": p,
-        "i": 0,
-        "eval_args": eval_args,
-        "eval_arg": eval_args,
-    }, Environment.ROOT)
-    continuation = Continuation(next_env, _step_call_evcar, parent)
-    continuation._call_info = ["eval combiner arg", eval_args.car.car]
-    continuation = Continuation(env, _step_eval, continuation)
-    return continuation, eval_args.car.car
+    # Collect argument expressions, using Brent's algorithm to stop on cycles
+    values = [args.car]
+    tortoise = args
+    curr = args.cdr
+    power = c = 1
+    while isinstance(curr, Pair):
+        if curr is tortoise:
+            break
+        values.append(curr.car)
+        if power == c:
+            tortoise = curr
+            power *= 2
+            c = 0
+        curr = curr.cdr
+        c += 1
+    else:
+        if curr != ():
+            return _f_error(parent, b"applicative arguments must be proper list, got: ", args)
+        c = 0
+    a = len(values)
+    if c > 0:
+        # Find where the cycle of length c starts and drop repeated arguments
+        tortoise = hare = args
+        for _ in range(c):
+            hare = hare.cdr
+        a = 0
+        while tortoise is not hare:
+            tortoise = tortoise.cdr
+            hare = hare.cdr
+            a += 1
+        del values[a+c:]
+    order = None
+    if _argument_order is not None and len(values) > 1:
+        order = list(range(len(values)))
+        _argument_order(order)
+    # Evaluate each argument in place, replacing its expression with its value
+    next_env = StepEvCarEnvironment(env, combiner, values, combiner.num_wraps, a, c, 0, order)
+    return _f_call_evargs(next_env, 0, parent)
 
 def _step_call_evcar(static, value, parent):
-    env = static.bindings["env"]
-    num_wraps = static.bindings["num_wraps"]
-    p = static.bindings["p"]
-    i = static.bindings["i"]
-    eval_arg = static.bindings["eval_arg"]
-    eval_arg.car.car = value
-    i += 1
-    eval_arg = eval_arg.cdr
-    if i == p:
-        i = 0
-        num_wraps -= 1
-        eval_arg = static.bindings["eval_args"]
-        if num_wraps == 0:
-            continuation = Continuation(env, static.bindings["combiner"].func, parent)
-            return continuation, static.bindings["args"]
-        static.bindings["num_wraps"] = num_wraps
-    static.bindings["i"] = i
-    static.bindings["eval_arg"] = eval_arg
+    order = static.order
+    i = static.i
+    static.values[i if order is None else order[i]] = value
+    return _f_call_evargs(static, i + 1, parent)
+
+# evaluate arguments from the ith one on. Symbols and constants are evaluated
+# here without making continuations, and only combinations (and unbound
+# symbols, so that they are reported with their _call_info) take extra steps.
+def _f_call_evargs(static, i, parent):
+    env = static.env
+    values = static.values
+    order = static.order
+    while True:
+        if i == len(values):
+            i = 0
+            static.num_wraps -= 1
+            if static.num_wraps == 0:
+                func = static.combiner.func
+                if type(func) is Primitive and static.c == 0:
+                    if len(values) != func.arity:
+                        return _f_arity_error(parent, func.arity, _f_list(values))
+                    return func.func(parent, *values)
+                continuation = Continuation(env, func, parent)
+                return continuation, _encycle(static.a, static.c, _f_list(values))
+        j = i if order is None else order[i]
+        expr = values[j]
+        if type(expr) is str:
+            value = _lookup(env, expr)
+            if value is _UNBOUND:
+                break
+            values[j] = value
+        elif isinstance(expr, Pair):
+            break
+        i += 1
+    static.i = i
     continuation = Continuation(static, _step_call_evcar, parent)
-    continuation._call_info = ["eval combiner arg", eval_arg.car.car]
+    continuation._call_info = ["eval combiner arg", expr]
     continuation = Continuation(env, _step_eval, continuation)
-    return continuation, eval_arg.car.car
+    return continuation, expr
 
-def _equal(a, b, seen=None):
-    if seen is None:
-        seen = set()
-    if type(a) != type(b):
-        return False
-    if type(a) in (str, int, float, bytes, Character):
-        return a == b
-    if type(a) is not Pair:
-        return a is b
-    key = (id(a), id(b))
-    if key in seen:
-        return True
-    seen.add(key)
-    if not _equal(a.car, b.car, seen=seen):
-        return False
-    if not _equal(a.cdr, b.cdr, seen=seen):
-        return False
-    seen.discard(key)
+# Pairs that were already compared are merged into the same set (union-find
+# over ids), so shared and cyclic structure is only walked once
+def _equal(a, b):
+    parents = {}  # id of pair -> id of a pair in the same set
+    sizes = {}  # id of root pair -> size of its set
+    todo = [(a, b)]
+    while todo:
+        a, b = todo.pop()
+        if not isinstance(a, Pair) or not isinstance(b, Pair):
+            if type(a) != type(b):
+                return False
+            if type(a) in (str, int, float, bytes, Character):
+                if a != b:
+                    return False
+            elif a is not b:
+                return False
+            continue
+        if a is b:
+            continue
+        root_a = _equal_find(parents, id(a))
+        root_b = _equal_find(parents, id(b))
+        if root_a == root_b:
+            continue  # already assumed equal
+        size_a = sizes.get(root_a, 1)
+        size_b = sizes.get(root_b, 1)
+        if size_a < size_b:
+            root_a, root_b = root_b, root_a
+        parents[root_b] = root_a
+        sizes[root_a] = size_a + size_b
+        todo.append((a.cdr, b.cdr))
+        todo.append((a.car, b.car))
     return True
 
+def _equal_find(parents, key):
+    root = key
+    while root in parents:
+        root = parents[root]
+    while key != root:  # point the path straight at the root
+        parents[key], key = root, parents[key]
+    return root
+
 def _define(env, name, expr, seen=None):
     if seen is None:
         seen = set()
-    if type(name) is Pair:
+    if isinstance(name, Pair):
         assert id(name) not in seen, "parameter tree consists of self-referencing pairs"
         seen.add(id(name))
-        assert type(expr) is Pair, "parameter tree could not be matched to value"
+        assert isinstance(expr, Pair), "parameter tree could not be matched to value"
         _define(env, name.car, expr.car, seen)
         _define(env, name.cdr, expr.cdr, seen)
         seen.discard(id(name))
@@ -386,303 +725,459 @@ def _define(env, name, expr, seen=None):
     elif type(name) is str:
         assert name not in seen, "parameter tree symbol occurs more than once"
         seen.add(name)
+        if env.bindings is None:
+            index = env.localmap.indexes.get(name)
+            if index is not None:
+                env.storage[index] = expr
+                return
+            if env.watched:
+                _invalidate_lookups(name)
+            env.localmap = env.localmap.new_localmap_with(name)
+            env.storage.append(expr)
+            return
+        if env.watched and name not in env.bindings:
+            _invalidate_lookups(name)
         env.bindings[name] = expr
     else:
         assert False, "parameter tree consists of invalid types"
 
 def _f_binds(static, env, parent):
-    expr = static.bindings["name"]
+    expr = static.name
     # Note: same logic as in _step_eval
     while env is not Environment.ROOT:
-        if expr in env.bindings:
+        if _lookup_local(env, expr) is not _UNBOUND:
             return parent, True
         env = env.parent
     return parent, False
 
 # modify environment according to name
 def _f_define(static, expr, parent):
-    env = static.bindings["env"]
-    name = static.bindings["name"]
+    env = static.env
+    name = static.name
     _define(env, name, expr)
     return parent, None
 
-def _f_if(env, result, parent):
+def _f_if(static, result, parent):
     if result is True:
-        on_true = env.bindings["on_true"]
-        env = env.bindings["env"]
-        return Continuation(env, _step_eval, parent), on_true
+        return Continuation(static.env, _step_eval, parent), static.on_true
     if result is False:
-        on_false = env.bindings["on_false"]
-        env = env.bindings["env"]
-        return Continuation(env, _step_eval, parent), on_false
+        return Continuation(static.env, _step_eval, parent), static.on_false
     return _f_error(parent, b"expected #t or #f as condition for $if, got: ", result)
 
-def _f_force_normal_pass(env, value, parent):
-    return env.bindings["continuation"], value
+def _f_force_normal_pass(static, value, parent):
+    return static.continuation, value
 
 def _f_abnormal_pass(env, _value, parent):
     source = parent
     destination = env.parent.bindings["continuation"]
-    def _get_continuation_depth(cont):
-        depth = 0
-        while cont is not Continuation.ROOT:
-            cont = cont.parent
-            depth += 1
-        return depth
-    def _continuation_contains(parent, child):
-        while child is not Continuation.ROOT:
-            if child is parent:
-                return True
-            child = child.parent
-        return child is parent
-    def _apply_interceptor(env, value, parent):
-        outer = env.bindings["outer"]
-        _, divert = _operative_continuation_to_applicative(Environment.ROOT, Pair(outer, ()), parent)
-        return Continuation(Environment({}, Environment.ROOT), env.bindings["interceptor"].func, parent), Pair(value, Pair(divert, ()))
-    # Get depth of source and destination continuation
-    source_depth = _get_continuation_depth(source)
-    destination_depth = _get_continuation_depth(destination)
+    value = _lookup_local(env, "value")
+    if source.guarded is None and destination.guarded is None:
+        return destination, value  # no guards to pass through
+    def _apply_interceptor(static, value, parent):
+        _, divert = _operative_continuation_to_applicative(parent, static.outer)
+        return Continuation(Environment({}, Environment.ROOT), static.interceptor.func, parent), MutablePair(value, MutablePair(divert, ()))
     # Move up on both source and destination until a common ancestor is found
+    source_passed = set()
+    destination_passed = set()
     source_curr = source
     destination_curr = destination
-    exit_interceptors = []
-    entry_interceptors = []
     while source_curr is not destination_curr:
-        if source_depth > destination_depth:
-            # Check exit guards
-            if hasattr(source_curr, "exit_guards"):
-                for selector, interceptor in source_curr.exit_guards:
-                    if _continuation_contains(selector, destination):
-                        exit_interceptors.append((source_curr, interceptor))
-                        break
+        if source_curr.depth > destination_curr.depth:
+            source_passed.add(source_curr)
             source_curr = source_curr.parent
-            source_depth -= 1
         else:
-            # Check entry guards
-            if hasattr(destination_curr, "entry_guards"):
-                for selector, interceptor in destination_curr.entry_guards:
-                    if _continuation_contains(selector, source):
-                        entry_interceptors.append((destination_curr, interceptor))
-                        break
+            destination_passed.add(destination_curr)
             destination_curr = destination_curr.parent
-            destination_depth -= 1
+    common = source_curr
+    common_ancestors = [common]  # continuations at depth common.depth - index
+    def _contains(selector, passed):
+        # whether selector is in passed or is the common ancestor or above it
+        if selector in passed:
+            return True
+        index = common.depth - selector.depth
+        if index < 0:
+            return False
+        while len(common_ancestors) <= index:
+            common_ancestors.append(common_ancestors[-1].parent)
+        return common_ancestors[index] is selector
+    # Check exit guards below the common ancestor on the source side
+    exit_interceptors = []
+    guarded = source.guarded
+    while guarded is not None and guarded.depth > common.depth:
+        if guarded.exit_guards is not None:
+            for selector, interceptor in guarded.exit_guards:
+                if _contains(selector, destination_passed):
+                    exit_interceptors.append((guarded, interceptor))
+                    break
+        guarded = guarded.parent.guarded
+    # Check entry guards below the common ancestor on the destination side
+    entry_interceptors = []
+    guarded = destination.guarded
+    while guarded is not None and guarded.depth > common.depth:
+        if guarded.entry_guards is not None:
+            for selector, interceptor in guarded.entry_guards:
+                if _contains(selector, source_passed):
+                    entry_interceptors.append((guarded, interceptor))
+                    break
+        guarded = guarded.parent.guarded
     # Setup interceptor chain
     next_cont = destination
     continuation = destination
     for cont, interceptor in entry_interceptors:
-        continuation = Continuation(Environment({"continuation": next_cont}, Environment.ROOT), _f_force_normal_pass, cont)
-        continuation = Continuation(Environment({"interceptor": interceptor, "outer": cont}, Environment.ROOT), _apply_interceptor, continuation)
+        continuation = Continuation(FForceNormalPassEnvironment(next_cont), _f_force_normal_pass, cont)
+        continuation = Continuation(FApplyInterceptorEnvironment(interceptor, cont), _apply_interceptor, continuation)
         next_cont = cont
     for cont, interceptor in exit_interceptors:
-        continuation = Continuation(Environment({"continuation": next_cont}, Environment.ROOT), _f_force_normal_pass, cont.parent)
-        continuation = Continuation(Environment({"interceptor": interceptor, "outer": cont.parent}, Environment.ROOT), _apply_interceptor, continuation)
+        continuation = Continuation(FForceNormalPassEnvironment(next_cont), _f_force_normal_pass, cont.parent)
+        continuation = Continuation(FApplyInterceptorEnvironment(interceptor, cont.parent), _apply_interceptor, continuation)
         next_cont = cont.parent
-    return continuation, env.bindings["value"]
+    return continuation, value
 
 def _f_encapsulate(env, _value, parent):
-    encap_arg = env.bindings["value"].car
+    encap_arg = _lookup_local(env, "value").car
     encap_obj = env.parent.bindings["encap_obj"]
     return parent, Encapsulation(encap_obj, encap_arg)
 
 def _f_check_encapsulation(env, _value, parent):
-    encap = env.bindings["value"].car
+    encap = _lookup_local(env, "value").car
     encap_obj = env.parent.bindings["encap_obj"]
     return parent, type(encap) is Encapsulation and encap.obj is encap_obj
 
 def _f_decapsulate(env, _value, parent):
-    encap = env.bindings["value"].car
+    encap = _lookup_local(env, "value").car
     encap_obj = env.parent.bindings["encap_obj"]
     if type(encap) is not Encapsulation or encap.obj is not encap_obj:
         return _f_error(parent, b"cannot decapsulate object", encap)
     return parent, encap.arg
 
 def _f_dynamic_binder(env, _value, parent):
-    value = env.bindings["value"].car
-    combiner = env.bindings["value"].cdr.car
+    value = _lookup_local(env, "value").car
+    combiner = _lookup_local(env, "value").cdr.car
     dynamic_obj = env.parent.bindings["dynamic_obj"]
     if type(combiner) is not Combiner:
         return _f_error(parent, b"second argument must be a combiner", combiner)
     continuation = Continuation(Environment.ROOT, _f_passthrough, parent)
-    continuation.dynamic_variables = {dynamic_obj: value}
+    continuation.dynamic_variables = {**(parent.dynamic_variables or {}), dynamic_obj: value}
     continuation = Continuation(Environment({}, Environment.ROOT), combiner.func, continuation)
     return continuation, ()
 
 def _f_dynamic_accessor(env, _value, parent):
     dynamic_obj = env.parent.bindings["dynamic_obj"]
-    continuation = parent
-    while continuation is not Continuation.ROOT:
-        if hasattr(continuation, "dynamic_variables"):
-            for key, value in continuation.dynamic_variables.items():
-                if key is dynamic_obj:
-                    return parent, value
-        continuation = continuation.parent
-    return _f_error(parent, b"no dynamic binding found")
+    dynamic_variables = parent.dynamic_variables
+    if dynamic_variables is None or dynamic_obj not in dynamic_variables:
+        return _f_error(parent, b"no dynamic binding found")
+    return parent, dynamic_variables[dynamic_obj]
 
 def _f_static_binder(env, _value, parent):
-    value = env.bindings["value"].car
-    environment = env.bindings["value"].cdr.car
+    value = _lookup_local(env, "value").car
+    environment = _lookup_local(env, "value").cdr.car
     static_obj = env.parent.bindings["static_obj"]
-    if type(environment) is not Environment:
+    if not isinstance(environment, Environment):
         return _f_error(parent, b"second argument must be an environment", environment)
     environment = Environment({}, environment)
-    environment.static_variables = {static_obj: value}
+    environment.static_variables = {**(environment.static_variables or {}), static_obj: value}
     return parent, environment
 
 def _f_static_accessor(env, _value, parent):
     static_obj = env.parent.bindings["static_obj"]
-    environment = env.bindings["dyn"]
-    while environment is not Environment.ROOT:
-        if hasattr(environment, "static_variables"):
-            for key, value in environment.static_variables.items():
-                if key is static_obj:
-                    return parent, value
-        environment = environment.parent
-    return _f_error(parent, b"no static binding found")
-
-def _f_sequence_inert(env, expr, parent):
-    seq_env = env.bindings["env"]
-    seq_exprs = env.bindings["exprs"]
+    static_variables = _lookup_local(env, "dyn").static_variables
+    if static_variables is None or static_obj not in static_variables:
+        return _f_error(parent, b"no static binding found")
+    return parent, static_variables[static_obj]
+
+def _f_sequence_inert(static, expr, parent):
+    seq_env = static.env
+    seq_exprs = static.exprs
     if seq_exprs == ():
         return parent, None
-    next_env = Environment({"env": seq_env, "exprs": seq_exprs.cdr}, Environment.ROOT)
+    next_env = FSequenceEnvironment(seq_env, seq_exprs.cdr)
     continuation = Continuation(next_env, _f_sequence_inert, parent)
     continuation._call_info = ["eval sequence inert", seq_exprs.car]  # non-tail call
     continuation = Continuation(seq_env, _step_eval, continuation)
     return continuation, seq_exprs.car
 
+def _f_sequence(static, _value, parent):
+    return _operative_sequence(static.env, static.exprs, parent)
+
+def _operative_sequence(env, expr, parent):
+    # ($sequence . exprs)
+    if expr == ():
+        return parent, None
+    if not isinstance(expr, Pair):
+        return _f_error(parent, b"$sequence expressions must be proper list, got: ", expr)
+    if expr.cdr == ():
+        return Continuation(env, _step_eval, parent), expr.car
+    next_env = FSequenceEnvironment(env, expr.cdr)
+    continuation = Continuation(next_env, _f_sequence, parent)
+    continuation._call_info = ["eval sequence", expr.car]  # non-tail call
+    continuation = Continuation(env, _step_eval, continuation)
+    return continuation, expr.car
+_SEQUENCE = Combiner(0, _operative_sequence)
+
+def _f_cond(static, result, parent):
+    if result is True:
+        return _operative_sequence(static.env, static.body, parent)
+    if result is False:
+        return _operative_cond(static.env, static.clauses, parent)
+    return _f_error(parent, b"expected #t or #f as condition for $cond, got: ", result)
+
+def _operative_cond(env, expr, parent):
+    # ($cond (test . body) ...)
+    if expr == ():
+        return _f_error(parent, b"no $cond clause matched")
+    if not isinstance(expr, Pair) or not isinstance(expr.car, Pair):
+        return _f_error(parent, b"$cond clauses must be proper list of (test . body), got: ", expr)
+    next_env = FCondEnvironment(env, expr.car.cdr, expr.cdr)
+    continuation = Continuation(next_env, _f_cond, parent)
+    continuation._call_info = ["cond test", expr.car.car]  # non-tail call
+    continuation = Continuation(env, _step_eval, continuation)
+    return continuation, expr.car.car
+
+# $and? stops at the first #f and $or? stops at the first #t
+def _f_and_or(static, result, parent):
+    if result is static.stop:
+        return parent, result
+    if type(result) is not bool:
+        return _f_error(parent, b"expected #t or #f as operand for $and? or $or?, got: ", result)
+    return _f_and_or_next(static.env, static.exprs, static.stop, parent)
+
+def _f_and_or_next(env, exprs, stop, parent):
+    if exprs == ():
+        return parent, not stop
+    if not isinstance(exprs, Pair):
+        return _f_error(parent, b"$and? and $or? operands must be proper list, got: ", exprs)
+    if exprs.cdr == ():
+        return Continuation(env, _step_eval, parent), exprs.car
+    next_env = FAndOrEnvironment(env, exprs.cdr, stop)
+    continuation = Continuation(next_env, _f_and_or, parent)
+    continuation._call_info = ["and or operand", exprs.car]  # non-tail call
+    continuation = Continuation(env, _step_eval, continuation)
+    return continuation, exprs.car
+
+def _operative_and(env, expr, parent):
+    return _f_and_or_next(env, expr, False, parent)
+
+def _operative_or(env, expr, parent):
+    return _f_and_or_next(env, expr, True, parent)
+
+def _operative_apply(env, expr, parent):
+    # (apply applicative args [environment])
+    p, n, a, c = _get_list_metrics(expr)
+    if n != 1 or p not in (2, 3):
+        return _f_error(parent, b"apply takes two or three arguments")
+    combiner = expr.car
+    if type(combiner) is not Combiner or combiner.num_wraps == 0:
+        return _f_error(parent, b"apply first argument must be an applicative, got: ", combiner)
+    environment = expr.cdr.cdr.car if p == 3 else Environment({}, Environment.ROOT)
+    if not isinstance(environment, Environment):
+        return _f_error(parent, b"apply environment must be type Environment, got: ", environment)
+    # Same as evaluating ((unwrap applicative) . args) in environment
+    unwrapped = Combiner(combiner.num_wraps - 1, combiner.func)
+    return _step_call_wrapped(StepWrappedEnvironment(environment, expr.cdr.car), unwrapped, parent)
+
 def _operative_binds(env, expr, parent):
-    next_env = Environment({"name": expr.cdr.car}, Environment.ROOT)
+    next_env = FBindsEnvironment(expr.cdr.car)
     continuation = Continuation(next_env, _f_binds, parent)
     continuation._call_info = ["binds env", expr.car]  # non-tail call
     continuation = Continuation(env, _step_eval, continuation)
     return continuation, expr.car
 
-def _operative_number(env, expr, parent):
-    return parent, type(expr.car) in (int, float)
+def _operative_number(parent, obj):
+    return parent, type(obj) in (int, float)
+
+def _operative_symbol(parent, obj):
+    return parent, type(obj) is str
 
-def _operative_symbol(env, expr, parent):
-    return parent, type(expr.car) is str
+def _operative_symbol_to_string(parent, symbol):
+    return parent, symbol.encode("latin-1")
 
-def _operative_symbol_to_string(env, expr, parent):
-    return parent, expr.car.encode("latin-1")
+def _operative_string_to_symbol(parent, string):
+    return parent, string.decode("latin-1")
 
-def _operative_string_to_symbol(env, expr, parent):
-    return parent, expr.car.decode("latin-1")
+def _operative_plus(parent, a, b):
+    return parent, a + b
 
-def _operative_plus(env, expr, parent):
-    return parent, expr.car + expr.cdr.car
+def _operative_lessequal(parent, a, b):
+    return parent, a <= b
 
-def _operative_lessequal(env, expr, parent):
-    return parent, expr.car <= expr.cdr.car
+# make an operative body from a list of expressions, evaluated like $sequence
+def _f_vau_body(exprs):
+    exprs = _f_copy_es(exprs, immutable=True)
+    if isinstance(exprs, Pair) and exprs.cdr == ():
+        return exprs.car
+    return ImmutablePair(_SEQUENCE, exprs)
 
 def _operative_vau(env, expr, parent):
-    # ($vau (envname name) body)
-    operative = Operative(env=env, envname=expr.car.car, name=expr.car.cdr.car, body=_f_copy_es(expr.cdr.car, immutable=True))
+    # ($vau (envname name) . body)
+    operative = Operative(env=env, envname=expr.car.car, name=expr.car.cdr.car, body=_f_vau_body(expr.cdr))
     return parent, Combiner(0, operative)
 
-def _operative_eval(env, expr, parent):
-    continuation = Continuation(expr.car, _step_eval, parent)
-    return continuation, expr.cdr.car
+def _operative_lambda(env, expr, parent):
+    # ($lambda name . body)
+    operative = Operative(env=env, envname=..., name=expr.car, body=_f_vau_body(expr.cdr))
+    return parent, Combiner(1, operative)
+
+def _operative_eval(parent, env, expr):
+    continuation = Continuation(env, _step_eval, parent)
+    return continuation, expr
 
-def _operative_operative(env, expr, parent):
-    return parent, type(expr.car) is Combiner and expr.car.num_wraps <= 0
+def _operative_operative(parent, obj):
+    return parent, type(obj) is Combiner and obj.num_wraps <= 0
 
-def _operative_applicative(env, expr, parent):
-    return parent, type(expr.car) is Combiner and expr.car.num_wraps > 0
+def _operative_applicative(parent, obj):
+    return parent, type(obj) is Combiner and obj.num_wraps > 0
 
-def _operative_wrap(env, expr, parent):
-    return parent, Combiner(expr.car.num_wraps + 1, expr.car.func)
+def _operative_wrap(parent, combiner):
+    return parent, Combiner(combiner.num_wraps + 1, combiner.func)
 
-def _operative_unwrap(env, expr, parent):
-    return parent, Combiner(expr.car.num_wraps - 1, expr.car.func)
+def _operative_unwrap(parent, combiner):
+    return parent, Combiner(combiner.num_wraps - 1, combiner.func)
 
 def _operative_define(env, expr, parent):
-    next_env = Environment({"env": env, "name": expr.car}, Environment.ROOT)
+    next_env = FDefineEnvironment(env, expr.car)
     continuation = Continuation(next_env, _f_define, parent)
     continuation._call_info = ["define value", expr.cdr.car]  # non-tail call
     continuation = Continuation(env, _step_eval, continuation)
     return continuation, expr.cdr.car
 
-def _operative_car(env, expr, parent):
-    return parent, expr.car.car
+def _operative_car(parent, pair):
+    return parent, pair.car
 
-def _operative_cdr(env, expr, parent):
-    return parent, expr.car.cdr
+def _operative_cdr(parent, pair):
+    return parent, pair.cdr
 
-def _operative_cons(env, expr, parent):
-    return parent, Pair(expr.car, expr.cdr.car)
+def _operative_cons(parent, car, cdr):
+    return parent, MutablePair(car, cdr)
 
-def _operative_set_car(env, expr, parent):
-    if expr.car.immutable:
+def _operative_set_car(parent, pair, car):
+    if type(pair) is not MutablePair:
         return _f_error(parent, b"pair must be mutable")
-    expr.car.car = expr.cdr.car
+    pair.car = car
     return parent, None
 
-def _operative_set_cdr(env, expr, parent):
-    if expr.car.immutable:
+def _operative_set_cdr(parent, pair, cdr):
+    if type(pair) is not MutablePair:
         return _f_error(parent, b"pair must be mutable")
-    expr.car.cdr = expr.cdr.car
+    pair.cdr = cdr
     return parent, None
 
-def _operative_copy_es(env, expr, parent):
-    return parent, _f_copy_es(expr.car)
+def _operative_copy_es(parent, obj):
+    return parent, _f_copy_es(obj)
 
-def _operative_copy_es_immutable(env, expr, parent):
-    return parent, _f_copy_es(expr.car, immutable=True)
+def _operative_copy_es_immutable(parent, obj):
+    return parent, _f_copy_es(obj, immutable=True)
 
 # load a file in an environment
 def _operative_load(env, expr, parent):
-    filename = expr.car
+    return _f_load(env, expr.car, parent)
+
+# evaluate the expressions in a file in env, returning #inert
+def _f_load(env, filename, parent):
     filename_str = filename.decode("utf-8")
-    with open(filename_str) as file:
-        text = file.read()
-    tokens = tokenize(text)
     try:
-        exprs = parse(tokens, filename=filename_str)
+        exprs = _parse_file(filename_str)
     except ValueError as e:
         return _f_error(parent, b"error while loading file", filename, repr(e).encode("utf-8"))
     args = ()
-    for expr in reversed(exprs): args = Pair(expr, args)
-    next_env = Environment({"env": env, "exprs": args}, Environment.ROOT)
+    for expr in reversed(exprs): args = MutablePair(expr, args)
+    next_env = FSequenceEnvironment(env, args)
     continuation = Continuation(next_env, _f_sequence_inert, parent)
     return continuation, None
 
+# Modules are files loaded by require into their own child of the standard
+# environment. Each is evaluated once per process, and later requires of the
+# same resolved path return the same environment until it is reloaded or
+# forgotten. A module is only cached once it finishes loading, and requiring
+# it again while it is still loading (from within its own load) is an error.
+_MODULES = {}  # resolved path -> environment of module
+_MODULES_LOADING = {}  # resolved path -> continuation that finishes its load
+_module_stdlib = {}  # keyword arguments to _make_standard_environment
+
+def _module_path(filename):
+    import os
+    return os.path.realpath(filename.decode("utf-8"))
+
+# forget every module so that the next require of each one loads it again
+def forget_modules():
+    _MODULES.clear()
+
+# make modules children of the standard environment made with these options
+# (main passes its own, such as --derived-stdlib)
+def set_module_stdlib(*, derived=False, snapshot=None):
+    global _module_stdlib
+    _module_stdlib = {"derived": derived, "snapshot": snapshot}
+
+def _operative_require(parent, filename):
+    if type(filename) is not bytes:
+        return _f_error(parent, b"expected string as module file name, got: ", filename)
+    module_env = _MODULES.get(_module_path(filename))
+    if module_env is not None:
+        return parent, module_env
+    return _f_require(filename, parent)
+
+def _operative_reload_module(parent, filename):
+    if type(filename) is not bytes:
+        return _f_error(parent, b"expected string as module file name, got: ", filename)
+    return _f_require(filename, parent)
+
+def _operative_forget_module(parent, filename):
+    if type(filename) is not bytes:
+        return _f_error(parent, b"expected string as module file name, got: ", filename)
+    return parent, _MODULES.pop(_module_path(filename), None) is not None
+
+def _f_require(filename, parent):
+    path = _module_path(filename)
+    loading = _MODULES_LOADING.get(path)
+    if loading is not None:
+        # Check if the load is still running (it may have been escaped from)
+        continuation = parent
+        while continuation.depth > loading.depth:
+            continuation = continuation.parent
+        if continuation is loading:
+            return _f_error(parent, b"module required while it is loading", filename)
+    module_env = _make_standard_environment(**_module_stdlib)
+    continuation = Continuation(FRequireEnvironment(module_env, path), _f_finish_require, parent)
+    _MODULES_LOADING[path] = continuation
+    return _f_load(module_env, filename, continuation)
+
+def _f_finish_require(static, _value, parent):
+    loading = _MODULES_LOADING.get(static.path)
+    if loading is not None and loading.env is static:
+        del _MODULES_LOADING[static.path]
+    _MODULES[static.path] = static.env
+    return parent, static.env
+
 def _operative_if(env, expr, parent):
-    next_env = Environment({"env": env, "on_true": expr.cdr.car, "on_false": expr.cdr.cdr.car}, Environment.ROOT)
+    next_env = FIfEnvironment(env, expr.cdr.car, expr.cdr.cdr.car)
     continuation = Continuation(next_env, _f_if, parent)
     continuation._call_info = ["if condition", expr.car]  # non-tail call
     continuation = Continuation(env, _step_eval, continuation)
     return continuation, expr.car
 
-def _operative_eq(env, expr, parent):
-    return (parent,
-        expr.car == expr.cdr.car
-        if type(expr.car) is type(expr.cdr.car) in (str, int, float, bytes, Character)
-        else expr.car is expr.cdr.car
-    )
+def _operative_eq(parent, a, b):
+    return parent, a == b if type(a) is type(b) in (str, int, float, bytes, Character) else a is b
 
-def _operative_equal(env, expr, parent):
-    return parent, _equal(expr.car, expr.cdr.car)
+def _operative_equal(parent, a, b):
+    return parent, _equal(a, b)
 
-def _operative_pair(env, expr, parent):
-    return parent, type(expr.car) is Pair
+def _operative_pair(parent, obj):
+    return parent, isinstance(obj, Pair)
 
-def _operative_environment(env, expr, parent):
-    return parent, type(expr.car) is Environment
+def _operative_environment(parent, obj):
+    return parent, isinstance(obj, Environment)
 
 def _operative_make_environment(_env, expr, parent):
     parent_env = expr.car if expr != () else Environment.ROOT
     return parent, Environment({}, parent_env)
 
-def _operative_continuation(env, expr, parent):
-    return parent, type(expr.car) is Continuation
+def _operative_continuation(parent, obj):
+    return parent, type(obj) is Continuation
 
-def _operative_continuation_to_applicative(_env, expr, parent):
-    continuation = expr.car
+def _operative_continuation_to_applicative(parent, continuation):
     if type(continuation) is not Continuation:
         return _f_error(parent, b"continuation must be type Continuation, got: ", continuation)
     env = Environment({"continuation": continuation}, Environment.ROOT)
-    operative = Operative(env, "_", "value", Pair(Combiner(0, _f_abnormal_pass), ()))
+    operative = Operative(env, "_", "value", ImmutablePair(Combiner(0, _f_abnormal_pass), ()))
     return parent, Combiner(1, operative)
 
 def _operative_call_cc(env, expr, parent):
@@ -690,7 +1185,7 @@ def _operative_call_cc(env, expr, parent):
     if type(combiner) is not Combiner:
         return _f_error(parent, b"argument must be type Combiner, got: ", combiner)
     continuation = Continuation(env, combiner.func, parent)
-    return continuation, Pair(parent, ())
+    return continuation, MutablePair(parent, ())
 
 def _operative_extend_continuation(env, expr, parent):
     continuation = expr.car
@@ -701,14 +1196,13 @@ def _operative_extend_continuation(env, expr, parent):
     new_continuation = Continuation(environment, applicative.func, continuation)
     return parent, new_continuation
 
-def _operative_guard_continuation(env, expr, parent):
-    entry_guards = expr.car
-    continuation = expr.cdr.car
-    exit_guards = expr.cdr.cdr.car
+def _operative_guard_continuation(parent, entry_guards, continuation, exit_guards):
     outer = Continuation(Environment.ROOT, _f_passthrough, continuation)
     outer.entry_guards = []
+    outer.guarded = outer
     inner = Continuation(Environment.ROOT, _f_passthrough, outer)
     inner.exit_guards = []
+    inner.guarded = inner
     for _ in range(_get_list_metrics(entry_guards)[0]):
         selector, interceptor = entry_guards.car.car, entry_guards.car.cdr.car
         if type(selector) is not Continuation:
@@ -731,299 +1225,793 @@ def _operative_guard_continuation(env, expr, parent):
         exit_guards = exit_guards.cdr
     return parent, inner
 
-def _operative_make_encapsulation_type(env, expr, parent):
+def _operative_make_encapsulation_type(parent):
     encap_obj = object()
     encap_env = Environment({"encap_obj": encap_obj}, Environment.ROOT)
-    encapsulator = Combiner(1, Operative(encap_env, "_", "value", Pair(Combiner(0, _f_encapsulate), ())))
-    predicate = Combiner(1, Operative(encap_env, "_", "value", Pair(Combiner(0, _f_check_encapsulation), ())))
-    decapsulator = Combiner(1, Operative(encap_env, "_", "value", Pair(Combiner(0, _f_decapsulate), ())))
-    return parent, Pair(encapsulator, Pair(predicate, Pair(decapsulator, ())))
+    encapsulator = Combiner(1, Operative(encap_env, "_", "value", ImmutablePair(Combiner(0, _f_encapsulate), ())))
+    predicate = Combiner(1, Operative(encap_env, "_", "value", ImmutablePair(Combiner(0, _f_check_encapsulation), ())))
+    decapsulator = Combiner(1, Operative(encap_env, "_", "value", ImmutablePair(Combiner(0, _f_decapsulate), ())))
+    return parent, MutablePair(encapsulator, MutablePair(predicate, MutablePair(decapsulator, ())))
 
-def _operative_make_keyed_dynamic_variable(env, expr, parent):
+def _operative_make_keyed_dynamic_variable(parent):
     dynamic_obj = object()
     dynamic_env = Environment({"dynamic_obj": dynamic_obj}, Environment.ROOT)
-    binder = Combiner(1, Operative(dynamic_env, "_", "value", Pair(Combiner(0, _f_dynamic_binder), ())))
-    accessor = Combiner(1, Operative(dynamic_env, "_", "value", Pair(Combiner(0, _f_dynamic_accessor), ())))
-    return parent, Pair(binder, Pair(accessor, ()))
+    binder = Combiner(1, Operative(dynamic_env, "_", "value", ImmutablePair(Combiner(0, _f_dynamic_binder), ())))
+    accessor = Combiner(1, Operative(dynamic_env, "_", "value", ImmutablePair(Combiner(0, _f_dynamic_accessor), ())))
+    return parent, MutablePair(binder, MutablePair(accessor, ()))
 
-def _operative_make_keyed_static_variable(env, expr, parent):
+def _operative_make_keyed_static_variable(parent):
     static_obj = object()
     static_env = Environment({"static_obj": static_obj}, Environment.ROOT)
-    binder = Combiner(1, Operative(static_env, "_", "value", Pair(Combiner(0, _f_static_binder), ())))
-    accessor = Combiner(1, Operative(static_env, "dyn", "value", Pair(Combiner(0, _f_static_accessor), ())))
-    return parent, Pair(binder, Pair(accessor, ()))
+    binder = Combiner(1, Operative(static_env, "_", "value", ImmutablePair(Combiner(0, _f_static_binder), ())))
+    accessor = Combiner(1, Operative(static_env, "dyn", "value", ImmutablePair(Combiner(0, _f_static_accessor), ())))
+    return parent, MutablePair(binder, MutablePair(accessor, ()))
 
-def _operative_char(env, expr, parent):
-    return parent, type(expr.car) is Character
+def _operative_char(parent, obj):
+    return parent, type(obj) is Character
 
-def _operative_read_char(env, expr, parent):
+def _operative_read_char(parent):
     import sys
     char = sys.stdin.buffer.read(1)
     if not char:
         return _f_error(parent, b"end of file reached")
-    return parent, Character(char[0])
+    return parent, _CHARACTERS[char[0]]
 
-def _operative_write_char(env, expr, parent):
+def _operative_write_char(parent, char):
     import sys
-    sys.stdout.buffer.write(bytes([expr.car.char]))
+    sys.stdout.buffer.write(bytes([char.char]))
     return parent, None
 
-def _operative_string(env, expr, parent):
-    return parent, type(expr.car) is bytes
+def _operative_string(parent, obj):
+    return parent, type(obj) is bytes
 
-def _operative_list_to_string(env, expr, parent):
-    chars = expr.car
-    p, n, a, c = _get_list_metrics(chars)
-    if n == 0 or c > 0:
-        return _f_error(parent, b"list->string argument must be finite list, got: ", chars)
+def _operative_list_to_string(parent, chars):
+    # Collect the characters in one pass, moving a second pointer at half
+    # speed to find cycles (like Floyd's algorithm)
+    orig = chars
     string = bytearray()
-    for _ in range(a):
-        string.append(chars.car.char)
-        chars = chars.cdr
+    append = string.append
+    tortoise = chars
+    try:
+        while isinstance(chars, Pair):
+            append(chars.car.char)
+            chars = chars.cdr
+            if not isinstance(chars, Pair):
+                break
+            append(chars.car.char)
+            chars = chars.cdr
+            tortoise = tortoise.cdr
+            if tortoise is chars:
+                break
+    except AttributeError:
+        return _f_error(parent, b"list->string argument must be a list of characters, got: ", orig)
+    if chars != ():
+        return _f_error(parent, b"list->string argument must be finite list, got: ", orig)
     return parent, bytes(string)
 
-def _operative_string_to_list(env, expr, parent):
-    string = expr.car
-    if not len(string):
-        return parent, ()
-    chars = Pair(Character(string[0]), ())
-    curr = chars
-    for char in memoryview(string[1:]):
-        curr.cdr = curr = Pair(Character(char), ())
+def _operative_string_to_list(parent, string):
+    chars = ()
+    for char in reversed(string):
+        chars = MutablePair(_CHARACTERS[char], chars)
     return parent, chars
 
 _DEFAULT_ENV = {
     "$binds?": Combiner(0, _operative_binds),  # Useful for feature testing
-    "number?": Combiner(1, _operative_number),
-    "symbol?": Combiner(1, _operative_symbol),
-    "symbol->string": Combiner(1, _operative_symbol_to_string),
-    "string->symbol": Combiner(1, _operative_string_to_symbol),
-    "+": Combiner(1, _operative_plus),
-    "<=?": Combiner(1, _operative_lessequal),
+    "number?": _primitive(1, _operative_number),
+    "symbol?": _primitive(1, _operative_symbol),
+    "symbol->string": _primitive(1, _operative_symbol_to_string),
+    "string->symbol": _primitive(1, _operative_string_to_symbol),
+    "+": _primitive(2, _operative_plus),
+    "<=?": _primitive(2, _operative_lessequal),
     "$vau": Combiner(0, _operative_vau),
-    "eval": Combiner(1, _operative_eval),
-    "operative?": Combiner(1, _operative_operative),
-    "applicative?": Combiner(1, _operative_applicative),
-    "wrap": Combiner(1, _operative_wrap),
-    "unwrap": Combiner(1, _operative_unwrap),
+    "$lambda": Combiner(0, _operative_lambda),
+    "$sequence": _SEQUENCE,
+    "$cond": Combiner(0, _operative_cond),
+    "$and?": Combiner(0, _operative_and),
+    "$or?": Combiner(0, _operative_or),
+    "apply": Combiner(1, _operative_apply),
+    "eval": _primitive(2, _operative_eval),
+    "operative?": _primitive(1, _operative_operative),
+    "applicative?": _primitive(1, _operative_applicative),
+    "wrap": _primitive(1, _operative_wrap),
+    "unwrap": _primitive(1, _operative_unwrap),
     "$define!": Combiner(0, _operative_define),
-    "car": Combiner(1, _operative_car),
-    "cdr": Combiner(1, _operative_cdr),
-    "cons": Combiner(1, _operative_cons),
-    "set-car!": Combiner(1, _operative_set_car),
-    "set-cdr!": Combiner(1, _operative_set_cdr),
-    "copy-es": Combiner(1, _operative_copy_es),
-    "copy-es-immutable": Combiner(1, _operative_copy_es_immutable),
+    "car": _primitive(1, _operative_car),
+    "cdr": _primitive(1, _operative_cdr),
+    "cons": _primitive(2, _operative_cons),
+    "set-car!": _primitive(2, _operative_set_car),
+    "set-cdr!": _primitive(2, _operative_set_cdr),
+    "copy-es": _primitive(1, _operative_copy_es),
+    "copy-es-immutable": _primitive(1, _operative_copy_es_immutable),
     "load": Combiner(1, _operative_load),
+    "require": _primitive(1, _operative_require),
+    "reload-module": _primitive(1, _operative_reload_module),
+    "forget-module": _primitive(1, _operative_forget_module),
     "$if": Combiner(0, _operative_if),
-    "eq?": Combiner(1, _operative_eq),
-    "equal?": Combiner(1, _operative_equal),
-    "pair?": Combiner(1, _operative_pair),
-    "environment?": Combiner(1, _operative_environment),
+    "eq?": _primitive(2, _operative_eq),
+    "equal?": _primitive(2, _operative_equal),
+    "pair?": _primitive(1, _operative_pair),
+    "environment?": _primitive(1, _operative_environment),
     "make-environment": Combiner(1, _operative_make_environment),
-    "continuation?": Combiner(1, _operative_continuation),
-    "continuation->applicative": Combiner(1, _operative_continuation_to_applicative),
+    "continuation?": _primitive(1, _operative_continuation),
+    "continuation->applicative": _primitive(1, _operative_continuation_to_applicative),
     "call/cc": Combiner(1, _operative_call_cc),
     "extend-continuation": Combiner(1, _operative_extend_continuation),
-    "guard-continuation": Combiner(1, _operative_guard_continuation),
+    "guard-continuation": _primitive(3, _operative_guard_continuation),
     "error-continuation": Continuation.ERROR,
     "root-continuation": Continuation.ROOT,
-    "make-encapsulation-type": Combiner(1, _operative_make_encapsulation_type),
-    "make-keyed-dynamic-variable": Combiner(1, _operative_make_keyed_dynamic_variable),
-    "make-keyed-static-variable": Combiner(1, _operative_make_keyed_static_variable),
-    "char?": Combiner(1, _operative_char),
-    "read-char": Combiner(1, _operative_read_char),
-    "write-char": Combiner(1, _operative_write_char),
-    "string?": Combiner(1, _operative_string),
-    "list->string": Combiner(1, _operative_list_to_string),
-    "string->list": Combiner(1, _operative_string_to_list),
+    "make-encapsulation-type": _primitive(0, _operative_make_encapsulation_type),
+    "make-keyed-dynamic-variable": _primitive(0, _operative_make_keyed_dynamic_variable),
+    "make-keyed-static-variable": _primitive(0, _operative_make_keyed_static_variable),
+    "char?": _primitive(1, _operative_char),
+    "read-char": _primitive(0, _operative_read_char),
+    "write-char": _primitive(1, _operative_write_char),
+    "string?": _primitive(1, _operative_string),
+    "list->string": _primitive(1, _operative_list_to_string),
+    "string->list": _primitive(1, _operative_string_to_list),
 }
 
+# Immutable code can never change after it is created, so each immutable
+# combination is compiled into a Python closure the first time it is evaluated.
+# The closure is cached on the pair, which lets every operative made from the
+# same body share it. A compiled node has the same signature as a step function
+# and returns what _step_combination would, but it specializes on the combiner
+# its operator evaluates to:
+#
+# - $if with a simple condition picks its branch directly
+# - other primitive operatives are called directly with the operands
+# - user operatives go through the trampoline as usual
+# - applicatives whose arguments are all simple get them evaluated directly
+#   (and passed positionally to fixed arity primitives)
+#
+# A simple expression is a symbol, a constant, or a call to one of
+# _PURE_PRIMITIVES with simple arguments. These have no side effects, so they
+# can be evaluated without continuations (in any order) and evaluated again
+# by _step_combination if a guard fails, such as when a symbol is unbound, an
+# operator is redefined to something else, or a primitive reports an error or
+# raises (so that the error comes with the frame of its own combination).
+
+# Primitives that only compute a value from their arguments. Some of them (like
+# cons and wrap) allocate new objects, which is allowed because simple
+# expressions are never folded into constants: each evaluation calls the
+# primitive again and gets its own object, and objects made by an attempt
+# that is abandoned are unreachable, so the sharing of one allocation across
+# evaluations can't be observed.
+_PURE_PRIMITIVES = frozenset([
+    _operative_number, _operative_symbol, _operative_symbol_to_string,
+    _operative_string_to_symbol, _operative_plus, _operative_lessequal,
+    _operative_operative, _operative_applicative, _operative_wrap,
+    _operative_unwrap, _operative_car, _operative_cdr, _operative_cons,
+    _operative_copy_es, _operative_copy_es_immutable, _operative_eq,
+    _operative_equal, _operative_pair, _operative_environment,
+    _operative_continuation, _operative_char, _operative_string,
+    _operative_list_to_string, _operative_string_to_list,
+])
+_NO_VALUE = object()  # returned by a value function when a guard fails
+_UNCOMPILED = object()  # placeholder for parts compiled on first use
+_MAX_VALUE_DEPTH = 8  # limits nesting (and cycles) of simple expressions
+_SYNC_CONTINUATION = Continuation(Environment.ROOT, _f_passthrough, Continuation.ROOT)
+
+# Symbol lookups in compiled code use a cache per site. A site first checks
+# the environment it is evaluated in (usually a fresh call environment), then
+# remembers where the lookup resolved to starting from the parent (usually the
+# static environment of an operative). Every environment passed on the way is
+# marked as watched, and adding a new name to a watched environment bumps the
+# epoch of that name, invalidating the caches of sites looking it up (so that
+# a REPL or module that keeps defining new names doesn't invalidate lookups of
+# other names). Changing the value of an existing binding needs no
+# invalidation because the cache keeps the bindings dict (or storage list and
+# index) rather than the value. This keeps lookups of standard names constant
+# time no matter how deeply the environments are nested.
+_LOOKUP_EPOCHS = {}  # name -> [epoch] shared by the sites looking it up
+
+def _invalidate_lookups(name):
+    epoch = _LOOKUP_EPOCHS.get(name)
+    if epoch is not None:
+        epoch[0] += 1
+
+def _compile_lookup(name):
+    epoch = _LOOKUP_EPOCHS.setdefault(name, [0])
+    cached_parent = None
+    cached_bindings = None  # bindings dict or storage list
+    cached_key = None  # name or index
+    cached_epoch = -1
+    def symbol_value(env):
+        nonlocal cached_parent, cached_bindings, cached_key, cached_epoch
+        bindings = env.bindings
+        if bindings is None:
+            index = env.localmap.indexes.get(name)
+            if index is not None:
+                return env.storage[index]
+        elif name in bindings:
+            return bindings[name]
+        parent = env.parent
+        if parent is cached_parent and cached_epoch == epoch[0]:
+            return cached_bindings[cached_key]
+        # Note: same logic as in _step_eval
+        env = parent
+        while env is not Environment.ROOT:
+            bindings = env.bindings
+            if bindings is None:
+                index = env.localmap.indexes.get(name)
+                if index is not None:
+                    bindings, key = env.storage, index
+            elif name in bindings:
+                key = name
+            else:
+                bindings = None
+            if bindings is not None:
+                cached_parent = parent
+                cached_bindings = bindings
+                cached_key = key
+                cached_epoch = epoch[0]
+                return bindings[key]
+            env.watched = True
+            env = env.parent
+        return _NO_VALUE
+    return symbol_value
+
+# return a function from env to the value of expr, or None if not simple
+def _compile_value(expr, depth=0):
+    if type(expr) is str:
+        return _compile_lookup(expr)
+    if not isinstance(expr, Pair):
+        return lambda env: expr
+    if type(expr) is not ImmutablePair or depth >= _MAX_VALUE_DEPTH or isinstance(expr.car, Pair):
+        return None
+    operator_value = _compile_value(expr.car, depth + 1)
+    args_value = _compile_args_value(expr.cdr, depth + 1)
+    if args_value is None:
+        return None
+    arity = _get_list_metrics(expr.cdr)[0]
+    def call_value(env):
+        combiner = operator_value(env)
+        if type(combiner) is not Combiner or combiner.num_wraps != 1:
+            return _NO_VALUE
+        func = combiner.func
+        if type(func) is not Primitive or func.func not in _PURE_PRIMITIVES or func.arity != arity:
+            return _NO_VALUE
+        values = args_value(env)
+        if values is _NO_VALUE:
+            return _NO_VALUE
+        try:
+            continuation, value = func.func(_SYNC_CONTINUATION, *values)
+        except Exception:
+            # Let _step_combination raise it again from its own frame
+            return _NO_VALUE
+        if continuation is not _SYNC_CONTINUATION:
+            return _NO_VALUE  # primitive reported an error
+        return value
+    return call_value
+
+# return a function from env to a Python list of argument values, or None if
+# any argument is not simple
+def _compile_args_value(args, depth=0):
+    p, n, a, c = _get_list_metrics(args)
+    if n == 0:
+        return None
+    arg_values = []
+    for _ in range(p):
+        arg_value = _compile_value(args.car, depth)
+        if arg_value is None:
+            return None
+        arg_values.append(arg_value)
+        args = args.cdr
+    def args_value(env):
+        values = []
+        for arg_value in arg_values:
+            value = arg_value(env)
+            if value is _NO_VALUE:
+                return _NO_VALUE
+            values.append(value)
+        return values
+    return args_value
+
+# return (condition value function, on_true, on_false) or None. Branches that
+# are not combinations are replaced by their value functions.
+def _compile_if(operands):
+    p, n, a, c = _get_list_metrics(operands)
+    if p != 3 or n != 1:
+        return None
+    condition_value = _compile_value(operands.car)
+    if condition_value is None:
+        return None
+    on_true, on_false = operands.cdr.car, operands.cdr.cdr.car
+    if not isinstance(on_true, Pair):
+        on_true = _compile_value(on_true)
+    if not isinstance(on_false, Pair):
+        on_false = _compile_value(on_false)
+    return condition_value, on_true, on_false
+
+# compile an immutable combination into a node
+def _compile(expr):
+    operands = expr.cdr
+    operator_value = _compile_value(expr.car)
+    if operator_value is None:
+        def generic_node(env, _value, parent):
+            return _step_combination(env, expr, parent)
+        return generic_node
+    args_value = if_parts = _UNCOMPILED
+    def node(env, _value, parent):
+        nonlocal args_value, if_parts
+        combiner = operator_value(env)
+        if type(combiner) is not Combiner:
+            return _step_combination(env, expr, parent)
+        func = combiner.func
+        if combiner.num_wraps == 0:
+            if func is _operative_if:
+                if if_parts is _UNCOMPILED:
+                    if_parts = _compile_if(operands)
+                if if_parts is not None:
+                    condition_value, on_true, on_false = if_parts
+                    result = condition_value(env)
+                    if result is True:
+                        branch = on_true
+                    elif result is False:
+                        branch = on_false
+                    else:
+                        return func(env, operands, parent)
+                    if isinstance(branch, Pair):
+                        return Continuation(env, _step_eval, parent), branch
+                    value = branch(env)
+                    if value is _NO_VALUE:
+                        # report the unbound symbol
+                        branch = operands.cdr.car if result else operands.cdr.cdr.car
+                        return _step_eval(env, branch, parent)
+                    return parent, value
+            if type(func) is Operative:
+                return Continuation(env, func, parent), operands
+            return func(env, operands, parent)
+        if combiner.num_wraps == 1 and _argument_order is None:
+            if args_value is _UNCOMPILED:
+                args_value = _compile_args_value(operands)
+            if args_value is not None:
+                values = args_value(env)
+                if values is not _NO_VALUE:
+                    if type(func) is Primitive and len(values) == func.arity:
+                        return func.func(parent, *values)
+                    if type(func) is Operative:
+                        return Continuation(env, func, parent), _f_list(values)
+                    return func(env, _f_list(values), parent)
+        return _step_call_wrapped(StepWrappedEnvironment(env, operands), combiner, parent)
+    return node
+
 def tokenize(text):
     return text.encode("utf-8")
 
 def parse(tokens, filename="\x00parse"):
+    import io
     exprs = []
-    chars = (tokens[i:i+1] for i in range(len(tokens)+1))
-    reader = _Reader(lambda: next(chars), filename)
+    reader = _Reader(io.BytesIO(tokens), filename)
     while True:
         try:
             expr = reader.read()
         except EOFError:
             break
-        expr = _f_copy_es(expr, immutable=True)
         exprs.append(expr)
     return exprs
 
+# Parsed files can be cached in a binary format, so that loading them again
+# skips the reader. A cache file stores the path, modification time, size, and
+# SHA-256 hash of its source. It is used when the path matches and either the
+# time and size match or the hash of the source still matches. The parsed
+# objects are stored flattened: pairs are numbered in order and every car and
+# cdr refers to either a pair or an entry in a table of atoms, so shared and
+# cyclic (#up<N>) structure is kept. Each pair's location is stored without
+# its filename, which is filled in from the path being loaded.
+
+_CODE_CACHE_MAGIC = b"fexproto code cache 1\n"
+_code_cache = None
+
+# cache parsed files in a directory, in a __pycache__ directory next to each
+# file if directory is "", or not at all if directory is None
+def set_code_cache(directory):
+    global _code_cache
+    _code_cache = directory
+
+# read and parse a file, using the code cache when it is enabled
+def _parse_file(path):
+    if _code_cache is None:
+        with open(path) as file:
+            return parse(tokenize(file.read()), filename=path)
+    import hashlib, io, os
+    abspath = os.path.abspath(path)
+    stat = os.stat(path)
+    if _code_cache:
+        digest = hashlib.sha256(abspath.encode("utf-8")).hexdigest()[:16]
+        cache_path = os.path.join(_code_cache, f'{os.path.basename(path)}-{digest}.fxc')
+    else:
+        cache_path = os.path.join(os.path.dirname(abspath), "__pycache__", f'{os.path.basename(path)}.fxc')
+    key = None
+    source = None
+    try:
+        with open(cache_path, "rb") as file:
+            key, payload = _read_code_cache(file)
+    except (OSError, ValueError, EOFError, TypeError):
+        pass  # missing or unreadable cache
+    if key is not None and key[0] == abspath:
+        if key[1:3] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, "rb") as file:
+                source = file.read()
+            if hashlib.sha256(source).digest() != key[3]:
+                payload = None
+        if payload is not None:
+            try:
+                return _decode_exprs(payload, path)
+            except (ValueError, TypeError, IndexError):
+                pass  # corrupted cache
+    if source is None:
+        with open(path, "rb") as file:
+            source = file.read()
+    # Decode like open(path).read() so that the cache doesn't change parsing
+    exprs = parse(tokenize(io.TextIOWrapper(io.BytesIO(source)).read()), filename=path)
+    key = (abspath, stat.st_mtime_ns, stat.st_size, hashlib.sha256(source).digest())
+    try:
+        payload = _encode_exprs(exprs)
+    except ValueError:
+        return exprs  # not made by the reader
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temp_path, "wb") as file:
+            _write_code_cache(file, key, payload)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass  # the cache is optional
+    return exprs
+
+def _write_code_cache(file, key, payload):
+    import marshal, zlib
+    file.write(_CODE_CACHE_MAGIC)
+    file.write(marshal.dumps((key, zlib.compress(marshal.dumps(payload), 1))))
+
+def _read_code_cache(file):
+    import marshal, zlib
+    if file.read(len(_CODE_CACHE_MAGIC)) != _CODE_CACHE_MAGIC:
+        raise ValueError("not a code cache")
+    key, payload = marshal.loads(file.read())
+    try:
+        payload = zlib.decompress(payload)
+    except zlib.error as e:
+        raise ValueError("corrupted code cache") from e
+    return key, marshal.loads(payload)
+
+# flatten a list of parsed expressions into marshallable objects
+def _encode_exprs(exprs):
+    import array
+    atoms = []  # Characters are stored as 1-tuples of their byte
+    atom_indexes = {}
+    pairs = []
+    pair_indexes = {}  # id of pair -> index in pairs
+    def index_of(obj):
+        # Pairs have non-negative indexes and atoms negative ones
+        if type(obj) is ImmutablePair:
+            index = pair_indexes.get(id(obj))
+            if index is None:
+                index = pair_indexes[id(obj)] = len(pairs)
+                pairs.append(obj)
+            return index
+        if type(obj) is Character:
+            key = atom = (obj.char,)
+        elif type(obj) is float:
+            key, atom = (float, obj.hex()), obj
+        elif type(obj) in (str, bytes, int, bool) or obj is None or obj is ... or obj == ():
+            key, atom = (type(obj), obj), obj
+        else:
+            raise ValueError(f'cannot cache object: {obj!r}')
+        index = atom_indexes.get(key)
+        if index is None:
+            index = atom_indexes[key] = ~len(atoms)
+            atoms.append(atom)
+        return index
+    roots = [index_of(expr) for expr in exprs]
+    links = array.array("i")  # car and cdr of each pair
+    locations = array.array("i")  # location of each pair without its filename
+    for pair in pairs:  # grows as new pairs are found
+        links.append(index_of(pair.car))
+        links.append(index_of(pair.cdr))
+        locations.extend(pair._location_info[1:])
+    return roots, atoms, links.tobytes(), locations.tobytes()
+
+# rebuild the parsed expressions made by _encode_exprs
+def _decode_exprs(payload, filename):
+    import array, gc
+    roots, atoms, links_bytes, locations_bytes = payload
+    links = array.array("i", links_bytes)
+    locations = array.array("i", locations_bytes)
+    if len(links) * 2 != len(locations):
+        raise ValueError("mismatched code cache arrays")
+    atoms = [_CHARACTERS[atom[0]] if type(atom) is tuple and atom else atom for atom in atoms]
+    # Nothing made here can be garbage, so skip collections while allocating
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        new = ImmutablePair.__new__
+        pairs = [new(ImmutablePair) for _ in range(len(links) // 2)]
+        objects = pairs + atoms[::-1]  # atom i is at index ~i
+        for pair, car, cdr, line_no, char_no, end_line_no, end_char_no in zip(
+            pairs, links[0::2], links[1::2],
+            locations[0::4], locations[1::4], locations[2::4], locations[3::4],
+        ):
+            pair.car = objects[car]
+            pair.cdr = objects[cdr]
+            pair._location_info = [filename, line_no, char_no, end_line_no, end_char_no]
+            pair._compiled = None
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return [objects[index] for index in roots]
+
+import re
+_SKIP_PATTERN = re.compile(br'(?:[ \t\r\n]+|;[^\n]*)*')  # whitespace and comments
+_TOKEN_PATTERN = re.compile(br'(?:[ \t\r\n]+|;[^\n]*)*(?:' + b"|".join([
+    br'(\()',  # open bracket
+    br'(\))',  # close bracket
+    br'([^ \t\r\n();"][^ \t\r\n();]*)',  # constants, numbers, and symbols
+    br'("[^"\\]*")',  # strings without escape sequences
+]) + br')')  # anything else (strings with escapes, end of file) is read separately
+_TOKEN_OPEN, _TOKEN_CLOSE, _TOKEN_LITERAL, _TOKEN_STRING, _TOKEN_OTHER = range(1, 6)
+_READ_DATUM, _READ_FIRST, _READ_NEXT, _READ_CLOSE = range(4)  # what _Reader._read expects next
+_STRING_RUN_PATTERN = re.compile(br'[^"\\]*')
+
 class _Reader:
     _warned_deprecated_dot_reference_syntax = False
 
-    # get_next_char is a callable that returns a length 0 or 1 bytes object
-    def __init__(self, get_next_char, filename):
-        self.get_next_char = get_next_char
-        self.pos = 0
-        self.line_no = 1
-        self.char_no = 0
-        self._curr = None
+    # Bytes are read from the file in chunks of up to this size
+    chunk_size = 1 << 16
+
+    # file is a binary file-like object. read1 is used when available so that
+    # interactive input is parsed as soon as a line arrives.
+    def __init__(self, file, filename):
+        self._read_chunk = getattr(file, "read1", file.read)
+        self._buffer = b""
+        self._index = 0  # index of the current byte in the buffer
+        self._offset = 0  # position of the buffer in the file
+        self._eof = False
+        self._line_no = 1
+        self._line_start = -1  # position of the last newline passed
         self._cons = []
         self.filename = filename
 
     def read(self):
-        self._skip_whitespace()
-        if self.curr == b"":
+        if self._skip_whitespace() == b"":
             raise EOFError("end of file reached")
         return self._read()
 
     def reset(self):
         self._cons.clear()
 
-    # Returns the current value from get_next_char
+    # Returns the current byte (an empty bytes object at the end of the file)
     @property
     def curr(self):
-        if self._curr is None:
-            try:
-                self._curr = self.get_next_char()
-            except EOFError:
-                self._curr = b""
-            self.pos += 1
-            if self._curr == b"\n":
-                self.line_no += 1
-                self.char_no = 0
-            else:
-                self.char_no += 1
-        return self._curr
+        if self._index >= len(self._buffer) and not self._fill():
+            return b""
+        return self._buffer[self._index:self._index+1]
 
-    # Returns the next value from get_next_char
+    # Moves to and returns the next byte
     @property
     def next(self):
-        if self._curr == b"":
+        curr = self.curr
+        if curr == b"":
             raise ValueError("reading past end of file")
-        self._curr = None
+        if curr == b"\n":
+            self._line_no += 1
+            self._line_start = self._offset + self._index
+        self._index += 1
         return self.curr
 
-    def push_cons(self):
-        top = Pair((), ())
-        self._cons.append(top)
-        top._location_info = [self.filename, self.line_no, self.char_no, -1, -1]
-        return top
-
-    def pop_cons(self, same_as):
-        assert same_as is self._cons[-1]
-        top = self._cons.pop()
-        top._location_info[3:5] = self.line_no, self.char_no
-        return top
+    # Makes sure the current byte is in the buffer, returning False at the end
+    # of the file
+    def _fill(self):
+        return self._index < len(self._buffer) or self._extend()
+
+    # Reads another chunk onto the unread part of the buffer, returning False
+    # at the end of the file
+    def _extend(self):
+        if self._eof:
+            return False
+        rest = len(self._buffer) - self._index
+        chunk = self._read_chunk(max(self.chunk_size, rest))
+        if not chunk:
+            self._eof = True
+            return False
+        self._offset += self._index
+        self._buffer = self._buffer[self._index:] + chunk
+        self._index = 0
+        return True
 
+    # Counts the newlines in buffer[start:end] (which has been read)
+    def _count_lines(self, buffer, start, end):
+        lines = buffer.count(b"\n", start, end)
+        if lines:
+            self._line_no += lines
+            self._line_start = self._offset + buffer.rindex(b"\n", start, end)
+
+    # Returns the line and column of the current byte. A newline is at column
+    # 0 of the line it starts.
+    def position(self):
+        self._fill()
+        if self._buffer[self._index:self._index+1] == b"\n":
+            return self._line_no + 1, 0
+        return self._line_no, self._offset + self._index - self._line_start
+
+    # Skips whitespace and comments and returns the current byte
     def _skip_whitespace(self):
+        comment = False  # Comments take up the rest of the line
+        while self._fill():
+            buffer, index = self._buffer, self._index
+            if comment:
+                index = buffer.find(b"\n", index)
+                if index == -1:
+                    self._index = len(buffer)
+                    continue
+                comment = False
+            end = _SKIP_PATTERN.match(buffer, index).end()
+            self._count_lines(buffer, index, end)
+            self._index = end
+            if end < len(buffer):
+                return buffer[end:end+1]
+            # The buffer can end in the middle of a comment
+            line_start = buffer.rfind(b"\n", index, end) + 1 or index
+            comment = buffer.find(b";", line_start, end) != -1
+        return b""
+
+    # Reads one object starting at the current byte. Lists are read using a
+    # stack instead of recursion so they can be arbitrarily long and deep.
+    def _read(self):
+        cons = self._cons  # conses of the elements being read (for #up<N>)
+        lists = []  # [start info, index into cons, is reading cdr] per list
+        filename = self.filename
+        state = _READ_DATUM
         while True:
-            if self.curr and self.curr in b" \t\r\n":
-                self.next
-            elif self.curr == b";":  # Comments take up the rest of the line
-                while self.curr and self.curr != b"\n":
-                    self.next
+            buffer, index = self._buffer, self._index
+            match = _TOKEN_PATTERN.match(buffer, index)
+            if match is not None:
+                kind = match.lastindex
+                if kind == _TOKEN_LITERAL and match.end() == len(buffer) and self._extend():
+                    continue  # the literal can continue in the next chunk
+                start = match.start(kind)
+                if start != index:
+                    self._count_lines(buffer, index, start)
             else:
-                break
-
-    def _read(self):
-        if self.curr == b'"':
-            return self._read_string()
-        elif self.curr == b"(":
-            start_info = self.line_no, self.char_no
-            self.next
-            self._skip_whitespace()
-            if self.curr == b")":
-                self.next
-                return ()
-            top = self._read_elements(True)
-            # Update debug info to start on the left bracket
-            top._location_info[1:3] = start_info
-            self._skip_whitespace()
-            if self.curr == b")":
-                self.next
-                return top
-            raise ValueError(f'expected close bracket, got {self.curr}')
-        elif self.curr == b")":
-            raise ValueError("unexpected close bracket")
-        elif self.curr == b" ":
-            self._skip_whitespace()
-            return self._read()
-        elif not self.curr:
-            raise ValueError(f'unexpected end of file')
-        else:
-            return self._read_literal()
-
-    def _read_elements(self, first):
-        if not first:
-            if self.curr == b")":
-                return ()
-            if self.curr == b".":
-                self.next
-                self._skip_whitespace()
-                return self._read()
-        top = self.push_cons()
-        top.car = self._read()
-        self._skip_whitespace()
-        top.cdr = self._read_elements(False)
-        return self.pop_cons(same_as=top)
+                # Whitespace running past the end of the buffer, strings with
+                # escape sequences, and the end of the file
+                curr = self._skip_whitespace()
+                if curr and curr != b'"':
+                    continue
+                kind = _TOKEN_OTHER
+                buffer, start = self._buffer, self._index
+            self._index = start
+            char_no = self._offset + start - self._line_start  # never on a newline
+
+            if kind == _TOKEN_CLOSE and state != _READ_DATUM or state == _READ_CLOSE:
+                if kind != _TOKEN_CLOSE:
+                    raise ValueError(f'expected close bracket, got {buffer[start:start+1]}')
+                self._index = start + 1
+                if state == _READ_FIRST:
+                    lists.pop()
+                    value = ()
+                elif state == _READ_NEXT:
+                    value = self._finish_list(lists, (self._line_no, char_no))
+                # else the dotted list was finished after its cdr was read
+            else:
+                if state == _READ_NEXT:
+                    if kind == _TOKEN_LITERAL and buffer[start] == b"."[0]:
+                        self._index = start + 1
+                        lists[-1][2] = True
+                        state = _READ_DATUM
+                        continue
+                    top = ImmutablePair((), ())
+                    top._location_info = [filename, self._line_no, char_no, -1, -1]
+                    cons[-1].cdr = top
+                    cons.append(top)
+                elif state == _READ_FIRST:
+                    top = ImmutablePair((), ())
+                    top._location_info = [filename, self._line_no, char_no, -1, -1]
+                    cons.append(top)
+                if kind == _TOKEN_OPEN:
+                    lists.append([(self._line_no, char_no), len(cons), False])
+                    self._index = start + 1
+                    state = _READ_FIRST
+                    continue
+                elif kind == _TOKEN_LITERAL:
+                    self._index = match.end()
+                    value = self._read_literal(match.group(kind), self._line_no, char_no)
+                elif kind == _TOKEN_STRING:
+                    self._index = match.end()
+                    self._count_lines(buffer, start, self._index)
+                    value = match.group(kind)[1:-1]
+                elif kind == _TOKEN_CLOSE:
+                    raise ValueError("unexpected close bracket")
+                elif buffer[start:start+1] == b'"':
+                    value = self._read_string()
+                else:
+                    raise ValueError(f'unexpected end of file')
+
+            # Give the value to the innermost list
+            if not lists:
+                return value
+            if lists[-1][2]:
+                cons[-1].cdr = value
+                value = self._finish_list(lists, self.position())
+                state = _READ_CLOSE
+            else:
+                cons[-1].car = value
+                state = _READ_NEXT
+
+    # Closes the innermost list and returns its first cons
+    def _finish_list(self, lists, end_info):
+        start_info, base, _ = lists.pop()
+        cons = self._cons
+        for top in cons[base:]:
+            top._location_info[3:5] = end_info
+        first = cons[base]
+        del cons[base:]
+        # Update debug info to start on the left bracket
+        first._location_info[1:3] = start_info
+        return first
 
     def _read_string(self):
         assert self.curr == b'"'
-        string_info = f'string starting at line {self.line_no} char {self.char_no}'
-        self.next
+        string_info = 'string starting at line %d char %d' % self.position()
+        self._index += 1
         string = bytearray()
-        while self.curr != b'"':
-            if not self.curr:
+        while True:
+            # Copy over the characters up to the next quote or backslash
+            if not self._fill():
                 raise ValueError(f'unexpected end of file in {string_info}')
-            if self.curr == b"\\":
+            buffer, start = self._buffer, self._index
+            index = _STRING_RUN_PATTERN.match(buffer, start).end()
+            string += buffer[start:index]
+            self._count_lines(buffer, start, index)
+            self._index = index
+            if index == len(buffer):
+                continue
+            if self.curr == b'"':
+                break
+            self.next
+            if not self.curr:
+                raise ValueError(f'unexpected end of escape sequence in {string_info}')
+            if self.curr in b"\\'\"":
+                string.extend(self.curr)
                 self.next
-                if not self.curr:
-                    raise ValueError(f'unexpected end of escape sequence in {string_info}')
-                if self.curr in b"\\'\"":
-                    string.extend(self.curr)
-                    self.next
-                elif self.curr in b"abfnrtv":
-                    string.append(b"\a\b\f\n\r\t\v"[b"abfnrtv".index(self.curr)])
-                    self.next
-                elif self.curr in b"xuU":
-                    initial = self.curr
+            elif self.curr in b"abfnrtv":
+                string.append(b"\a\b\f\n\r\t\v"[b"abfnrtv".index(self.curr)])
+                self.next
+            elif self.curr in b"xuU":
+                initial = self.curr
+                self.next
+                chars = bytearray()
+                for _ in range((2, 4, 8)[b"xuU".index(initial)]):
+                    if not self.curr: raise ValueError(f'unexpected end of escape sequence in {string_info}')
+                    chars.extend(self.curr)
                     self.next
-                    chars = bytearray()
-                    for _ in range((2, 4, 8)[b"xuU".index(initial)]):
-                        if not self.curr: raise ValueError(f'unexpected end of escape sequence in {string_info}')
-                        chars.extend(self.curr)
-                        self.next
-                    value = 0
-                    for char in chars:
-                        if char not in b"0123456789abcdefABCDEF":
-                            raise ValueError(f'invalid \\{initial.decode()} escape sequence in {string_info}: {chars}')
-                        value = value*16 + b"0123456789abcdef".index(bytes([char]).lower())
-                    if initial == b"x":
-                        string.append(value)
-                    else:
-                        string.extend(chr(value).encode("utf-8"))
+                value = 0
+                for char in chars:
+                    if char not in b"0123456789abcdefABCDEF":
+                        raise ValueError(f'invalid \\{initial.decode()} escape sequence in {string_info}: {chars}')
+                    value = value*16 + b"0123456789abcdef".index(bytes([char]).lower())
+                if initial == b"x":
+                    string.append(value)
                 else:
-                    raise ValueError(f'unknown escape sequence in {string_info}: {self.curr}')
+                    string.extend(chr(value).encode("utf-8"))
             else:
-                string.extend(self.curr)
-                self.next
+                raise ValueError(f'unknown escape sequence in {string_info}: {self.curr}')
         self.next
         return bytes(string)
 
-    def _read_literal(self):
-        const_info = f'literal starting at line {self.line_no} char {self.char_no}'
-        chars = bytearray()
-        while True:
-            chars.extend(self.curr)
-            self.next
-            if not self.curr or self.curr in b" \t\r\n();":
-                break
+    # Returns the value of a constant, number, or symbol
+    def _read_literal(self, chars, line_no, char_no):
         if chars[0] == b"#"[0]:  # constants
+            chars = bytearray(chars)
+            const_info = f'literal starting at line {line_no} char {char_no}'
             if chars == b"#t": return True
             if chars == b"#f": return False
             if chars == b"#inert": return None
             if chars == b"#ignore": return ...
             if len(chars) >= 2 and chars[1] == b"\\"[0]:
                 if len(chars) == 3:
-                    return Character(chars[2])
+                    return _CHARACTERS[chars[2]]
                 if len(chars) >= 3 and chars[2] == b"x"[0]:
                     if len(chars) != 5:
                         raise ValueError(f'invalid character {const_info}: {chars}')
@@ -1032,7 +2020,7 @@ class _Reader:
                         if char not in b"0123456789abcdefABCDEF":
                             raise ValueError(f'invalid \\x escape sequence in character {const_info}: {chars}')
                         value = value*16 + b"0123456789abcdef".index(bytes([char]).lower())
-                    return Character(value)
+                    return _CHARACTERS[value]
                 raise ValueError(f'invalid character {const_info}: {chars}')
             if len(chars) >= 2 and chars[1] == b"."[0]:
                 if not all(char == b"."[0] for char in chars[1:]):
@@ -1064,20 +2052,53 @@ class _Reader:
         return chars.decode("utf-8").lower()  # Symbols are lowercase
 
 
-# make a standard environment (should be constant)
-def _make_standard_environment(*, primitives=None):
-    if primitives is None:
-        primitives = _DEFAULT_ENV
+# Control forms that std.lisp derives from other primitives when they are
+# missing. The derivations are kept as the reference semantics and can be used
+# instead of the primitives with --derived-stdlib.
+_DERIVED_FORMS = ("$sequence", "$lambda", "$cond", "$and?", "$or?", "apply")
+
+# The standard environment is only evaluated once per process (per set of
+# primitives) and shared by every caller as the read-only parent of their own
+# environment. It can also be saved to and loaded from an on-disk snapshot.
+_STANDARD_ENVIRONMENTS = {}  # (derived, snapshot) -> standard environment
 
+# make a standard environment (should be constant)
+def _make_standard_environment(*, primitives=None, derived=False, snapshot=None):
+    # snapshot is a directory for snapshots of the standard environment
+    if primitives is not None:
+        return Environment({}, _evaluate_standard_environment(primitives, derived))
+    # cached per snapshot directory so that a snapshot is always loaded (or
+    # made) when one is asked for
+    key = (derived, snapshot)
+    std_env = _STANDARD_ENVIRONMENTS.get(key)
+    if std_env is None:
+        if snapshot is not None:
+            std_env = _load_standard_environment(snapshot, derived)
+        else:
+            std_env = _evaluate_standard_environment(_DEFAULT_ENV, derived)
+        _STANDARD_ENVIRONMENTS[key] = std_env
+    # return a new child of the standard environment so that callers never
+    # define into the shared one
+    return Environment({}, std_env)
+
+def _std_lisp_path():
+    import os
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "std.lisp")
+
+# make the environment of primitives that std.lisp is evaluated in
+def _primitives_environment(primitives, derived):
+    if derived:
+        primitives = {name: value for name, value in primitives.items() if name not in _DERIVED_FORMS}
+    return Environment(primitives, Environment.ROOT)
+
+# evaluate std.lisp in a new environment and return it
+def _evaluate_standard_environment(primitives, derived):
     # create standard environment with primitives as parent
-    env = Environment(primitives, Environment.ROOT)
+    env = _primitives_environment(primitives, derived)
     env = Environment({}, env)
 
     # get standard library
-    with open("std.lisp") as file:
-        text = file.read()
-    tokens = tokenize(text)
-    exprs = parse(tokens, filename="std.lisp")
+    exprs = _parse_file(_std_lisp_path())
 
     # evaluate in standard environment
     for expr in exprs:
@@ -1089,10 +2110,172 @@ def _make_standard_environment(*, primitives=None):
             if continuation is Continuation.ERROR:
                 raise ValueError(value)
 
-    # return child of standard environment
-    env = Environment({}, env)
     return env
 
+# Snapshots are pickles of the standard environment. Objects owned by this
+# module (primitives, sentinels, functions, and classes) are stored by name so
+# that their identity is kept, and so that snapshots made by running
+# fexproto.py work when it is imported as a module and vice versa. The file
+# name contains a hash of std.lisp and this file, so changing either one makes
+# a new snapshot.
+
+def _snapshot_objects(primitives_env):
+    objects = {
+        "Environment.ROOT": Environment.ROOT,
+        "Continuation.ROOT": Continuation.ROOT,
+        "Continuation.ERROR": Continuation.ERROR,
+        "LocalMap.ROOT": LocalMap.ROOT,
+        "_f_passthrough": _f_passthrough,
+        "primitives": primitives_env,
+    }
+    for name, value in _DEFAULT_ENV.items():
+        objects[f'_DEFAULT_ENV {name}'] = value
+    return objects
+
+def _snapshot_path(directory, derived):
+    import hashlib, os
+    digest = hashlib.sha256()
+    for path in (_std_lisp_path(), __file__):
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    digest.update(b"derived" if derived else b"primitive")
+    return os.path.join(directory, f'std-{digest.hexdigest()[:16]}.pickle')
+
+# load the standard environment from a snapshot, making one if needed
+def _load_standard_environment(directory, derived):
+    import os, pickle, types
+    module = globals()
+
+    # persistent_id and persistent_load are methods so that this works where
+    # they can't be assigned on pickler instances (CPython 3.13+)
+    class Unpickler(pickle.Unpickler):
+        def persistent_load(self, pid):
+            kind, _, name = pid.partition(" ")
+            return module[name] if kind == "global" else objects[pid]
+
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, obj):
+            if id(obj) in names:
+                return names[id(obj)]
+            if type(obj) in (type, types.FunctionType) and obj.__module__ == __name__ and module.get(obj.__name__) is obj:
+                return f'global {obj.__name__}'
+            return None
+
+    path = _snapshot_path(directory, derived)
+    try:
+        with open(path, "rb") as file:
+            objects = _snapshot_objects(_primitives_environment(_DEFAULT_ENV, derived))
+            return Unpickler(file).load()
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError, TypeError, ValueError, ImportError):
+        pass  # missing, unreadable, or stale snapshot
+
+    std_env = _evaluate_standard_environment(_DEFAULT_ENV, derived)
+    names = {id(obj): name for name, obj in _snapshot_objects(std_env.parent).items()}
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, "wb") as file:
+            Pickler(file, protocol=pickle.HIGHEST_PROTOCOL).dump(std_env)
+        os.replace(temp_path, path)
+    except OSError:
+        pass  # the snapshot is optional
+    return std_env
+
+# The profiler samples the continuation stack every interval steps. Each frame
+# with _call_info becomes a label of its operator and source span, such as
+# "sumto test.lisp:3-5", and the expression being evaluated at the time of the
+# sample (if any) becomes the innermost frame. Other steps are labelled by
+# their step function, such as "[_f_if]". Samples are counted per stack from
+# the outermost frame in, and written as collapsed stacks (one line of
+# "frame;frame;frame count" per stack) for flamegraph tools. main only steps
+# through a profiler when --profile is passed.
+class Profiler:
+    __slots__ = ("interval", "countdown", "stacks", "labels")
+    def __init__(self, interval=100):
+        assert interval > 0, f'expected positive sampling interval, got {interval}'
+        self.interval = interval
+        self.countdown = interval
+        self.stacks = {}  # tuple of labels -> number of samples
+        self.labels = {}  # id of expression -> (expression, label)
+
+    # same as step_evaluate, taking a sample every interval steps
+    def step(self, continuation, value):
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.countdown = self.interval
+            self.sample(continuation, value)
+        return step_evaluate(continuation, value)
+
+    def sample(self, continuation, value):
+        if continuation.expr is _step_eval:
+            frames = [self._label(value)]
+        else:
+            step = continuation.expr
+            frames = [(f'[{getattr(step, "__name__", type(step).__name__)}]', "")]
+        while continuation is not Continuation.ROOT:
+            if continuation._call_info is not None:
+                frames.append(self._label(continuation._call_info[1]))
+            continuation = continuation.parent
+        frames.reverse()
+        stack = tuple(frames)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _label(self, expr):
+        entry = self.labels.get(id(expr))
+        if entry is None:
+            entry = self.labels[id(expr)] = (expr, _profile_label(expr))
+        return entry[1]
+
+    # write samples as collapsed stacks
+    def write_stacks(self, file):
+        lines = {}
+        for stack, count in self.stacks.items():
+            line = ";".join(f'{name} {location}'.strip().replace(";", ":") for name, location in stack)
+            lines[line] = lines.get(line, 0) + count
+        for line, count in sorted(lines.items()):
+            print(line, count, file=file)
+
+    # write the labels with the most samples (self: innermost frame, total:
+    # anywhere in the stack), by operator and by location
+    def write_summary(self, file, limit=10):
+        total = sum(self.stacks.values())
+        print(f'? --- profile: {total} samples, one every {self.interval} steps ---', file=file)
+        if total == 0:
+            return
+        for title, key in [("operator", lambda frame: frame[0]), ("location", lambda frame: f'{frame[0]} {frame[1]}'.strip())]:
+            self_counts = {}
+            total_counts = {}
+            for stack, count in self.stacks.items():
+                name = key(stack[-1])
+                self_counts[name] = self_counts.get(name, 0) + count
+                for name in set(map(key, stack)):
+                    total_counts[name] = total_counts.get(name, 0) + count
+            print(f'?   self  total  {title}', file=file)
+            top = sorted(total_counts, key=lambda name: (-self_counts.get(name, 0), -total_counts[name], name))
+            for name in top[:limit]:
+                print(f'? {self_counts.get(name, 0) / total:6.1%} {total_counts[name] / total:6.1%}  {name}', file=file)
+
+# return (operator, "FILE:LINE") for an expression, using the symbol it names
+# or its operator's symbol ("?" otherwise) and its location if it has one
+def _profile_label(expr):
+    if type(expr) is str:
+        name = expr
+    elif isinstance(expr, Pair) and type(expr.car) is str:
+        name = expr.car
+    else:
+        name = "?"
+    location_info = getattr(expr, "_location_info", None)
+    if location_info is None:
+        location = "unknown"
+    else:
+        filename, start_line, _, end_line, _ = location_info
+        if filename[:1] == "\x00":
+            filename = filename[1:]  # remove leading null
+        location = f'{filename}:{start_line}'
+        if end_line not in (start_line, -1):
+            location += f'-{end_line}'
+    return name, location
+
 def _f_print_trace(c):
     _FILE_LINES_CACHE = {}
     RJUST = 7
@@ -1104,10 +2287,10 @@ def _f_print_trace(c):
         c = c.parent
 
     for c in reversed(frames):
-        if not hasattr(c, "_call_info"):
+        if c._call_info is None:
             continue
 
-        if not hasattr(c._call_info[1], "_location_info"):
+        if getattr(c._call_info[1], "_location_info", None) is None:
             print(f'  in unknown')
             print(end="".rjust(RJUST));_f_write(c._call_info[1]);print()
             continue
@@ -1160,20 +2343,80 @@ def _f_print_trace(c):
 
 def main(env=None, argv=None):
     import sys
+    if argv is None:
+        argv = list(sys.argv)
+
+    # Options come before the file name
+    derived_stdlib = False
+    std_snapshot = None
+    profiler = None
+    profile_path = None
+    while len(argv) >= 2 and argv[1].startswith("--"):
+        option, _, value = argv.pop(1).partition("=")
+        if option == "--check-order":
+            # Shuffle argument evaluation to catch order-dependence bugs
+            if not value:
+                import random
+                value = str(random.randrange(2**32))
+                print(f'? (check-order {value})', file=sys.stderr)
+            set_evaluation_order("shuffle", seed=int(value))
+        elif option == "--env-storage":
+            # Store call frame bindings in dicts (default) or LocalMap lists
+            set_environment_storage(value)
+        elif option == "--derived-stdlib":
+            # Use std.lisp's derivations of the control forms
+            derived_stdlib = True
+        elif option == "--code-cache":
+            # Cache parsed files in a directory (or next to each file)
+            set_code_cache(value)
+        elif option == "--profile":
+            # Sample where evaluation spends its steps, printing a summary at
+            # the end and writing collapsed stacks to a file if one is given
+            profiler = profiler or Profiler()
+            profile_path = value or None
+        elif option == "--profile-interval":
+            # Take a profiling sample every this many steps (implies --profile)
+            try:
+                interval = int(value)
+            except ValueError:
+                interval = 0
+            if interval <= 0:
+                print(f'! profile interval must be a positive integer, got: {value}', file=sys.stderr)
+                exit(2)
+            profiler = Profiler(interval)
+        elif option == "--std-snapshot":
+            # Load the standard environment from a snapshot in a directory
+            if not value:
+                import os
+                value = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+            std_snapshot = value
+        else:
+            print(f'! unknown option: {option}', file=sys.stderr)
+            exit(2)
+
+    set_module_stdlib(derived=derived_stdlib, snapshot=std_snapshot)
     if env is None:
-        env = _make_standard_environment()
+        env = _make_standard_environment(derived=derived_stdlib, snapshot=std_snapshot)
     if type(env) is dict:
         env = Environment(env, Environment.ROOT)
-    if argv is None:
-        argv = list(sys.argv)
 
     # Fake continuation to represent the interpreter
     main_continuation = Continuation(Environment.ROOT, _f_passthrough, Continuation.ROOT)
 
     interactive = (len(argv) == 1)
 
+    try:
+        _main_loop(env, argv, main_continuation, interactive, step_evaluate if profiler is None else profiler.step)
+    finally:
+        if profiler is not None:
+            profiler.write_summary(sys.stderr)
+            if profile_path is not None:
+                with open(profile_path, "w") as file:
+                    profiler.write_stacks(file)
+
+def _main_loop(env, argv, main_continuation, interactive, step):
     with open(argv[1] if not interactive and argv[1] != "-" else 0, mode="rb") as file:
-        reader = _Reader(lambda: file.read(1), argv[1] if not interactive else "\x00stdin")
+        reader = _Reader(file, argv[1] if not interactive else "\x00stdin")
         if interactive:
             print(f'? --- interactive repl ---')
             print(f'? results are prefixed with > and errors with !')
@@ -1186,24 +2429,23 @@ def main(env=None, argv=None):
             except ValueError as e:
                 if not interactive:
                     raise
-                _syntax_error = Pair(type(e).__name__.encode("utf-8"), Pair(", ".join(e.args).encode("utf-8"), ()))
-                print(end="! ");_f_write(Pair("syntax-error", _syntax_error));print()
+                _syntax_error = MutablePair(type(e).__name__.encode("utf-8"), MutablePair(", ".join(e.args).encode("utf-8"), ()))
+                print(end="! ");_f_write(MutablePair("syntax-error", _syntax_error));print()
                 reader.reset()
                 while reader.curr not in b"\n":
                     reader.next
                 if reader.curr == b"":
                     break
                 continue
-            expr = _f_copy_es(expr, immutable=True)
 
             continuation = Continuation(Environment.ROOT, _f_passthrough, main_continuation)
             continuation._call_info = ["repl eval", expr]
             continuation, value = Continuation(env, _step_eval, continuation), expr
             while continuation is not Continuation.ROOT:
                 try:
-                    continuation, value = step_evaluate(continuation, value)
+                    continuation, value = step(continuation, value)
                 except Exception as e:
-                    value = Pair(continuation.parent, Pair(type(e).__name__.encode("utf-8"), Pair(", ".join(map(str, e.args)).encode("utf-8"), ())))
+                    value = MutablePair(continuation.parent, MutablePair(type(e).__name__.encode("utf-8"), MutablePair(", ".join(map(str, e.args)).encode("utf-8"), ())))
                     continuation = Continuation.ERROR
                     error_kind = "internal-error"
                 else:
@@ -1211,20 +2453,20 @@ def main(env=None, argv=None):
                 if continuation is Continuation.ERROR:
                     error_continuation = None
                     message = value
-                    if type(message) is Pair and type(message.car) is Continuation:
+                    if isinstance(message, Pair) and type(message.car) is Continuation:
                         print("! --- stack trace ---")
                         error_continuation, message = message.car, message.cdr
                         _f_print_trace(error_continuation)
-                    print(end="! ");_f_write(Pair(error_kind, message));print()
+                    print(end="! ");_f_write(MutablePair(error_kind, message));print()
                     if interactive:
-                        env.bindings["last-error-continuation"] = error_continuation
-                        env.bindings["last-error-message"] = message
+                        _define(env, "last-error-continuation", error_continuation)
+                        _define(env, "last-error-message", message)
                         break
                     exit(1)
                 if continuation is main_continuation:
                     if interactive:
                         print(end="> ");_f_write(value);print()
-                        env.bindings["last-value"] = value
+                        _define(env, "last-value", value)
                     break
             else:
                 return
@@ -22,6 +22,8 @@ try:
     from rpython.rlib import jit
     from rpython.rlib import objectmodel
     from rpython.rlib import rfile
+    from rpython.rlib import rsha
+    from rpython.rlib.rstring import StringBuilder
 except ImportError:
     import re
     class rweakref(object):
@@ -49,6 +51,8 @@ except ImportError:
         @staticmethod
         def unroll_safe(func): return func
         @staticmethod
+        def dont_look_inside(func): return func
+        @staticmethod
         def isvirtual(arg): return False
         @staticmethod
         def isconstant(arg): return False
@@ -60,8 +64,8 @@ except ImportError:
             def call_location(): return lambda func: func
     class rfile(object):
         @staticmethod
-        def create_file(filename):
-            return open(filename, "rb")
+        def create_file(filename, mode="r"):
+            return open(filename, mode if "b" in mode else mode + "b")
         if b"" == "":  # Python 2
             @staticmethod
             def create_stdio():
@@ -77,6 +81,16 @@ except ImportError:
             def create_stdio():
                 import sys
                 return sys.stdin.buffer, sys.stdout.buffer, sys.stderr.buffer
+    class rsha(object):
+        @staticmethod
+        def RSHA(data):
+            import hashlib
+            return hashlib.sha1(data)
+    class StringBuilder(object):
+        def __init__(self, init_size=0): self._parts = []
+        def append(self, s): self._parts.append(s)
+        def append_slice(self, s, start, end): self._parts.append(s[start:end])
+        def build(self): return b"".join(self._parts)
 
 # == Interpreter types and logic
 
@@ -162,6 +176,35 @@ class PrimitiveOperative(Operative):
             return self.func(env, value, parent)
         except RuntimeError as e:
             return f_error(parent, MutablePair(String(_c_str_to_bytes(e.message)), NIL))
+# Primitives with a fixed number of arguments take them positionally and return
+# a value. Argument evaluation calls them directly (without consing a list),
+# and call is used when they are given a list (such as by apply).
+class Primitive1Operative(Operative):
+    _immutable_ = True
+    def __init__(self, func):
+        self.func = func
+    def call(self, env, value, parent):
+        if not isinstance(value, Pair) or not isinstance(value.cdr, Nil):
+            return _f_arity_error(parent, b"expected 1 argument", value)
+        return self.call1(value.car, parent)
+    def call1(self, a, parent):
+        try:
+            return f_return(parent, self.func(a))
+        except RuntimeError as e:
+            return f_error(parent, MutablePair(String(_c_str_to_bytes(e.message)), NIL))
+class Primitive2Operative(Operative):
+    _immutable_ = True
+    def __init__(self, func):
+        self.func = func
+    def call(self, env, value, parent):
+        if not isinstance(value, Pair) or not isinstance(value.cdr, Pair) or not isinstance(value.cdr.cdr, Nil):
+            return _f_arity_error(parent, b"expected 2 arguments", value)
+        return self.call2(value.car, value.cdr.car, parent)
+    def call2(self, a, b, parent):
+        try:
+            return f_return(parent, self.func(a, b))
+        except RuntimeError as e:
+            return f_error(parent, MutablePair(String(_c_str_to_bytes(e.message)), NIL))
 class ContinuationOperative(Operative):
     _immutable_ = True
     def __init__(self, continuation):
@@ -211,33 +254,32 @@ class Location(object):
         self.end_char_no = end_char_no
 LOCATIONS = rweakref.RWeakKeyDictionary(Object, Location)
 
-def _copy_immutable_recursively_set(expr, visited):
-    if not isinstance(expr, MutablePair):
-        return expr
-    if expr in visited:
-        return visited[expr]
-    pair = ImmutablePair(NIL, NIL)
-    visited[expr] = pair
-    pair.car = _copy_immutable_recursively_set(expr.car, visited)
-    pair.cdr = _copy_immutable_recursively_set(expr.cdr, visited)
-    return pair
-@jit.unroll_safe
-def _copy_immutable_recursively_list(expr, visited):
-    if not isinstance(expr, MutablePair):
-        return expr
-    for before, after in visited:
-        if expr is before:
-            return after
-    pair = ImmutablePair(NIL, NIL)
-    visited.append((expr, pair))
-    pair.car = _copy_immutable_recursively_list(expr.car, visited)
-    pair.cdr = _copy_immutable_recursively_list(expr.cdr, visited)
-    return pair
+# Copy the mutable pairs reachable from expr into immutable pairs. Pairs that
+# are already immutable are shared, and visited maps each mutable pair to its
+# copy so that shared and cyclic structure is kept. The copy is done with a
+# worklist instead of recursion so long lists don't overflow the stack. Traces
+# call it instead of inlining it, as the worklist and dict don't unroll.
+@jit.dont_look_inside
+def _copy_immutable(expr, visited):
+    pending = []  # mutable pairs whose copy still needs a car and cdr
+    copy = _copy_immutable_pair(expr, visited, pending)
+    while pending:
+        orig = pending.pop()
+        pair = visited[orig]
+        pair.car = _copy_immutable_pair(orig.car, visited, pending)
+        pair.cdr = _copy_immutable_pair(orig.cdr, visited, pending)
+    return copy
+def _copy_immutable_pair(obj, visited, pending):
+    if not isinstance(obj, MutablePair):
+        return obj
+    copy = visited.get(obj, None)
+    if copy is None:
+        copy = ImmutablePair(NIL, NIL)
+        visited[obj] = copy
+        pending.append(obj)
+    return copy
 def _f_copy_immutable(expr):
-    if not jit.we_are_jitted():
-        return _copy_immutable_recursively_set(expr, {})
-    else:
-        return _copy_immutable_recursively_list(expr, [])
+    return _copy_immutable(expr, {})
 
 # Exceptions
 
@@ -433,6 +475,26 @@ class FBindsEnvironment(Environment):
     def __init__(self, name):
         Environment.__init__(self, None, None)
         self.name = name
+class FSequenceEnvironment(Environment):
+    _immutable_fields_ = Environment._immutable_fields_ + ("env", "exprs")
+    def __init__(self, env, exprs):
+        Environment.__init__(self, None, None)
+        self.env = env
+        self.exprs = exprs
+class FCondEnvironment(Environment):
+    _immutable_fields_ = Environment._immutable_fields_ + ("env", "body", "clauses")
+    def __init__(self, env, body, clauses):
+        Environment.__init__(self, None, None)
+        self.env = env
+        self.body = body
+        self.clauses = clauses
+class FAndOrEnvironment(Environment):
+    _immutable_fields_ = Environment._immutable_fields_ + ("env", "exprs", "stop")
+    def __init__(self, env, exprs, stop):
+        Environment.__init__(self, None, None)
+        self.env = env
+        self.exprs = exprs
+        self.stop = stop
 
 # Core interpreter logic
 
@@ -448,6 +510,8 @@ def f_return_loop_constant(parent, obj):
 def f_error(parent, value):
     # TODO: replace with abnormal pass when guarded continuations implemented
     return f_return(ERROR_CONT, MutablePair(parent, value))
+def _f_arity_error(parent, message, args):
+    return f_error(parent, MutablePair(String(message), MutablePair(args, NIL)))
 def f_eval(env, obj, parent=None):
     # Don't let the JIT driver promote virtuals (such as mutable pairs
     # constructed at runtime)
@@ -589,6 +653,13 @@ def _step_call_evcar(static, value, parent):
     assert isinstance(i, int)
     res = static.res
     assert isinstance(res, Nil) or isinstance(res, Pair)
+    if i + 1 == p and num_wraps == 1 and c == 0:
+        # Pass the arguments of fixed arity primitives directly
+        if p == 1 and isinstance(operative, Primitive1Operative):
+            return operative.call1(value, parent)
+        if p == 2 and isinstance(operative, Primitive2Operative):
+            assert isinstance(res, Pair)
+            return operative.call2(res.car, value, parent)
     res = MutablePair(value, res)
     i = i + 1
     if i == p:
@@ -900,77 +971,95 @@ def _prompt_lines(stdin, stdout, prompt_list):
                     yield part[i+1:j+1]
                     i = j
 
+# Output is rendered into a StringBuilder and written with a single call
 def _f_write(file, obj):
-    _write(file, obj, 0, {})
-def _write(file, obj, depth, upcons):
+    builder = StringBuilder()
+    _write(builder, obj, 0, {})
+    file.write(builder.build())
+def _f_write_line(file, obj):
+    builder = StringBuilder()
+    _write(builder, obj, 0, {})
+    builder.append(b"\n")
+    file.write(builder.build())
+def _write(builder, obj, depth, upcons):
     if isinstance(obj, Nil):
-        file.write(b"()")
+        builder.append(b"()")
     elif isinstance(obj, Int):
-        file.write(b"%d" % (obj.value,))
+        builder.append(b"%d" % (obj.value,))
     elif isinstance(obj, String):
-        file.write(b'"')
-        for char in obj.value:
+        value = obj.value
+        builder.append(b'"')
+        start = 0  # start of the current run of plain characters
+        for i in range(len(value)):
+            char = value[i]
             code = _c_char_to_int(char)
+            if 32 <= code < 128 and char not in b'"\\':
+                continue
+            builder.append_slice(value, start, i)
+            start = i + 1
             if char in b'\a\b\t\n\r"\\':  # escape sequences
-                file.write(b"\\")
-                file.write(_c_join_chars([b'abtnr"\\'[b'\a\b\t\n\r"\\'.find(char)]]))
-            elif not 32 <= code < 128:  # unprintable codes
-                file.write(b"\\x")
-                file.write(_c_join_chars([b"0123456789abcdef"[code//16]]))
-                file.write(_c_join_chars([b"0123456789abcdef"[code%16]]))
-            else:
-                file.write(_c_join_chars([char]))
-        file.write(b'"')
+                builder.append(b"\\")
+                builder.append(_c_join_chars([b'abtnr"\\'[b'\a\b\t\n\r"\\'.find(char)]]))
+            else:  # unprintable codes
+                builder.append(b"\\x")
+                builder.append(_c_join_chars([b"0123456789abcdef"[code//16]]))
+                builder.append(_c_join_chars([b"0123456789abcdef"[code%16]]))
+        builder.append_slice(value, start, len(value))
+        builder.append(b'"')
     elif isinstance(obj, Symbol):
-        file.write(obj.name)
+        builder.append(obj.name)
     elif isinstance(obj, Ignore):
-        file.write(b"#ignore")
+        builder.append(b"#ignore")
     elif isinstance(obj, Inert):
-        file.write(b"#inert")
+        builder.append(b"#inert")
     elif isinstance(obj, Boolean):
         if obj.value:
-            file.write(b"#t")
+            builder.append(b"#t")
         else:
-            file.write(b"#f")
+            builder.append(b"#f")
     elif isinstance(obj, Pair):
         if obj in upcons:
-            file.write(b"#up<")
-            file.write(b"%d" % (depth - upcons[obj],))
-            file.write(b">")
+            builder.append(b"#up<")
+            builder.append(b"%d" % (depth - upcons[obj],))
+            builder.append(b">")
             return
         stack = []
-        file.write(b"(")
+        builder.append(b"(")
         stack.append(obj)
         upcons[obj] = depth
         depth += 1
-        _write(file, obj.car, depth, upcons)
+        _write(builder, obj.car, depth, upcons)
         obj_cdr = obj.cdr
         while isinstance(obj_cdr, Pair):
             if obj_cdr in upcons:
                 break
             obj = obj_cdr
-            file.write(b" ")
+            builder.append(b" ")
             stack.append(obj)
             upcons[obj] = depth
             depth += 1
-            _write(file, obj.car, depth, upcons)
+            _write(builder, obj.car, depth, upcons)
             obj_cdr = obj.cdr
         if not isinstance(obj_cdr, Nil):
-            file.write(b" . ")
-            _write(file, obj_cdr, depth, upcons)
+            builder.append(b" . ")
+            _write(builder, obj_cdr, depth, upcons)
         while stack:
             upcons.pop(stack.pop())
-        file.write(b")")
+        builder.append(b")")
     elif isinstance(obj, Environment):
-        file.write(b"#environment")
+        builder.append(b"#environment")
     elif isinstance(obj, Continuation):
-        file.write(b"#continuation")
+        builder.append(b"#continuation")
     elif isinstance(obj, Combiner):
-        file.write(b"#combiner")
+        builder.append(b"#combiner")
     else:
-        file.write(b"#unknown")
+        builder.append(b"#unknown")
 
 def _f_print_trace(file, continuation):
+    builder = StringBuilder()
+    _write_trace(builder, continuation)
+    file.write(builder.build())
+def _write_trace(builder, continuation):
     assert isinstance(continuation, Continuation)
     # Output stack trace in reverse order, with recent calls last
     frames = []
@@ -986,67 +1075,67 @@ def _f_print_trace(file, continuation):
         loc = LOCATIONS.get(expr)
         if loc is None:
             # Non-source expressions can be evaluated, usually from eval
-            file.write(b"  in unknown\n")
-            file.write(b"    ")
-            _f_write(file, expr)
-            file.write(b"\n")
+            builder.append(b"  in unknown\n")
+            builder.append(b"    ")
+            _write(builder, expr, 0, {})
+            builder.append(b"\n")
             continue
         # Get source location of expression
         if loc.start_line_no == loc.end_line_no:
             line_info = b"%d" % (loc.start_line_no+1,)
         else:
             line_info = b"%d:%d" % (loc.start_line_no+1, loc.end_line_no+1)
-        file.write(b"  in %s at %s [%d:%d]\n" % (loc.filename, line_info, loc.start_char_no+1, loc.end_char_no+1))
+        builder.append(b"  in %s at %s [%d:%d]\n" % (loc.filename, line_info, loc.start_char_no+1, loc.end_char_no+1))
         # TODO: output the actual content of the lines the expression is from
-        file.write(b"    ")
-        _f_write(file, expr)
-        file.write(b"\n")
+        builder.append(b"    ")
+        _write(builder, expr, 0, {})
+        builder.append(b"\n")
 
 def _f_format_syntax_error(file, error, filename, lines, starts_at=0):
-    file.write(b"! --- syntax error ---\n")
-    file.write(b"  in %s at %d [%d:]\n" % (filename, error.line_no + 1, error.char_no + 1))
-    file.write(b"    ")
-    file.write(lines[error.line_no - starts_at])
-    file.write(b"\n")
-    file.write(b"! syntax-error ")
-    _f_write(file, String(_c_str_to_bytes(error.message)))
-    file.write(b"\n")
+    builder = StringBuilder()
+    builder.append(b"! --- syntax error ---\n")
+    builder.append(b"  in %s at %d [%d:]\n" % (filename, error.line_no + 1, error.char_no + 1))
+    builder.append(b"    ")
+    builder.append(lines[error.line_no - starts_at])
+    builder.append(b"\n")
+    builder.append(b"! syntax-error ")
+    _write(builder, String(_c_str_to_bytes(error.message)), 0, {})
+    builder.append(b"\n")
+    file.write(builder.build())
 
 def _f_format_evaluation_error(file, error):
+    builder = StringBuilder()
     if error.parent is not None:
-        file.write(b"! --- stack trace ---\n")
-        _f_print_trace(file, error.parent)
-    file.write(b"! error ")
-    _f_write(file, error.value)
-    file.write(b"\n")
+        builder.append(b"! --- stack trace ---\n")
+        _write_trace(builder, error.parent)
+    builder.append(b"! error ")
+    _write(builder, error.value, 0, {})
+    builder.append(b"\n")
+    file.write(builder.build())
 
 def _f_format_evaluation_stop(file, error):
-    file.write(b"! exit ")
-    _f_write(file, error.value)
-    file.write(b"\n")
+    builder = StringBuilder()
+    builder.append(b"! exit ")
+    _write(builder, error.value, 0, {})
+    builder.append(b"\n")
+    file.write(builder.build())
 
 # Location information is not stored on the object, so we need to create a new
 # locations list with the objects in the immutable copy.
 def _f_copy_immutable_and_locations(exprs, locations):
-    old_locations = {}
-    for expr, l1, c1, l2, c2 in locations:
-        old_locations[expr] = (l1, c1, l2, c2)
+    visited = {}
     copies = []
-    new_locations = []
     for expr in exprs:
-        copy = _f_copy_immutable(expr)
-        copies.append(copy)
-        _transfer_locations(expr, copy, old_locations, new_locations)
+        copies.append(_copy_immutable(expr, visited))
+    new_locations = []
+    for expr, l1, c1, l2, c2 in locations:
+        copy = expr
+        if isinstance(expr, MutablePair):
+            copy = visited.get(expr, None)
+            if copy is None:
+                continue
+        new_locations.append((copy, l1, c1, l2, c2))
     return copies, new_locations
-def _transfer_locations(orig, copy, old_locations, new_locations):
-    if orig not in old_locations:
-        return
-    l1, c1, l2, c2 = old_locations.pop(orig)
-    new_locations.append((copy, l1, c1, l2, c2))
-    if isinstance(orig, Pair):
-        assert isinstance(copy, Pair)
-        _transfer_locations(orig.car, copy.car, old_locations, new_locations)
-        _transfer_locations(orig.cdr, copy.cdr, old_locations, new_locations)
 
 # == Primitive combiners
 
@@ -1075,34 +1164,29 @@ def _unpack3(expr, message, rest=False):
     return arg1, arg2, arg3
 
 # (number? expr)
-def _operative_number(env, expr, parent):
-    _ERROR = "expected (number? ANY)"
-    number = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(number, Int) else FALSE)
+def _operative_number(number):
+    return TRUE if isinstance(number, Int) else FALSE
 
 # (+ a b)
-def _operative_plus(env, expr, parent):
+def _operative_plus(a, b):
     _ERROR = "expected (+ INT INT)"
-    a, b = _unpack2(expr, _ERROR)
     if not isinstance(a, Int): raise RuntimeError(_ERROR)
     if not isinstance(b, Int): raise RuntimeError(_ERROR)
-    return f_return(parent, Int(a.value + b.value))
+    return Int(a.value + b.value)
 
 # (* a b)
-def _operative_times(env, expr, parent):
+def _operative_times(a, b):
     _ERROR = "expected (* INT INT)"
-    a, b = _unpack2(expr, _ERROR)
     if not isinstance(a, Int): raise RuntimeError(_ERROR)
     if not isinstance(b, Int): raise RuntimeError(_ERROR)
-    return f_return(parent, Int(a.value * b.value))
+    return Int(a.value * b.value)
 
 # (<=? a b)
-def _operative_less_equal(env, expr, parent):
+def _operative_less_equal(a, b):
     _ERROR = "expected (<=? INT INT)"
-    a, b = _unpack2(expr, _ERROR)
     if not isinstance(a, Int): raise RuntimeError(_ERROR)
     if not isinstance(b, Int): raise RuntimeError(_ERROR)
-    return f_return(parent, TRUE if a.value <= b.value else FALSE)
+    return TRUE if a.value <= b.value else FALSE
 
 # (eq? a b)
 def _eq(a, b):
@@ -1124,116 +1208,137 @@ def _eq(a, b):
         return isinstance(b, String) and a.value == b.value
     else:
         return a is b
-def _operative_eq(env, expr, parent):
-    _ERROR = "expected (eq? ANY ANY)"
-    a, b = _unpack2(expr, _ERROR)
-    return f_return(parent, TRUE if _eq(a, b) else FALSE)
+def _operative_eq(a, b):
+    return TRUE if _eq(a, b) else FALSE
 
 # (pair? expr)
-def _operative_pair(env, expr, parent):
-    _ERROR = "expected (pair? ANY)"
-    pair = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(pair, Pair) else FALSE)
+def _operative_pair(pair):
+    return TRUE if isinstance(pair, Pair) else FALSE
 
 # (cons a b)
-def _operative_cons(env, expr, parent):
-    _ERROR = "expected (cons ANY ANY)"
-    a, b = _unpack2(expr, _ERROR)
-    return f_return(parent, MutablePair(a, b))
+def _operative_cons(a, b):
+    return MutablePair(a, b)
 
 # (car pair)
-def _operative_car(env, expr, parent):
+def _operative_car(pair):
     _ERROR = "expected (car PAIR)"
-    pair = _unpack1(expr, _ERROR)
     if not isinstance(pair, Pair): raise RuntimeError(_ERROR)
-    return f_return(parent, pair.car)
+    return pair.car
 
 # (cdr pair)
-def _operative_cdr(env, expr, parent):
+def _operative_cdr(pair):
     _ERROR = "expected (cdr PAIR)"
-    pair = _unpack1(expr, _ERROR)
     if not isinstance(pair, Pair): raise RuntimeError(_ERROR)
-    return f_return(parent, pair.cdr)
+    return pair.cdr
 
 # (equal? a b)
-def _equal_recursively_set(a, b, visited):
-    if not isinstance(a, Pair) or not isinstance(b, Pair):
-        return _eq(a, b)
-    # a and b are pairs
-    if (a, b) in visited:
-        return True
-    visited[(a, b)] = True
-    if not _equal_recursively_set(a.car, b.car, visited):
-        return False
-    if not _equal_recursively_set(a.cdr, b.cdr, visited):
-        return False
-    visited.pop((a, b))
-    return True
+# Pairs that were already compared are merged into the same set (union-find),
+# so shared and cyclic structure is only walked once.
 def _equal(a, b):
-    return _equal_recursively_set(a, b, {})
-def _operative_equal(env, expr, parent):
-    _ERROR = "expected (equal? ANY ANY)"
-    a, b = _unpack2(expr, _ERROR)
-    return f_return(parent, TRUE if _equal(a, b) else FALSE)
+    parents = {}  # pair -> a pair in the same set
+    sizes = {}  # root pair -> size of its set
+    todo_a = [a]
+    todo_b = [b]
+    while todo_a:
+        a = todo_a.pop()
+        b = todo_b.pop()
+        if not isinstance(a, Pair) or not isinstance(b, Pair):
+            if not _eq(a, b):
+                return False
+            continue
+        # a and b are pairs
+        if a is b:
+            continue
+        root_a = _equal_find(parents, a)
+        root_b = _equal_find(parents, b)
+        if root_a is root_b:
+            continue  # already assumed equal
+        size_a = sizes.get(root_a, 1)
+        size_b = sizes.get(root_b, 1)
+        if size_a < size_b:
+            root_a, root_b = root_b, root_a
+        parents[root_b] = root_a
+        sizes[root_a] = size_a + size_b
+        todo_a.append(a.cdr)
+        todo_b.append(b.cdr)
+        todo_a.append(a.car)
+        todo_b.append(b.car)
+    return True
+def _equal_find(parents, pair):
+    root = pair
+    while True:
+        parent = parents.get(root, None)
+        if parent is None:
+            break
+        root = parent
+    while pair is not root:  # point the path straight at the root
+        parent = parents[pair]
+        parents[pair] = root
+        pair = parent
+    return root
+def _operative_equal(a, b):
+    return TRUE if _equal(a, b) else FALSE
 
 # (set-car! pair car)
-def _operative_set_car(env, expr, parent):
+def _operative_set_car(pair, car):
     _ERROR = "expected (set-car! MUTABLE-PAIR ANY)"
-    pair, car = _unpack2(expr, _ERROR)
     if not isinstance(pair, MutablePair): raise RuntimeError(_ERROR)
     pair.car = car
-    return f_return(parent, INERT)
+    return INERT
 
 # (set-cdr! pair cdr)
-def _operative_set_cdr(env, expr, parent):
+def _operative_set_cdr(pair, cdr):
     _ERROR = "expected (set-cdr! MUTABLE-PAIR ANY)"
-    pair, cdr = _unpack2(expr, _ERROR)
     if not isinstance(pair, MutablePair): raise RuntimeError(_ERROR)
     pair.cdr = cdr
-    return f_return(parent, INERT)
+    return INERT
 
 # (operative? expr)
-def _operative_operative(env, expr, parent):
-    _ERROR = "expected (operative? ANY)"
-    combiner = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(combiner, Combiner) and combiner.num_wraps <= 0 else FALSE)
+def _operative_operative(combiner):
+    return TRUE if isinstance(combiner, Combiner) and combiner.num_wraps <= 0 else FALSE
 
-# ($vau (dyn args) expr)
+# ($vau (dyn args) . body)
+def _f_vau_body(body):
+    # Multiple body expressions are evaluated like ($sequence . body)
+    immutable_body = _f_copy_immutable(body)
+    if isinstance(immutable_body, Pair) and isinstance(immutable_body.cdr, Nil):
+        return immutable_body.car
+    return ImmutablePair(_SEQUENCE, immutable_body)
 def _operative_vau(env, expr, parent):
-    _ERROR = "expected ($vau (PARAM PARAM) ANY)"
-    envname_name, body = _unpack2(expr, _ERROR)
+    _ERROR = "expected ($vau (PARAM PARAM) ANY ...)"
+    envname_name, body = _unpack1(expr, _ERROR, rest=True)
     envname, name = _unpack2(envname_name, _ERROR)
     if not isinstance(envname, Symbol) and not isinstance(envname, Ignore): raise RuntimeError(_ERROR)
     immutable_name = _f_copy_immutable(name)
-    immutable_body = _f_copy_immutable(body)
-    return f_return(parent, Combiner(0, UserDefinedOperative(env, envname, immutable_name, immutable_body)))
+    return f_return(parent, Combiner(0, UserDefinedOperative(env, envname, immutable_name, _f_vau_body(body))))
+
+# ($lambda args . body)
+def _operative_lambda(env, expr, parent):
+    _ERROR = "expected ($lambda PARAM ANY ...)"
+    name, body = _unpack1(expr, _ERROR, rest=True)
+    immutable_name = _f_copy_immutable(name)
+    return f_return(parent, Combiner(1, UserDefinedOperative(env, IGNORE, immutable_name, _f_vau_body(body))))
 
 # (applicative? expr)
-def _operative_applicative(env, expr, parent):
-    _ERROR = "expected (applicative? ANY)"
-    combiner = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(combiner, Combiner) and combiner.num_wraps > 0 else FALSE)
+def _operative_applicative(combiner):
+    return TRUE if isinstance(combiner, Combiner) and combiner.num_wraps > 0 else FALSE
 
 # (wrap combiner)
-def _operative_wrap(env, expr, parent):
+def _operative_wrap(combiner):
     _ERROR = "expected (wrap COMBINER)"
-    combiner = _unpack1(expr, _ERROR)
     if not isinstance(combiner, Combiner): raise RuntimeError(_ERROR)
-    return f_return(parent, Combiner(combiner.num_wraps + 1, combiner.operative))
+    return Combiner(combiner.num_wraps + 1, combiner.operative)
 
 # (unwrap combiner)
-def _operative_unwrap(env, expr, parent):
+def _operative_unwrap(combiner):
     _ERROR = "expected (unwrap COMBINER)"
-    combiner = _unpack1(expr, _ERROR)
     if not isinstance(combiner, Combiner): raise RuntimeError(_ERROR)
     if combiner.num_wraps == 0: raise RuntimeError(_ERROR)
-    return f_return(parent, Combiner(combiner.num_wraps - 1, combiner.operative))
+    return Combiner(combiner.num_wraps - 1, combiner.operative)
 
 # (environment? expr)
-def _operative_environment(env, expr, parent):
-    _ERROR = "expected (environment? ANY)"
-    operative = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(operative, Environment) else FALSE)
+def _operative_environment(operative):
+    return TRUE if isinstance(operative, Environment) else FALSE
 
 # (eval env expr)
 def _operative_eval(env, expr, parent):
@@ -1272,10 +1377,8 @@ def _operative_make_environment(env, expr, parent):
     return f_return(parent, Environment({}, environment))
 
 # (symbol? expr)
-def _operative_symbol(env, expr, parent):
-    _ERROR = "expected (symbol? ANY)"
-    symbol = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(symbol, Symbol) else FALSE)
+def _operative_symbol(symbol):
+    return TRUE if isinstance(symbol, Symbol) else FALSE
 
 # ($define! name value)
 def _define_recursively_set(env, name, value, visited_names, visited_pairs):
@@ -1438,11 +1541,88 @@ def _operative_binds(env, expr, parent):
     next_continuation._call_info = env_expr
     return f_eval(env, env_expr, next_continuation)
 
+# ($sequence . exprs)
+def _f_sequence_eval(env, exprs, parent):
+    if isinstance(exprs, Nil):
+        return f_return(parent, INERT)
+    if not isinstance(exprs, Pair): raise RuntimeError("expected ($sequence ANY ...)")
+    if isinstance(exprs.cdr, Nil):
+        return f_eval(env, exprs.car, parent)
+    next_env = FSequenceEnvironment(env, exprs.cdr)
+    next_continuation = Continuation(next_env, _F_SEQUENCE, parent)
+    next_continuation._call_info = exprs.car
+    return f_eval(env, exprs.car, next_continuation)
+def _f_sequence(static, value, parent):
+    assert isinstance(static, FSequenceEnvironment)
+    return _f_sequence_eval(static.env, static.exprs, parent)
+_F_SEQUENCE = PrimitiveOperative(_f_sequence)
+def _operative_sequence(env, expr, parent):
+    return _f_sequence_eval(env, expr, parent)
+_SEQUENCE = Combiner(0, PrimitiveOperative(_operative_sequence))
+
+# ($cond (test . body) ...)
+def _f_cond_eval(env, clauses, parent):
+    _ERROR = "expected ($cond (ANY ANY ...) ...)"
+    if isinstance(clauses, Nil): raise RuntimeError("no $cond clause matched")
+    clause, rest = _unpack1(clauses, _ERROR, rest=True)
+    test, body = _unpack1(clause, _ERROR, rest=True)
+    next_env = FCondEnvironment(env, body, rest)
+    next_continuation = Continuation(next_env, _F_COND, parent)
+    next_continuation._call_info = test
+    return f_eval(env, test, next_continuation)
+def _f_cond(static, result, parent):
+    assert isinstance(static, FCondEnvironment)
+    if not isinstance(result, Boolean):
+        raise RuntimeError("expected boolean test value")
+    if result.value:
+        return _f_sequence_eval(static.env, static.body, parent)
+    return _f_cond_eval(static.env, static.clauses, parent)
+_F_COND = PrimitiveOperative(_f_cond)
+def _operative_cond(env, expr, parent):
+    return _f_cond_eval(env, expr, parent)
+
+# ($and? . exprs) and ($or? . exprs) stop at the first #f and #t respectively
+def _f_and_or_eval(env, exprs, stop, parent):
+    if isinstance(exprs, Nil):
+        return f_return(parent, FALSE if stop.value else TRUE)
+    if not isinstance(exprs, Pair): raise RuntimeError("expected ($and? ANY ...) or ($or? ANY ...)")
+    if isinstance(exprs.cdr, Nil):
+        return f_eval(env, exprs.car, parent)
+    next_env = FAndOrEnvironment(env, exprs.cdr, stop)
+    next_continuation = Continuation(next_env, _F_AND_OR, parent)
+    next_continuation._call_info = exprs.car
+    return f_eval(env, exprs.car, next_continuation)
+def _f_and_or(static, result, parent):
+    assert isinstance(static, FAndOrEnvironment)
+    if not isinstance(result, Boolean):
+        raise RuntimeError("expected boolean test value")
+    stop = static.stop
+    if result.value == stop.value:
+        return f_return(parent, stop)
+    return _f_and_or_eval(static.env, static.exprs, stop, parent)
+_F_AND_OR = PrimitiveOperative(_f_and_or)
+def _operative_and(env, expr, parent):
+    return _f_and_or_eval(env, expr, FALSE, parent)
+def _operative_or(env, expr, parent):
+    return _f_and_or_eval(env, expr, TRUE, parent)
+
+# (apply applicative args [environment])
+def _operative_apply(env, expr, parent):
+    _ERROR = "expected (apply APPLICATIVE ANY [ENVIRONMENT])"
+    combiner, args, rest = _unpack2(expr, _ERROR, rest=True)
+    if isinstance(rest, Nil):
+        environment = Environment({}, None)
+    else:
+        environment = _unpack1(rest, _ERROR)
+        if not isinstance(environment, Environment): raise RuntimeError(_ERROR)
+    if not isinstance(combiner, Combiner) or combiner.num_wraps == 0: raise RuntimeError(_ERROR)
+    # Same as evaluating ((unwrap applicative) . args) in environment
+    unwrapped = Combiner(combiner.num_wraps - 1, combiner.operative)
+    return f_eval(environment, MutablePair(unwrapped, args), parent)
+
 # (continuation? expr)
-def _operative_continuation(env, expr, parent):
-    _ERROR = "expected (continuation? ANY)"
-    continuation = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(continuation, Continuation) else FALSE)
+def _operative_continuation(continuation):
+    return TRUE if isinstance(continuation, Continuation) else FALSE
 
 # (call/cc combiner)
 def _operative_call_cc(env, expr, parent):
@@ -1454,11 +1634,10 @@ def _operative_call_cc(env, expr, parent):
     return f_return(next_continuation, MutablePair(parent, NIL))
 
 # (continuation->applicative continuation)
-def _operative_continuation_to_applicative(env, expr, parent):
+def _operative_continuation_to_applicative(continuation):
     _ERROR = "expected (continuation->applicative CONTINUATION)"
-    continuation = _unpack1(expr, _ERROR)
     if not isinstance(continuation, Continuation): raise RuntimeError(_ERROR)
-    return f_return(parent, Combiner(1, ContinuationOperative(continuation)))
+    return Combiner(1, ContinuationOperative(continuation))
 
 # (extend-continuation continuation applicative environment)
 def _operative_extend_continuation(env, expr, parent):
@@ -1470,49 +1649,432 @@ def _operative_extend_continuation(env, expr, parent):
     return f_return(parent, Continuation(environment, applicative.operative, continuation))
 
 # (string? expr)
-def _operative_string(env, expr, parent):
-    _ERROR = "expected (string? ANY)"
-    string = _unpack1(expr, _ERROR)
-    return f_return(parent, TRUE if isinstance(string, String) else FALSE)
+def _operative_string(string):
+    return TRUE if isinstance(string, String) else FALSE
 
 def _primitive(num_wraps, func):
     return Combiner(num_wraps, PrimitiveOperative(func))
+def _primitive1(func):
+    return Combiner(1, Primitive1Operative(func))
+def _primitive2(func):
+    return Combiner(1, Primitive2Operative(func))
 _DEFAULT_ENV = {
-    b"number?": _primitive(1, _operative_number),
-    b"+": _primitive(1, _operative_plus),
-    b"*": _primitive(1, _operative_times),
-    b"<=?": _primitive(1, _operative_less_equal),
-    b"eq?": _primitive(1, _operative_eq),
-    b"pair?": _primitive(1, _operative_pair),
-    b"cons": _primitive(1, _operative_cons),
-    b"car": _primitive(1, _operative_car),
-    b"cdr": _primitive(1, _operative_cdr),
-    b"equal?": _primitive(1, _operative_equal),
-    b"set-car!": _primitive(1, _operative_set_car),
-    b"set-cdr!": _primitive(1, _operative_set_cdr),
-    b"operative?": _primitive(1, _operative_operative),
+    b"number?": _primitive1(_operative_number),
+    b"+": _primitive2(_operative_plus),
+    b"*": _primitive2(_operative_times),
+    b"<=?": _primitive2(_operative_less_equal),
+    b"eq?": _primitive2(_operative_eq),
+    b"pair?": _primitive1(_operative_pair),
+    b"cons": _primitive2(_operative_cons),
+    b"car": _primitive1(_operative_car),
+    b"cdr": _primitive1(_operative_cdr),
+    b"equal?": _primitive2(_operative_equal),
+    b"set-car!": _primitive2(_operative_set_car),
+    b"set-cdr!": _primitive2(_operative_set_cdr),
+    b"operative?": _primitive1(_operative_operative),
     b"$vau": _primitive(0, _operative_vau),
-    b"applicative?": _primitive(1, _operative_applicative),
-    b"wrap": _primitive(1, _operative_wrap),
-    b"unwrap": _primitive(1, _operative_unwrap),
-    b"environment?": _primitive(1, _operative_environment),
+    b"$lambda": _primitive(0, _operative_lambda),
+    b"$sequence": _SEQUENCE,
+    b"$cond": _primitive(0, _operative_cond),
+    b"$and?": _primitive(0, _operative_and),
+    b"$or?": _primitive(0, _operative_or),
+    b"apply": _primitive(1, _operative_apply),
+    b"applicative?": _primitive1(_operative_applicative),
+    b"wrap": _primitive1(_operative_wrap),
+    b"unwrap": _primitive1(_operative_unwrap),
+    b"environment?": _primitive1(_operative_environment),
     b"eval": _primitive(1, _operative_eval),
     b"$remote-eval": _primitive(0, _operative_remote_eval),
     b"make-environment": _primitive(1, _operative_make_environment),
-    b"symbol?": _primitive(1, _operative_symbol),
+    b"symbol?": _primitive1(_operative_symbol),
     b"$define!": _primitive(0, _operative_define),
     b"$if": _primitive(0, _operative_if),
     b"$binds?": _primitive(0, _operative_binds),
-    b"continuation?": _primitive(1, _operative_continuation),
+    b"continuation?": _primitive1(_operative_continuation),
     b"call/cc": _primitive(1, _operative_call_cc),
-    b"continuation->applicative": _primitive(1, _operative_continuation_to_applicative),
+    b"continuation->applicative": _primitive1(_operative_continuation_to_applicative),
     b"extend-continuation": _primitive(1, _operative_extend_continuation),
     b"error-continuation": ERROR_CONT,
     b"root-continuation": ROOT_CONT,
-    b"string?": _primitive(1, _operative_string),
+    b"string?": _primitive1(_operative_string),
     b"$jit-loop-head": Combiner(0, _F_LOOP_HEAD),
 }
 
+# Control forms that std.lisp derives from other primitives when they are
+# missing. --derived-stdlib leaves them out so that the derivations are used.
+_DERIVED_FORMS = [b"$sequence", b"$lambda", b"$cond", b"$and?", b"$or?", b"apply"]
+
+def _f_primitives_environment(derived):
+    if not derived:
+        return Environment(_DEFAULT_ENV, None)
+    bindings = {}
+    for name, value in _DEFAULT_ENV.items():
+        if name not in _DERIVED_FORMS:
+            bindings[name] = value
+    return Environment(bindings, None)
+
+# == Code cache
+
+# With --code-cache, the parsed expressions of a file and their locations are
+# cached in __pycache__/NAME.rfxc next to it. The cache starts with the path,
+# modification time, size, and SHA-1 hash of the source, and is used when the
+# path matches and either both the time and the size or the hash match (so the
+# source only needs to be read when the time or size differs). Then comes a
+# table of objects, where each pair refers to its car and cdr by index (so
+# shared and cyclic structure is kept), followed by the top-level expressions
+# and the locations.
+_CODE_CACHE_MAGIC = b"rfexproto code cache 2\n"
+_CODE_NIL, _CODE_IGNORE, _CODE_INERT, _CODE_TRUE, _CODE_FALSE, _CODE_PAIR, _CODE_INT, _CODE_STRING, _CODE_SYMBOL = range(9)
+class CodeCacheError(Exception):
+    pass
+
+def _f_code_cache_path(filename):
+    i = filename.rfind(b"/") + 1
+    assert i >= 0
+    return filename[:i] + b"__pycache__/" + filename[i:] + b".rfxc"
+
+# Returns the modification time and size of filename
+def _f_code_cache_stat(filename):
+    import os
+    st = os.stat(filename)
+    return int(st.st_mtime * 1e9), int(st.st_size)
+
+def _f_read_all(file):
+    parts = []
+    while True:
+        part = file.read(2048)
+        if not part: break
+        parts.append(part)
+    return b"".join(parts)
+
+# Returns the cached expressions of filename (setting their locations), or None
+# if the cache is missing or out of date. text is the source to check the hash
+# of, or None to check the modification time and size instead.
+def _f_load_code_cache(filename, text):
+    try:
+        file = rfile.create_file(_f_code_cache_path(filename))
+        try:
+            data = _f_read_all(file)
+        finally:
+            file.close()
+        reader = _CodeReader(data)
+        if reader.read_raw(len(_CODE_CACHE_MAGIC)) != _CODE_CACHE_MAGIC:
+            return None
+        path = reader.read_bytes()
+        mtime = reader.read_int()
+        size = reader.read_int()
+        digest = reader.read_bytes()
+        if path != filename:
+            return None
+        if text is None:
+            source_mtime, source_size = _f_code_cache_stat(filename)
+            if mtime != source_mtime or size != source_size:
+                return None
+        elif digest != rsha.RSHA(text).digest():
+            return None
+        return reader.read_code(filename)
+    except (OSError, IOError, CodeCacheError):
+        return None
+
+# Writes the cache of filename, ignoring errors (the cache is optional)
+def _f_save_code_cache(filename, text, exprs, locations):
+    import os
+    builder = StringBuilder()
+    builder.append(_CODE_CACHE_MAGIC)
+    try:
+        _write_code_bytes(builder, filename)
+        mtime, size = _f_code_cache_stat(filename)
+        _write_code_int(builder, mtime)
+        _write_code_int(builder, size)
+        _write_code_bytes(builder, rsha.RSHA(text).digest())
+        _write_code(builder, exprs, locations)
+    except (OSError, CodeCacheError):
+        return
+    path = _f_code_cache_path(filename)
+    i = path.rfind(b"/")
+    assert i >= 0
+    try:
+        os.mkdir(path[:i])
+    except OSError:
+        pass  # already exists
+    try:
+        temp_path = path + b".tmp"
+        file = rfile.create_file(temp_path, "w")
+        try:
+            file.write(builder.build())
+        finally:
+            file.close()
+        os.rename(temp_path, path)
+    except (OSError, IOError):
+        pass
+
+_CODE_BYTES = [_c_join_chars([_c_int_to_char(code)]) for code in range(256)]
+def _write_code_int(builder, value):
+    # Non-negative integers are written 7 bits at a time, low bits first
+    assert value >= 0
+    while value >= 0x80:
+        builder.append(_CODE_BYTES[value & 0x7f | 0x80])
+        value >>= 7
+    builder.append(_CODE_BYTES[value])
+def _write_code_bytes(builder, value):
+    _write_code_int(builder, len(value))
+    builder.append(value)
+def _write_code(builder, exprs, locations):
+    # Number every object reachable from exprs, starting with the constants
+    objects = [NIL, IGNORE, INERT, TRUE, FALSE]
+    indexes = {}
+    for i in range(len(objects)):
+        indexes[objects[i]] = i
+    for expr in exprs:
+        _index_code_object(expr, objects, indexes)
+    i = 0
+    while i < len(objects):  # objects grows as pairs are numbered
+        obj = objects[i]
+        if isinstance(obj, Pair):
+            _index_code_object(obj.car, objects, indexes)
+            _index_code_object(obj.cdr, objects, indexes)
+        i += 1
+    _write_code_int(builder, len(objects))
+    for i in range(_CODE_PAIR, len(objects)):
+        obj = objects[i]
+        if isinstance(obj, Pair):
+            builder.append(_CODE_BYTES[_CODE_PAIR])
+            _write_code_int(builder, indexes[obj.car])
+            _write_code_int(builder, indexes[obj.cdr])
+        elif isinstance(obj, Int):
+            builder.append(_CODE_BYTES[_CODE_INT])
+            _write_code_bytes(builder, b"%d" % obj.value)
+        elif isinstance(obj, String):
+            builder.append(_CODE_BYTES[_CODE_STRING])
+            _write_code_bytes(builder, obj.value)
+        elif isinstance(obj, Symbol):
+            builder.append(_CODE_BYTES[_CODE_SYMBOL])
+            _write_code_bytes(builder, obj.name)
+        else:
+            raise CodeCacheError()
+    _write_code_int(builder, len(exprs))
+    for expr in exprs:
+        _write_code_int(builder, indexes[expr])
+    _write_code_int(builder, len(locations))
+    for expr, l1, c1, l2, c2 in locations:
+        index = indexes.get(expr, -1)
+        if index == -1:
+            raise CodeCacheError()
+        _write_code_int(builder, index)
+        _write_code_int(builder, l1 + 1)
+        _write_code_int(builder, c1 + 1)
+        _write_code_int(builder, l2 + 1)
+        _write_code_int(builder, c2 + 1)
+def _index_code_object(obj, objects, indexes):
+    if indexes.get(obj, -1) == -1:
+        indexes[obj] = len(objects)
+        objects.append(obj)
+
+class _CodeReader(object):
+    def __init__(self, data):
+        self.data = data
+        self.i = 0
+    def read_raw(self, length):
+        start = self.i
+        end = start + length
+        if length < 0 or end > len(self.data):
+            raise CodeCacheError()
+        self.i = end
+        return self.data[start:end]
+    def read_byte(self):
+        if self.i >= len(self.data):
+            raise CodeCacheError()
+        byte = _c_char_to_int(self.data[self.i])
+        self.i += 1
+        return byte
+    def read_int(self):
+        data = self.data
+        i = self.i
+        value = shift = 0
+        while i < len(data) and shift <= 63:
+            byte = _c_char_to_int(data[i])
+            i += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                self.i = i
+                return value
+            shift += 7
+        raise CodeCacheError()
+    def read_bytes(self):
+        return self.read_raw(self.read_int())
+    def read_index(self, objects):
+        index = self.read_int()
+        if index >= len(objects):
+            raise CodeCacheError()
+        return index
+    def read_code(self, filename):
+        count = self.read_int()
+        objects = [NIL, IGNORE, INERT, TRUE, FALSE]
+        links = []  # car and cdr indexes of each pair in objects
+        for _ in range(_CODE_PAIR, count):
+            kind = self.read_byte()
+            if kind == _CODE_PAIR:
+                links.append(self.read_int())
+                links.append(self.read_int())
+                objects.append(ImmutablePair(NIL, NIL))
+            elif kind == _CODE_INT:
+                try:
+                    objects.append(Int(int(self.read_bytes())))
+                except ValueError:
+                    raise CodeCacheError()
+            elif kind == _CODE_STRING:
+                objects.append(String(self.read_bytes()))
+            elif kind == _CODE_SYMBOL:
+                objects.append(Symbol(self.read_bytes()))
+            else:
+                raise CodeCacheError()
+        i = 0
+        for obj in objects:
+            if isinstance(obj, Pair):
+                car = links[i]
+                cdr = links[i + 1]
+                if car >= len(objects) or cdr >= len(objects):
+                    raise CodeCacheError()
+                obj.car = objects[car]
+                obj.cdr = objects[cdr]
+                i += 2
+        exprs = []
+        for _ in range(self.read_int()):
+            exprs.append(objects[self.read_index(objects)])
+        for _ in range(self.read_int()):
+            obj = objects[self.read_index(objects)]
+            l1 = self.read_int() - 1
+            c1 = self.read_int() - 1
+            l2 = self.read_int() - 1
+            c2 = self.read_int() - 1
+            LOCATIONS.set(obj, Location(filename, l1, c1, l2, c2))
+        return exprs
+
+# == Profiling
+
+# With --profile, evaluation goes through profile_evaluate instead of
+# fully_evaluate (so the JIT is not used), which samples the continuation stack
+# every interval steps. Each frame with a _call_info is labelled by its
+# operator and source span (from LOCATIONS), such as "sumto test.lisp:3-5",
+# and the innermost frame is the expression being evaluated at the time of
+# the sample, or "[return]" if a value is being returned. Samples are counted
+# per collapsed stack ("frame;frame;frame" from the outermost frame in) for
+# flamegraph tools, and per operator and location for the summary.
+
+class Profile(object):
+    def __init__(self, interval):
+        self.interval = interval
+        self.countdown = interval
+        self.samples = 0
+        self.stacks = {}  # collapsed stack -> number of samples
+        self.self_operators = {}  # operator -> samples as innermost frame
+        self.total_operators = {}  # operator -> samples anywhere in stack
+        self.self_locations = {}  # label -> samples as innermost frame
+        self.total_locations = {}  # label -> samples anywhere in stack
+
+    def sample(self, state):
+        obj, env, continuation = state
+        if obj is None and continuation.operative is _STEP_EVAL:
+            obj, env = env, continuation.env  # expression returned to be evaluated
+        names = []
+        labels = []
+        if obj is not None and env is not None:
+            _profile_label(obj, names, labels)
+        else:
+            names.append(b"[return]")
+            labels.append(b"[return]")
+        while continuation is not None:
+            if continuation._call_info is not None:
+                _profile_label(continuation._call_info, names, labels)
+            continuation = continuation.parent
+        self.samples += 1
+        _profile_count(self.self_operators, names[0])
+        _profile_count(self.self_locations, labels[0])
+        seen = {}
+        for name in names:
+            if name not in seen:
+                seen[name] = None
+                _profile_count(self.total_operators, name)
+        seen = {}
+        for label in labels:
+            if label not in seen:
+                seen[label] = None
+                _profile_count(self.total_locations, label)
+        labels.reverse()
+        _profile_count(self.stacks, b";".join(labels))
+
+def _profile_count(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+def _profile_label(expr, names, labels):
+    if isinstance(expr, Symbol):
+        name = expr.name
+    elif isinstance(expr, Pair) and isinstance(expr.car, Symbol):
+        name = expr.car.name
+    else:
+        name = b"?"
+    name = name.replace(b";", b":").replace(b" ", b"_")
+    loc = LOCATIONS.get(expr)
+    if loc is None:
+        location = b"unknown"
+    elif loc.start_line_no == loc.end_line_no:
+        location = b"%s:%d" % (loc.filename, loc.start_line_no+1)
+    else:
+        location = b"%s:%d-%d" % (loc.filename, loc.start_line_no+1, loc.end_line_no+1)
+    names.append(name)
+    labels.append(name + b" " + location.replace(b";", b":"))
+
+def profile_evaluate(state, profile):
+    try:
+        while True:
+            profile.countdown -= 1
+            if profile.countdown == 0:
+                profile.countdown = profile.interval
+                profile.sample(state)
+            state = step_evaluate(state)
+    except EvaluationDone as e:
+        return e.value
+
+def _f_write_profile_stacks(file, profile):
+    builder = StringBuilder()
+    for stack, count in profile.stacks.items():
+        builder.append(b"%s %d\n" % (stack, count))
+    file.write(builder.build())
+
+def _f_write_profile_summary(file, profile, limit=10):
+    builder = StringBuilder()
+    builder.append(b"? --- profile: %d samples, one every %d steps ---\n" % (profile.samples, profile.interval))
+    if profile.samples > 0:
+        builder.append(b"?   self  total  operator\n")
+        _write_profile_top(builder, profile.samples, profile.self_operators, profile.total_operators, limit)
+        builder.append(b"?   self  total  location\n")
+        _write_profile_top(builder, profile.samples, profile.self_locations, profile.total_locations, limit)
+    file.write(builder.build())
+def _write_profile_top(builder, samples, self_counts, total_counts, limit):
+    # Pick the keys with the most samples as innermost frame (then in total)
+    keys = [key for key in total_counts]
+    for _ in range(min(limit, len(keys))):
+        best = 0
+        for i in range(1, len(keys)):
+            self_i = self_counts.get(keys[i], 0)
+            self_best = self_counts.get(keys[best], 0)
+            if self_i > self_best or (self_i == self_best and total_counts[keys[i]] > total_counts[keys[best]]):
+                best = i
+        key = keys.pop(best)
+        builder.append(b"? ")
+        builder.append(_profile_percent(self_counts.get(key, 0), samples))
+        builder.append(b" ")
+        builder.append(_profile_percent(total_counts[key], samples))
+        builder.append(b"  ")
+        builder.append(key)
+        builder.append(b"\n")
+def _profile_percent(count, samples):
+    permille = count * 1000 // samples
+    text = b"%d.%d%%" % (permille // 10, permille % 10)
+    while len(text) < 6:
+        text = b" " + text
+    return text
+
 # == Entry point
 
 def main(argv):
@@ -1530,11 +2092,44 @@ def main(argv):
     file = None
     filename = None
     interactive = False
+    code_cache = False
+    derived_stdlib = False
+    status = 0
 
     # TODO: look into optparse
     if len(argv) >= 2 and argv[1] == "-i":
         argv.pop(1)
         interactive = True
+    if len(argv) >= 2 and argv[1] == "--code-cache":
+        argv.pop(1)
+        code_cache = True
+    if len(argv) >= 2 and argv[1] == "--derived-stdlib":
+        argv.pop(1)
+        derived_stdlib = True
+    # --profile[=FILE] and --profile-interval=N (which implies --profile)
+    profile = None
+    profile_path = None
+    while len(argv) >= 2 and argv[1].startswith("--profile"):
+        option = argv.pop(1)
+        if profile is None:
+            profile = Profile(100)
+        if option.startswith("--profile="):
+            profile_path = _c_str_to_bytes(option[len("--profile="):])
+        elif option.startswith("--profile-interval="):
+            interval = 0
+            try:
+                interval = int(option[len("--profile-interval="):])
+            except ValueError:
+                pass
+            if interval <= 0:
+                stdin, stdout, stderr = rfile.create_stdio()
+                stdout.write(b"error: profile interval must be a positive integer\n")
+                return 2
+            profile.interval = profile.countdown = interval
+        elif option != "--profile":
+            stdin, stdout, stderr = rfile.create_stdio()
+            stdout.write(b"error: unknown arguments\n")
+            return 2
     if len(argv) >= 2 and argv[1] == "--":
         argv.pop(1)
     if len(argv) == 2:
@@ -1556,6 +2151,7 @@ def main(argv):
         elif not interactive:
             filename = b"<stdin>"
             file = stdin
+            code_cache = False
     else:
         stdin, stdout, stderr = rfile.create_stdio()
         stdout.write(b"error: unknown arguments\n")
@@ -1563,56 +2159,66 @@ def main(argv):
 
     env = None
     if file is not None:
-        # Read whole file
-        parts = []
-        try:
-            while True:
-                part = file.read(2048)
-                if not part: break
-                parts.append(part)
-        except (OSError, IOError):
-            if stderr is None:
-                stdin, stdout, stderr = rfile.create_stdio()
-            stderr.write(b"error: could not read file\n")
-            stderr.flush()
-            if not interactive:
-                return 1
-            del parts[:]
-        text = b"".join(parts)
-        # Lex and parse
-        try:
-            offsets = []
-            tokens = tokenize(text, offsets=offsets)
-            tokens.reverse()
-            offsets.reverse()
-            exprs = []
-            while tokens:
-                expr_locations = []
-                expr = parse(tokens, offsets=offsets, locations=expr_locations, upcons={})
-                [expr], copy_locations = _f_copy_immutable_and_locations([expr], expr_locations)
-                exprs.append(expr)
-                for expr, l1, c1, l2, c2 in copy_locations:
-                    LOCATIONS.set(expr, Location(filename, l1, c1, l2, c2))
-        except ParsingError as e:
-            if stderr is None:
-                stdin, stdout, stderr = rfile.create_stdio()
-            _f_format_syntax_error(stderr, e, filename, text.split(b"\n"))
-            stderr.flush()
-            if not interactive:
-                return 1
-        else:
+        exprs = None
+        if code_cache:
+            exprs = _f_load_code_cache(filename, None)
+        if exprs is None:
+            # Read whole file
+            text = b""
+            try:
+                text = _f_read_all(file)
+            except (OSError, IOError):
+                if stderr is None:
+                    stdin, stdout, stderr = rfile.create_stdio()
+                stderr.write(b"error: could not read file\n")
+                stderr.flush()
+                if not interactive:
+                    return 1
+            if code_cache:
+                exprs = _f_load_code_cache(filename, text)
+        if exprs is None:
+            # Lex and parse
+            try:
+                offsets = []
+                tokens = tokenize(text, offsets=offsets)
+                tokens.reverse()
+                offsets.reverse()
+                parsed_exprs = []
+                file_locations = []
+                while tokens:
+                    expr_locations = []
+                    expr = parse(tokens, offsets=offsets, locations=expr_locations, upcons={})
+                    [expr], copy_locations = _f_copy_immutable_and_locations([expr], expr_locations)
+                    parsed_exprs.append(expr)
+                    for expr, l1, c1, l2, c2 in copy_locations:
+                        LOCATIONS.set(expr, Location(filename, l1, c1, l2, c2))
+                    if code_cache:
+                        file_locations.extend(copy_locations)
+                exprs = parsed_exprs
+                if code_cache:
+                    _f_save_code_cache(filename, text, exprs, file_locations)
+            except ParsingError as e:
+                if stderr is None:
+                    stdin, stdout, stderr = rfile.create_stdio()
+                _f_format_syntax_error(stderr, e, filename, text.split(b"\n"))
+                stderr.flush()
+                if not interactive:
+                    return 1
+        if exprs is not None:
             # Setup standard environment
-            env = Environment({}, Environment(_DEFAULT_ENV, None))
+            env = Environment({}, _f_primitives_environment(derived_stdlib))
             # Evaluate expressions and write their results
             for expr in exprs:
                 state = _f_toplevel_eval(env, expr)
                 try:
-                    value = fully_evaluate(state)
+                    if profile is None:
+                        value = fully_evaluate(state)
+                    else:
+                        value = profile_evaluate(state, profile)
                     if not isinstance(value, Inert):
                         if stdout is None:
                             stdin, stdout, stderr = rfile.create_stdio()
-                        _f_write(stdout, value)
-                        stdout.write(b"\n")
+                        _f_write_line(stdout, value)
                         stdout.flush()
                 except EvaluationStop as e:
                     if interactive:
@@ -1627,7 +2233,7 @@ def main(argv):
                     _f_format_evaluation_error(stderr, e)
                     stderr.flush()
                     if not interactive:
-                        return 1
+                        status = 1
                     break
 
     # Start REPL if no args and is TTY or if -i flag was passed
@@ -1638,7 +2244,7 @@ def main(argv):
         prompt_list = [PROMPT_1]
         # Setup standard environment
         if env is None:
-            env = Environment({}, Environment(_DEFAULT_ENV, None))
+            env = Environment({}, _f_primitives_environment(derived_stdlib))
         # Parser state
         lines = []
         parser = _InteractiveParser()
@@ -1665,10 +2271,12 @@ def main(argv):
             try:
                 for expr in exprs:
                     state = _f_toplevel_eval(env, expr)
-                    value = fully_evaluate(state)
+                    if profile is None:
+                        value = fully_evaluate(state)
+                    else:
+                        value = profile_evaluate(state, profile)
                     if not isinstance(value, Inert):
-                        _f_write(stdout, value)
-                        stdout.write(b"\n")
+                        _f_write_line(stdout, value)
                         stdout.flush()
             except EvaluationStop:
                 break
@@ -1677,7 +2285,22 @@ def main(argv):
                 stderr.flush()
             prompt_list[0] = PROMPT_1
 
-    return 0
+    if profile is not None:
+        if stderr is None:
+            stdin, stdout, stderr = rfile.create_stdio()
+        _f_write_profile_summary(stderr, profile)
+        stderr.flush()
+        if profile_path is not None:
+            try:
+                file = rfile.create_file(profile_path, "w")
+                try:
+                    _f_write_profile_stacks(file, profile)
+                finally:
+                    file.close()
+            except (OSError, IOError):
+                stderr.write(b"error: could not write profile\n")
+                stderr.flush()
+    return status
 
 # RPython toolchain
 def target(driver, args):
@@ -32,6 +32,13 @@
 								error-args)))))))))
 		$vau))
 
+($define! get-current-environment (wrap ($vau (env ()) env)))
+
+; fexproto.py provides $sequence, $vau with multiple body expressions, $lambda,
+; $cond, $and?, $or? and apply as primitives. The derivations below are only
+; used when these are missing (such as with --derived-stdlib) and serve as their
+; reference semantics.
+
 ; This is based on John Shutt's derivation of $sequence in [1] from primitive
 ; features. Modifications include the different parameters for $vau and eval,
 ; the lack of null? (which can be derived from eq?), the evaluation of
@@ -43,6 +50,7 @@
 ;     WPI-CS-TR-05-07, Mar. 2005 [Amended 29 Oct. 2009]. [Online]. Available:
 ;     https://ftp.cs.wpi.edu/pub/techreports/pdf/05-07.pdf. [Accessed: 8 Mar.
 ;     2025]
+($if ($binds? (get-current-environment) $sequence) #inert
 ($define! $sequence
 	((wrap ($vau (#ignore ($seq2))
 			($seq2
@@ -62,14 +70,16 @@
 						(wrap ($basic-vau (#ignore #ignore)
 							(eval env second)))
 						first)))))
-			$vau)))
+			$vau))))
 
+; $lambda is defined after $vau, so this checks whether the primitives exist
+($if ($binds? (get-current-environment) $lambda) #inert
 ($define! $vau
   ((wrap ($vau (#ignore ($basic-vau))
       ($vau (static (name . body))
         (eval static (list $basic-vau name (cons $sequence body))))))
-    $vau))
-($define! get-current-environment (wrap ($vau (env ()) env)))
+    $vau)))
+($if ($binds? (get-current-environment) $lambda) #inert
 ($define! $lambda
 	($vau (static (name . body))
 		(wrap (eval static
@@ -77,15 +87,17 @@
 				$vau
 			(cons
 				(list #ignore name)
-				body))))))
+				body)))))))
 ($define! make-standard-environment ($lambda () (get-current-environment)))
 ($define! null? ($lambda (item) (eq? () item)))
+($if ($binds? (get-current-environment) $cond) #inert
 ($define! $cond
 	($vau (env ((cond . exprs) . rest))
 		($if (eval env cond)
 			(eval env (cons $sequence exprs))
-			(eval env (cons $cond rest)))))
+			(eval env (cons $cond rest))))))
 ($define! not? ($lambda (bool) ($if bool #f #t)))
+($if ($binds? (get-current-environment) $and?) #inert
 ($define! $and? ($vau (env args)
 	($cond
 		((null? args) #t)
@@ -93,7 +105,8 @@
 		(#t
 			(eval env (list $if (car args)
 				(cons $and? (cdr args))
-				#f))))))
+				#f)))))))
+($if ($binds? (get-current-environment) $or?) #inert
 ($define! $or? ($vau (env args)
 	($cond
 		((null? args) #f)
@@ -101,7 +114,8 @@
 		(#t
 			(eval env (list $if (car args)
 				#t
-				(cons $or? (cdr args))))))))
+				(cons $or? (cdr args)))))))))
+($if ($binds? (get-current-environment) apply) #inert
 ($define! apply
 	($lambda (func args . env)
 		(eval
@@ -109,7 +123,7 @@
 				((null? env) (make-environment))
 				((null? (cdr env)) (car env))
 				(#t (error "apply takes two or three arguments")))
-			(cons (unwrap func) args))))
+			(cons (unwrap func) args)))))
 ($define! list-tail
 	($lambda (object offset)
 		($cond
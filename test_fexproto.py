@@ -73,11 +73,305 @@ temp2
     ($and?
         (eq? (eval e (list a1)) 789)
         (eq? (eval e (list a2)) 456))))
+(($lambda ()
+    ($define! f ($lambda () (car (list 1 2))))
+    ($define! a (f))
+    ($define! car cdr)
+    (list a (f))))
+($sequence)
+(($vau (#ignore #ignore) ($define! x 1) (+ x 2)))
+($cond ((eq? 1 2) 0) ((eq? 1 1) 1 2))
+(list ($and?) ($or?) ($and? #t 5) ($or? #f #f) ($and? #f (car ())))
+(apply + (list 1 2))
+($binds? (apply (wrap ($vau (e #ignore) e)) ()) car)
 ''')
 exprs = fx.parse(tokens, filename="\x00test")
 env = fx._make_standard_environment()
-for expr, expected in zip(exprs, [7, 5, 10, "a", None, "a", None, "a", "c", 1, 0, True, True, True, fx.Pair(4, 6), None, fx.Pair(1, fx.Pair(2, fx.Pair(3, ()))), True, fx.Pair(1, ()), True, True, 2, True, b'abc', True, True, True, True, True, True, True, 1, True, True, True, True, True]):
+results = [7, 5, 10, "a", None, "a", None, "a", "c", 1, 0, True, True, True, fx.Pair(4, 6), None, fx.Pair(1, fx.Pair(2, fx.Pair(3, ()))), True, fx.Pair(1, ()), True, True, 2, True, b'abc', True, True, True, True, True, True, True, 1, True, True, True, True, True, fx.Pair(1, fx.Pair(fx.Pair(2, ()), ())), None, 3, 2, fx.Pair(True, fx.Pair(False, fx.Pair(5, fx.Pair(False, fx.Pair(False, ()))))), 3, False]
+for expr, expected in zip(exprs, results):
     actual = fx.f_eval(env, expr)
     if expected is ...:
         continue
     assert actual == expected, f'{actual} != {expected} (expr={expr})'
+
+# Derivations in std.lisp behave the same as the primitive control forms
+derived_env = fx._make_standard_environment(derived=True)
+for expr, expected in zip(exprs, results):
+    actual = fx.f_eval(derived_env, expr)
+    if expected is ...:
+        continue
+    assert actual == expected, f'{actual} != {expected} (expr={expr}, derived)'
+
+# Argument evaluation order is configurable
+order_expr, = fx.parse(fx.tokenize(r'''
+(($lambda (p)
+    (list (set-car! p 1) (set-car! p 2))
+    (car p))
+ (cons 0 0))
+'''), filename="\x00test")
+for order, expected in [("right-to-left", 1), ("shuffle", ...), ("left-to-right", 2)]:
+    fx.set_evaluation_order(order, seed=0)
+    actual = fx.f_eval(env, order_expr)
+    if expected is ...:
+        continue
+    assert actual == expected, f'{actual} != {expected} (order={order})'
+
+# Call frames can store their bindings in LocalMap lists instead of dicts
+fx.set_environment_storage("map")
+for expr, expected in zip(exprs, results):
+    actual = fx.f_eval(env, expr)
+    if expected is ...:
+        continue
+    assert actual == expected, f'{actual} != {expected} (expr={expr}, storage=map)'
+fx.set_environment_storage("dict")
+
+# The standard environment can be saved to and loaded from a snapshot
+import tempfile
+with tempfile.TemporaryDirectory() as directory:
+    for _ in range(2):  # make the snapshot, then load it
+        snapshot_env = fx.Environment({}, fx._load_standard_environment(directory, False))
+        for expr, expected in zip(exprs, results):
+            actual = fx.f_eval(snapshot_env, expr)
+            if expected is ...:
+                continue
+            assert actual == expected, f'{actual} != {expected} (expr={expr}, snapshot)'
+
+# A snapshot is used when asked for even if the standard environment was
+# already evaluated, and callers each get their own child environment
+import os
+fx._make_standard_environment()
+with tempfile.TemporaryDirectory() as directory:
+    first = fx._make_standard_environment(snapshot=directory)
+    second = fx._make_standard_environment(snapshot=directory)
+    assert os.listdir(directory)
+    assert first is not second and first.parent is second.parent
+    fx.f_eval(first, fx.parse(fx.tokenize("($define! car 5)"), filename="\x00test")[0])
+    assert fx.f_eval(second, fx.parse(fx.tokenize("(car (list 1))"), filename="\x00test")[0]) == 1
+
+# Snapshots that can't be written or are from an older fexproto.py are skipped
+with tempfile.TemporaryDirectory() as directory:
+    not_directory = os.path.join(directory, "file")
+    open(not_directory, "w").close()
+    assert fx._load_standard_environment(os.path.join(not_directory, "snapshots"), False).parent is not None
+    with open(fx._snapshot_path(directory, False), "wb") as file:
+        file.write(b"cfexproto\nNoSuchName\n.")  # pickle of a missing global
+    stale_env = fx.Environment({}, fx._load_standard_environment(directory, False))
+    assert fx.f_eval(stale_env, fx.parse(fx.tokenize("(car (list 1))"), filename="\x00test")[0]) == 1
+
+# Long and deeply nested lists are parsed without recursion
+long_list, deep_list = fx.parse(fx.tokenize("(" + "x " * 10000 + ")" + "(" * 10000 + ")" * 10000), filename="\x00test")
+assert fx._get_list_metrics(long_list)[0] == 10000
+for _ in range(9998):
+    deep_list = deep_list.car
+assert deep_list.car == ()
+
+# Objects are written the same way they are read
+written = r'(1 "a\n\"" #\x20 (#t . #inert) 2 . #up<5>)'
+assert fx._f_write_string(fx.parse(fx.tokenize(written), filename="\x00test")[0]) == written
+
+# Long lists are copied without recursion, keeping cycles
+copy_expr, long_copy_expr = fx.parse(fx.tokenize(r'''
+(($lambda (p)
+    (set-cdr! (cdr (cdr p)) p)
+    (($lambda (c) (list (eq? c (cdr (cdr (cdr c)))) (eq? c p))) (copy-es-immutable p)))
+ (list 1 2 3))
+(copy-es-immutable (list ''' + "1 " * 10000 + "))"), filename="\x00test")
+assert fx.f_eval(env, copy_expr) == fx.Pair(True, fx.Pair(False, ()))
+assert fx._get_list_metrics(fx.f_eval(env, long_copy_expr))[0] == 10000
+
+# equal? compares long, shared and cyclic structures without recursion
+equal_expr, = fx.parse(fx.tokenize(r'''
+(($lambda ()
+    ($define! last ($lambda (p) ($if (eq? (cdr p) ()) p (last (cdr p)))))
+    ($define! ring ($lambda items ($sequence (set-cdr! (last items) items) items)))
+    ($define! shared ($lambda (n acc)
+        ($if (eq? n 0) acc (shared (+ n -1) (cons acc acc)))))
+    ($define! long ($lambda (n acc)
+        ($if (eq? n 0) acc (long (+ n -1) (cons n acc)))))
+    (list
+        (equal? (ring 1 2 3) (ring 1 2 3 1 2 3))
+        (equal? (ring 1 2) (ring 1 3))
+        (equal? (shared 100 ()) (shared 100 ()))
+        (equal? (long 10000 ()) (long 10000 ()))
+        (equal? (long 10000 ()) (long 10001 ())))))
+'''), filename="\x00test")
+assert fx.f_eval(env, equal_expr) == fx.Pair(True, fx.Pair(False, fx.Pair(True, fx.Pair(True, fx.Pair(False, ())))))
+
+# Dynamic bindings follow the continuation when it is re-entered
+dynamic_expr, = fx.parse(fx.tokenize(r'''
+(($lambda ()
+    ($define! (bind get) (make-keyed-dynamic-variable))
+    ($define! result (bind 1 ($lambda ()
+        ($define! c (call/cc ($lambda (c) c)))
+        ($if (continuation? c) c (list (car c) (get))))))
+    ($if (continuation? result)
+        (bind 2 ($lambda () ((continuation->applicative result) 5)))
+        result)))
+'''), filename="\x00test")
+assert fx.f_eval(env, dynamic_expr) == fx.Pair(5, fx.Pair(1, ()))
+
+# Characters are shared, and strings convert to and from lists of them
+chars_expr, = fx.parse(fx.tokenize(r'''
+(list
+    (eq? #\a (car (string->list "a")))
+    (list->string (string->list "a\x00b"))
+    (string->list ""))
+'''), filename="\x00test")
+assert fx.f_eval(env, chars_expr) == fx.Pair(True, fx.Pair(b"a\x00b", fx.Pair((), ())))
+
+# Parsed files can be cached, keeping their locations
+with tempfile.TemporaryDirectory() as directory:
+    uncached = fx._parse_file("std.lisp")
+    fx.set_code_cache(directory)
+    for _ in range(2):  # make the cache, then use it
+        cached = fx._parse_file("std.lisp")
+        assert list(map(fx._f_write_string, cached)) == list(map(fx._f_write_string, uncached))
+        assert cached[-1]._location_info == uncached[-1]._location_info
+    # corrupted caches are parsed again
+    import marshal
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), "wb") as file:
+            file.write(fx._CODE_CACHE_MAGIC + marshal.dumps(((), b"not compressed")))
+    cached = fx._parse_file("std.lisp")
+    assert list(map(fx._f_write_string, cached)) == list(map(fx._f_write_string, uncached))
+    fx.set_code_cache(None)
+
+# Required modules are loaded once and shared until they are forgotten
+with tempfile.TemporaryDirectory() as directory:
+    import os
+    with open(os.path.join(directory, "m.lisp"), "w") as file:
+        file.write("($define! x (+ 1 2))\n")
+    module = os.path.join(directory, "m.lisp")
+    require_expr, = fx.parse(fx.tokenize(r'''
+(($lambda (path)
+    ($define! m (require path))
+    (list (eq? m (require path)) (eval m ((unwrap list) . x)) (forget-module path) (eq? m (require path))))
+ "''' + module.replace("\\", "\\\\") + '")'), filename="\x00test")
+    assert fx.f_eval(env, require_expr) == fx.Pair(True, fx.Pair(3, fx.Pair(True, fx.Pair(False, ()))))
+    fx.forget_modules()
+    # modules use the standard environment chosen for the program
+    fx.set_module_stdlib(derived=True)
+    module_env = fx.f_eval(env, fx.parse(fx.tokenize('(require "' + module.replace("\\", "\\\\") + '")'), filename="\x00test")[0])
+    assert module_env.parent is fx._make_standard_environment(derived=True).parent
+    fx.set_module_stdlib()
+    fx.forget_modules()
+for text in ["(require 5)", "(reload-module 5)", "(forget-module 5)"]:
+    try:
+        fx.f_eval(env, fx.parse(fx.tokenize(text), filename="\x00test")[0])
+    except ValueError as e:
+        assert e.args[0].cdr.car.startswith(b"expected string"), e.args[0].cdr.car
+    else:
+        assert False, text
+
+# Fixed arity primitives report calls with the wrong number of arguments
+arity_expr, = fx.parse(fx.tokenize(r'''
+(list (apply cons (list 1 2)) ((unwrap car) (3 4)) (car (cons 5 6)))
+'''), filename="\x00test")
+assert fx.f_eval(env, arity_expr) == fx.Pair(fx.Pair(1, 2), fx.Pair(3, fx.Pair(5, ())))
+for text in ["(car)", "(cons 1 2 3)", "(apply car (list 1 2))"]:
+    try:
+        fx.f_eval(env, fx.parse(fx.tokenize(text), filename="\x00test")[0])
+    except ValueError as e:
+        assert e.args[0].cdr.car.startswith(b"expected "), e.args[0].cdr.car
+    else:
+        assert False, text
+
+# The profiler samples stacks of source locations
+import io
+profiler = fx.Profiler(interval=7)
+profile_expr, = fx.parse(fx.tokenize(r'''
+(($lambda ()
+    ($define! loop ($lambda (n) ($if (eq? n 0) 0 (+ 1 (loop (+ n -1))))))
+    (loop 100)))
+'''), filename="\x00test")
+continuation, value = fx.Continuation(env, fx._step_eval, fx.Continuation.ROOT), profile_expr
+while continuation is not fx.Continuation.ROOT:
+    continuation, value = profiler.step(continuation, value)
+assert value == 100
+stacks = io.StringIO()
+profiler.write_stacks(stacks)
+assert all(line.rpartition(" ")[2].isdigit() for line in stacks.getvalue().splitlines())
+assert "loop test:3;loop test:3" in stacks.getvalue()
+
+# Errors in inlined primitives keep the frame of their own combination
+trace_define, trace_call = fx.parse(fx.tokenize(r'''
+($define! g ($lambda (n) (+ n (car n))))
+(g 1)
+'''), filename="\x00test")
+fx.f_eval(env, trace_define)
+continuation, value = fx.Continuation(env, fx._step_eval, fx.Continuation.ROOT), trace_call
+try:
+    while continuation is not fx.Continuation.ROOT:
+        continuation, value = fx.step_evaluate(continuation, value)
+except AttributeError:
+    pass
+else:
+    assert False, "expected an internal error"
+frames = []
+while continuation is not fx.Continuation.ROOT:
+    if continuation._call_info is not None:
+        frames.append(fx._f_write_string(continuation._call_info[1]))
+    continuation = continuation.parent
+assert "(car n)" in frames, frames
+
+# Lookup caches see new bindings of the name they look up, even after other
+# names are defined
+lookup_env = fx._make_standard_environment()
+lookup_results = [None, 1, None, 1, None, fx.Pair(2, ())]
+lookup_exprs = fx.parse(fx.tokenize(r'''
+($define! f ($lambda () (car (list 1 2))))
+(f)
+($define! other 5)
+(f)
+($define! car cdr)
+(f)
+'''), filename="\x00test")
+for expr, expected in zip(lookup_exprs, lookup_results):
+    actual = fx.f_eval(lookup_env, expr)
+    assert actual == expected, f'{actual} != {expected} (expr={expr})'
+
+# Continuations passed across guarded frames run their entry and exit guards,
+# and continuations passed to an ancestor with no guarded frames in between
+# (such as from within the guarded frames) run none
+guard_exprs = fx.parse(fx.tokenize(r'''
+($define! log (cons () ()))
+($define! record ($lambda (entry) (set-car! log (cons entry (car log)))))
+($define! run
+    ($lambda (body)
+        (set-car! log ())
+        ($define! result
+            (call/cc ($lambda (k)
+                ($define! guarded
+                    (guard-continuation
+                        (list (list k ($lambda (value #ignore) (record "entry") value)))
+                        k
+                        (list (list k ($lambda (value #ignore) (record "exit") value)))))
+                (body k guarded))))
+        (list result (car log))))
+(run ($lambda (k guarded)
+    ((continuation->applicative (extend-continuation guarded ($lambda (x) ((continuation->applicative k) x)))) 1)))
+(run ($lambda (k guarded)
+    ((continuation->applicative (extend-continuation guarded ($lambda (x) x))) 2)))
+(run ($lambda (k guarded)
+    ((continuation->applicative (extend-continuation guarded
+        ($lambda (x) (+ 1 (car (call/cc ($lambda (k2) ((continuation->applicative k2) x))))))))
+     3)))
+'''), filename="\x00test")
+guard_env = fx._make_standard_environment()
+for expr in guard_exprs[:3]:
+    fx.f_eval(guard_env, expr)
+guard_results = ["((1) (\"exit\" \"entry\"))", "(2 (\"entry\"))", "(4 (\"entry\"))"]
+for expr, expected in zip(guard_exprs[3:], guard_results):
+    actual = fx._f_write_string(fx.f_eval(guard_env, expr))
+    assert actual == expected, f'{actual} != {expected} (expr={expr})'
+
+# Simple expressions that allocate make a new object each time they are
+# evaluated
+alloc_exprs = fx.parse(fx.tokenize(r'''
+($define! f ($lambda () (car (cons (cons 1 2) ()))))
+(list (eq? (f) (f)) (equal? (f) (f)))
+'''), filename="\x00test")
+alloc_env = fx._make_standard_environment()
+fx.f_eval(alloc_env, alloc_exprs[0])
+for _ in range(2):  # compiled on first use
+    assert fx.f_eval(alloc_env, alloc_exprs[1]) == fx.Pair(False, fx.Pair(True, ()))